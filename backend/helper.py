@@ -1,6 +1,7 @@
 from django.db import connection
 from django.conf import settings
 import os
+import sys
 import django
 
 # Set up Django settings
@@ -9,12 +10,12 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "traffic_sim.settings")
 # Initialize Django
 django.setup()
 
-def compute_metrics(path_to_queries):
+def compute_metrics(path_to_queries, simulation_id):
     with open(path_to_queries, "r") as file:
         sql_query = file.read()
     
     with connection.cursor() as cursor:
-        cursor.execute(sql_query)
+        cursor.execute(sql_query, [simulation_id])
         result = cursor.fetchall()  # If your query returns results
     
     metrics = {}
@@ -28,6 +29,7 @@ def compute_metrics(path_to_queries):
 
 
 
-path_to_queries = r"queries\compute_AWT_MWT.sql"
-# path_to_queries = "backend\queries\compute_AWT_MWT.sql"
-compute_metrics(path_to_queries)
\ No newline at end of file
+if len(sys.argv) != 2 or not sys.argv[1].isdigit():
+    sys.exit("Usage: python helper.py <simulation_id>")
+path_to_queries = os.path.join(os.path.dirname(os.path.abspath(__file__)), "queries", "compute_AWT_MWT.sql")
+compute_metrics(path_to_queries, int(sys.argv[1]))
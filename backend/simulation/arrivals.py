@@ -0,0 +1,101 @@
+import threading
+
+import numpy as np
+
+from .config import DIRECTIONS, DETERMINISTIC, POISSON
+from .event_log import EventLog, WAREHOUSE
+from .vehicles import draw_fleet
+
+ARRIVAL_CHUNK = 256 # Vehicles and headways drawn at a time for one approach
+
+
+def arrival_stream(junction_config, direction, rng=None, process=DETERMINISTIC, chunk=ARRIVAL_CHUNK):
+    """
+    Endless stream of (arrival time, vehicle) for one approach, times in simulated seconds from the start of the run.
+
+    Headways are 3600 / inbound seconds for deterministic arrivals and exponentially distributed with that mean
+    for Poisson arrivals. The exit of every vehicle is drawn with the probability of its share of the exit flows.
+    Vehicles and headways are drawn chunk at a time with vectorized NumPy operations and only the current chunk
+    is held, so memory stays constant however long the stream is consumed.
+    The stream ends at once if the approach has no traffic.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    if junction_config[direction]["inbound"] <= 0:
+        return
+    headway = 3600 / junction_config[direction]["inbound"]
+    clock, next_id = 0.0, 1
+    while True:
+        fleet = draw_fleet(junction_config, direction, chunk, rng, next_id)
+        if not fleet.size:
+            return # No exit flows, no vehicles
+        if process == POISSON:
+            times = clock + np.cumsum(rng.exponential(headway, fleet.size))
+        else:
+            times = clock + headway * np.arange(1, fleet.size + 1)
+        clock = float(times[-1])
+        next_id += fleet.size
+        for index, arrival_time in enumerate(times.tolist()):
+            yield arrival_time, fleet.vehicle(index)
+
+
+class ArrivalSource:
+    """
+    Lazy counterpart of the VehiclesWarehouse for time-horizon runs.
+
+    Instead of stocking a fixed number of vehicles and stopping as soon as one approach runs dry, every approach
+    draws from its own endless arrival_stream until the engine reaches the horizon, in simulated seconds, so that
+    all approaches are measured over the same window. Vehicles are not kept once they are released.
+    Each approach has its own random stream spawned from the seed, so a seed always gives the same arrivals.
+    """
+
+    def __init__(self, junction_config, horizon, process=DETERMINISTIC, seed=None, chunk=ARRIVAL_CHUNK, event_log=None):
+        self.junction_config = junction_config
+        self.horizon = horizon
+        self.process = process
+        self.event_log = event_log if event_log is not None else EventLog()
+        self.lock = threading.Lock()
+        rngs = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(len(DIRECTIONS))]
+        streams = {d: arrival_stream(junction_config, d, rng, process, chunk) for d, rng in zip(DIRECTIONS, rngs)}
+        self.streams, self.pending = {}, {}
+        for direction, stream in streams.items():
+            first = next(stream, None)
+            if first is not None:
+                self.streams[direction], self.pending[direction] = stream, first
+        self.vehicle_count = 0 # Vehicles released so far
+        self.clock = 0.0 # Arrival time of the latest vehicle released
+        self.event_log.debug(WAREHOUSE, "%s arrivals over %.0f simulated seconds for %s.", process.capitalize(), horizon, ", ".join(self.streams) or "no approach")
+
+    def next_arrival(self, direction):
+        """
+        Release the next (arrival time, vehicle) of an approach.
+        """
+        with self.lock:
+            arrival_time, vehicle = self.pending[direction]
+            self.pending[direction] = next(self.streams[direction])
+            self.vehicle_count += 1
+            self.clock = max(self.clock, arrival_time)
+        return arrival_time, vehicle
+
+    def fraction_released(self):
+        return min(self.clock / self.horizon, 1.0)
+
+    def remaining(self):
+        """
+        Streams never run dry, nothing is waiting in stock.
+        """
+        return {}
+
+    def stocked_directions(self):
+        """
+        Directions that receive traffic.
+        """
+        return list(self.streams)
+
+    def is_empty(self, direction):
+        return False
+
+    def is_one_empty(self):
+        return False
+
+    def is_abs_empty(self):
+        return False
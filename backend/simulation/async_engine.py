@@ -0,0 +1,247 @@
+import asyncio
+import time
+import types
+from collections import deque
+
+from .models import Vehicle
+from .statistics import MetricsAccumulator
+from .event_log import EventLog, ENGINE, LIGHT, ARRIVAL, DEPARTURE, QUEUE
+
+OPPOSITE_DIRECTIONS = {"north": "south", "south": "north", "east": "west", "west": "east"}
+
+
+class StepCpuTracker:
+    '''
+    Adds up the CPU time spent by the coroutines of one simulation.
+    Many simulations share the thread of the event loop, so the thread's CPU time is measured around each step
+    of a coroutine, i.e. between two of its awaits, instead of once per thread like CpuTimeTracker.
+    '''
+    def __init__(self):
+        self.total = 0.0
+
+    async def run(self, coroutine):
+        return await self.steps(coroutine)
+
+    @types.coroutine
+    def steps(self, coroutine):
+        value, error = None, None
+        while True:
+            started_at = time.thread_time()
+            try:
+                future = coroutine.throw(error) if error is not None else coroutine.send(value)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.total += time.thread_time() - started_at
+            try:
+                value, error = (yield future), None
+            except BaseException as e: # Cancellation must reach the coroutine too
+                value, error = None, e
+
+
+class AsyncJunction:
+    """
+    asyncio counterpart of the threaded Junction.
+
+    Arrivals, the traffic light and the dequeuer of every approach are coroutines that sleep on wall time like
+    the Enqueuer, TrafficLight and Dequeuer threads, with the same semantics and the same metrics, but without
+    any thread: a single event loop can run the junctions of dozens of simulations at once.
+    Lanes are plain deques since only the loop's thread touches them, a dequeuer with nothing to do awaits the
+    wake-up event of its direction, and an exit lane is held with an asyncio.Lock while a vehicle crosses.
+    Durations are in wall seconds, time_scale converts them to simulated seconds in the metrics.
+    Like the TrafficLight, a cycle is two phases and north-south is green for green_split of it.
+    """
+
+    def __init__(self, junction_config, vehicle_warehouse, phase_duration=1, crossing_time=0.05, time_scale=1.0, writer=None, event_log=None, green_split=0.5):
+        self.junction_config = junction_config
+        self.vehicle_warehouse = vehicle_warehouse
+        self.phase_duration = phase_duration
+        self.green_split = green_split
+        self.crossing_time = crossing_time
+        self.time_scale = time_scale
+        self.writer = writer # Write-behind persistence of crossed vehicles, if they are stored
+        self.event_log = event_log if event_log is not None else EventLog()
+        self.lane_count = junction_config["numLanes"]
+        self.directions = ["north", "south", "east", "west"]
+
+        self.lanes = {d: [deque() for _ in range(self.lane_count)] for d in self.directions}
+        self.NS_traffic = True
+        self.cpu_tracker = StepCpuTracker()
+        self.accumulator = MetricsAccumulator(self.directions, self.lane_count, start=time.monotonic(), time_scale=time_scale)
+        self.departed = 0
+        self.stocked = []
+        self.error = None
+        # asyncio primitives are bound to the loop that runs the junction, they are created by run()
+        self.stop_event = None
+        self.wakeups = {}
+        self.exit_locks = {}
+
+    def phase_length(self):
+        '''
+        Length of the current phase. A cycle is two phases and north-south is green for green_split of it.
+        '''
+        share = self.green_split if self.NS_traffic else 1 - self.green_split
+        return 2 * self.phase_duration * share
+
+    def is_green(self, direction):
+        if direction == "north" or direction == "south":
+            return self.NS_traffic
+        return not self.NS_traffic
+
+    def notify(self, direction=None):
+        '''
+        Wake up the dequeuer of one direction, or of every direction if none is given.
+        '''
+        for d in ([direction] if direction is not None else self.directions):
+            self.wakeups[d].set()
+
+    async def arrivals(self, direction):
+        if self.vehicle_warehouse.horizon is not None:
+            return await self.stream_arrivals(direction)
+        seconds_per_vehicle = 3600 / self.junction_config[direction]["inbound"]
+        while not self.vehicle_warehouse.is_empty(direction):
+            await asyncio.sleep(seconds_per_vehicle / self.time_scale)
+            vehicle = self.vehicle_warehouse.get_vehicle(direction)
+            vehicle.arrival_time = time.monotonic()
+            self.lanes[direction][vehicle.incoming_lane].append(vehicle)
+            self.accumulator.arrived(direction, vehicle.incoming_lane, vehicle.arrival_time)
+            self.notify(direction)
+            self.event_log.debug(ARRIVAL, "%s traffic, lane %d: a new vehicle going to the %s reached the junction.", direction, vehicle.incoming_lane, vehicle.exit_direction)
+
+        if self.vehicle_warehouse.is_one_empty():
+            self.event_log.info(ENGINE, "No more vehicles in the %s warehouse. Stopping the simulation.", direction)
+            self.stop()
+
+    async def stream_arrivals(self, direction):
+        '''
+        Arrivals of a time-horizon run, each vehicle at its own arrival time counted from the start of the run.
+        '''
+        while True:
+            arrival_time, vehicle = self.vehicle_warehouse.next_arrival(direction)
+            await asyncio.sleep(max(self.accumulator.start + arrival_time / self.time_scale - time.monotonic(), 0))
+            vehicle.arrival_time = time.monotonic()
+            self.lanes[direction][vehicle.incoming_lane].append(vehicle)
+            self.accumulator.arrived(direction, vehicle.incoming_lane, vehicle.arrival_time)
+            self.notify(direction)
+            self.event_log.debug(ARRIVAL, "%s traffic, lane %d: a new vehicle going to the %s reached the junction.", direction, vehicle.incoming_lane, vehicle.exit_direction)
+
+    async def stop_at_horizon(self):
+        await asyncio.sleep(max(self.accumulator.start + self.vehicle_warehouse.horizon / self.time_scale - time.monotonic(), 0))
+        self.event_log.info(ENGINE, "%.0f simulated seconds have elapsed. Stopping the simulation.", self.vehicle_warehouse.horizon)
+        self.stop()
+
+    async def traffic_light(self):
+        while True:
+            await asyncio.sleep(self.phase_length())
+            self.NS_traffic = not self.NS_traffic
+            self.event_log.debug(LIGHT, "north-south green: %s, east-west green: %s", self.NS_traffic, not self.NS_traffic)
+            self.notify() # Phase change, every dequeuer has something new to look at
+
+    async def cross(self, vehicle, lane_index):
+        '''
+        Move a vehicle that left its lane across the junction, holding its exit lane for the crossing time.
+        '''
+        async with self.exit_locks[vehicle.exit_direction][vehicle.exit_lane]:
+            vehicle.departure_time = time.monotonic()
+            self.accumulator.crossed(vehicle.incoming_direction, lane_index, vehicle.waiting_time)
+            self.departed += 1
+            if self.writer is not None:
+                self.writer.submit(vehicle)
+            self.event_log.debug(DEPARTURE, "Vehicle %d from %s exited to %s, waited for %.2fs", vehicle.id, vehicle.incoming_direction, vehicle.exit_direction, vehicle.waiting_time * self.time_scale)
+            await asyncio.sleep(self.crossing_time)
+
+    async def dequeue(self, direction):
+        lanes = self.lanes[direction]
+        while not self.stop_event.is_set():
+            # Notifications sent from now on, even while vehicles cross, make the wait below return at once
+            self.wakeups[direction].clear()
+            moved = False
+
+            for index, lane in enumerate(lanes):
+                if not lane:
+                    continue
+                if not self.is_green(direction):
+                    self.event_log.debug(QUEUE, "%s traffic light is red, current queue lengths: %s", direction, [len(lane) for lane in lanes])
+                    break
+
+                vehicle = lane[0]
+                if vehicle.turn == Vehicle.TURNING_RIGHT:
+                    # Straight-going vehicles from the opposite direction have the right of way,
+                    # the right-turning vehicle is skipped for this pass over the lanes
+                    opp_dir = OPPOSITE_DIRECTIONS[direction]
+                    straight_going_vehicles = []
+                    for opp_index, opp_lane in enumerate(self.lanes[opp_dir]):
+                        if opp_lane and opp_lane[0].turn == Vehicle.GOING_STRAIGHT and self.is_green(opp_dir):
+                            straight_going_vehicles.append((opp_index, opp_lane.popleft()))
+                            self.accumulator.left_queue(opp_dir, opp_index, time.monotonic())
+                    for opp_index, opp_vehicle in straight_going_vehicles:
+                        await self.cross(opp_vehicle, opp_index)
+                    if straight_going_vehicles:
+                        moved = True
+                        continue
+
+                lane.popleft()
+                self.accumulator.left_queue(direction, index, time.monotonic())
+                await self.cross(vehicle, index)
+                moved = True
+
+            # Nothing could cross: sleep until a vehicle arrives, the lights change or the simulation stops
+            if not moved:
+                await self.wakeups[direction].wait()
+
+    def on_done(self, task):
+        if not task.cancelled() and task.exception() is not None and self.error is None:
+            self.error = task.exception()
+            self.stop()
+
+    async def run(self):
+        """
+        Run the junction until one approach runs out of vehicles, or until the horizon of a time-horizon run,
+        and return the per-direction metrics in the same shape as the threaded run.
+        """
+        # Engines run by run_concurrently are all built before the loop starts, their clock starts now
+        self.accumulator.restart(time.monotonic())
+        self.stop_event = asyncio.Event()
+        self.wakeups = {d: asyncio.Event() for d in self.directions}
+        self.exit_locks = {d: [asyncio.Lock() for _ in range(self.lane_count)] for d in self.directions}
+        self.stocked = self.vehicle_warehouse.stocked_directions()
+
+        coroutines = [self.arrivals(d) for d in self.stocked if self.junction_config[d]["inbound"] > 0]
+        if not coroutines:
+            self.stop()
+        if self.vehicle_warehouse.horizon is not None:
+            coroutines.append(self.stop_at_horizon())
+        coroutines += [self.traffic_light()] + [self.dequeue(d) for d in self.directions]
+        tasks = [asyncio.create_task(self.cpu_tracker.run(coroutine)) for coroutine in coroutines]
+        for task in tasks:
+            task.add_done_callback(self.on_done)
+        self.event_log.debug(ENGINE, "%d coroutines for the arrivals, the traffic light and the dequeuers have started.", len(tasks))
+
+        try:
+            await self.stop_event.wait()
+            ended_at = time.monotonic()
+            if self.vehicle_warehouse.horizon is not None:
+                # Every approach is measured over the same window, however late the loop got to the stop
+                ended_at = min(ended_at, self.accumulator.start + self.vehicle_warehouse.horizon / self.time_scale)
+        finally:
+            self.stop()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if self.error is not None:
+            raise self.error
+        return self.accumulator.metrics(self.stocked, ended_at)
+
+    def queue_depths(self):
+        '''
+        Vehicles currently waiting in each incoming lane, per direction.
+        '''
+        return {d: [len(lane) for lane in lanes] for d, lanes in self.lanes.items()}
+
+    def light_phase(self):
+        return "north-south" if self.NS_traffic else "east-west"
+
+    def stop(self):
+        if self.stop_event is not None:
+            self.stop_event.set()
+            self.notify()
@@ -0,0 +1,133 @@
+import json
+import time
+
+from celery import group
+from django.db import transaction
+from django.db.models import Count
+
+from . import monitoring
+from .cache import get_cached_results
+from .config import canonicalize_junction_config, config_hash, parse_seed
+from .models import Simulation, SimulationBatch
+from .tasks import run_simulation
+from .timing import PhaseTimer
+
+MAX_BATCH_SIZE = 1000 # Most simulations a single batch request may create
+INSERT_BATCH_SIZE = 500 # Rows per INSERT, well below the query parameter limit of SQLite
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl")
+FINAL_STATUSES = ("completed", "failed")
+
+
+def parse_entry(entry, default_seed):
+    """
+    The canonical (junction_config, seed) of one batch entry, either a junction config or
+    {"junction_config": {...}, "seed": 7}. Raises ValueError if it is invalid.
+    """
+    if isinstance(entry, dict) and "junction_config" in entry:
+        seed = entry.get("seed")
+        return canonicalize_junction_config(entry["junction_config"]), default_seed if seed is None else parse_seed(seed)
+    return canonicalize_junction_config(entry), default_seed
+
+
+def parse_batch(stream, ndjson=False, default_seed=None):
+    """
+    The entries of a batch request, read from a file-like body holding a JSON array or, with ndjson, one JSON
+    entry per line, which is parsed line by line as the body arrives.
+    Raises ValueError naming the first invalid entry, so that nothing is created from a partly invalid batch.
+    """
+    default_seed = parse_seed(default_seed)
+    if ndjson:
+        entries = (json.loads(line) for line in stream if line.strip())
+    else:
+        try:
+            entries = json.load(stream)
+        except ValueError:
+            raise ValueError("Invalid JSON format, expected an array of junction configurations")
+        if not isinstance(entries, list):
+            raise ValueError("Expected an array of junction configurations")
+
+    parsed = []
+    try:
+        for index, entry in enumerate(entries):
+            if index == MAX_BATCH_SIZE:
+                raise ValueError(f"A batch holds at most {MAX_BATCH_SIZE} simulations")
+            try:
+                parsed.append(parse_entry(entry, default_seed))
+            except ValueError as e:
+                raise ValueError(f"Entry {index}: {e}")
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Entry {len(parsed)}: invalid JSON, {e}")
+    if not parsed:
+        raise ValueError("The batch is empty")
+    return parsed
+
+
+def create_batch(entries):
+    """
+    Create a batch and its simulations with batched inserts.
+    Entries already simulated with the same seed are completed at once from the result cache, looked up in a
+    single query; the others are created running. Returns the batch and its simulations in request order.
+    """
+    timer = PhaseTimer()
+    keys = [(config_hash(junction_config), seed) for junction_config, seed in entries]
+    with timer.phase("cache_lookup"):
+        cached = get_cached_results(keys)
+    timings = timer.as_dict()
+
+    simulations = []
+    for (junction_config, seed), key in zip(entries, keys):
+        simulation = Simulation(simulation_status="running", junction_config=junction_config, seed=seed)
+        entry = cached.get(key)
+        if entry is not None:
+            simulation.metrics = entry.metrics
+            simulation.efficiency_score = entry.efficiency_score
+            simulation.run_stats = {**(entry.run_stats or {}), "cache_hit": True}
+            simulation.timings = timings
+            simulation.simulation_status = "completed"
+        simulations.append(simulation)
+
+    with transaction.atomic():
+        batch = SimulationBatch.objects.create(size=len(simulations))
+        for simulation in simulations:
+            simulation.batch = batch
+        Simulation.objects.bulk_create(simulations, batch_size=INSERT_BATCH_SIZE)
+
+    hits = sum(simulation.simulation_status == "completed" for simulation in simulations)
+    if hits:
+        monitoring.count_simulations("cached", hits)
+    return batch, simulations
+
+
+def dispatch_batch(simulation_ids):
+    """
+    Queue the runs of a batch as one Celery group, sent to the broker in a single submission.
+    Returns the id of the group, None if there is nothing to run.
+    """
+    if not simulation_ids:
+        return None
+    enqueued_at = time.time()
+    result = group(run_simulation.s(simulation_id, enqueued_at=enqueued_at) for simulation_id in simulation_ids).apply_async()
+    monitoring.count_simulations("queued", len(simulation_ids))
+    return result.id
+
+
+def batch_status(batch):
+    """
+    Progress of a whole batch: the number of simulations in each status, read with one aggregate query,
+    and the status and efficiency score of each simulation.
+    """
+    counts = {
+        row["simulation_status"]: row["count"]
+        for row in batch.simulations.order_by().values("simulation_status").annotate(count=Count("pk"))
+    }
+    finished = sum(counts.get(status, 0) for status in FINAL_STATUSES)
+    simulations = list(batch.simulations.order_by("simulation_id").values("simulation_id", "simulation_status", "efficiency_score"))
+    return {
+        "batch_id": batch.batch_id,
+        "batch_status": "completed" if finished >= batch.size else "running",
+        "size": batch.size,
+        "created_at": batch.created_at,
+        "counts": counts,
+        "fraction_done": finished / batch.size if batch.size else 1.0,
+        "simulations": simulations,
+    }
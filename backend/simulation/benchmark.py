@@ -0,0 +1,211 @@
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import time
+
+import numpy as np
+
+try:
+    import resource
+except ImportError: # Not available on Windows, peak RSS is then not reported
+    resource = None
+
+from .models import Simulation
+from .simulation_engine import SimulationEngine, ENGINE_VERSION
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "baseline.json")
+
+# Default benchmark matrix
+LANES = (1, 2, 3, 4, 5)
+LEFT_TURN = (False, True)
+INBOUND = (300, 900, 1800) # Vehicles per hour on every approach, split evenly between its three exits
+VEHICLES = (50, 500, 5000) # Vehicles per approach for an exit flow equal to the inbound flow
+SEED = 0
+TOLERANCE = 0.2 # Relative drop in throughput reported as a regression
+
+
+def benchmark_config(num_lanes, left_turn, inbound):
+    directions = ["north", "east", "south", "west"]
+    config = {d: {"inbound": inbound, **{e: inbound / 3 for e in directions if e != d}} for d in directions}
+    config.update(leftTurn=left_turn, numLanes=num_lanes)
+    return config
+
+
+def case_id(case):
+    return f"lanes={case['numLanes']},leftTurn={int(case['leftTurn'])},inbound={case['inbound']},vehicles={case['vehicles']}"
+
+
+def build_matrix(lanes=LANES, left_turn=LEFT_TURN, inbound=INBOUND, vehicles=VEHICLES):
+    return [
+        {"numLanes": n, "leftTurn": l, "inbound": i, "vehicles": v}
+        for n, l, i, v in itertools.product(lanes, left_turn, inbound, vehicles)
+    ]
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak # Bytes on macOS, kilobytes elsewhere
+
+
+def measure_case(case, mode, repeat):
+    """
+    Time vehicle generation, the run and the metric computation of one case, repeat times.
+    The median of each timing is reported, together with the peak RSS of the process.
+    """
+    config = benchmark_config(case["numLanes"], case["leftTurn"], case["inbound"])
+    rss_before = peak_rss_kb()
+    generation, runs, cpu, metrics = [], [], [], []
+    vehicles = crossed = 0
+
+    for _ in range(repeat):
+        simulation = Simulation(simulation_status="running", junction_config=config)
+
+        started_at = time.perf_counter()
+        engine = SimulationEngine(simulation, mode=mode, seed=SEED, num_vehicle=case["vehicles"])
+        generation.append(time.perf_counter() - started_at)
+
+        started_at, cpu_started_at = time.perf_counter(), time.process_time()
+        engine.start()
+        runs.append(time.perf_counter() - started_at)
+        cpu.append(time.process_time() - cpu_started_at)
+
+        # Metrics are computed at the end of start() too, time them on their own
+        started_at = time.perf_counter()
+        if mode == SimulationEngine.EVENT_DRIVEN:
+            SimulationEngine.calculate_efficiency_score(engine.junction.compute_metrics())
+        else:
+            SimulationEngine.calculate_efficiency_score(engine.junction.accumulator.metrics(engine.vehicle_warehouse.stocked_directions(), time.monotonic()))
+        metrics.append(time.perf_counter() - started_at)
+
+        vehicles = engine.vehicle_warehouse.vehicle_count
+        crossed = sum(stats.count for waits in engine.junction.accumulator.waits.values() for stats in waits)
+
+    wall_time = statistics.median(runs)
+    rss_after = peak_rss_kb()
+    return {
+        **case,
+        "id": case_id(case),
+        "vehicles_generated": vehicles,
+        "vehicles_crossed": crossed,
+        "generation_time": statistics.median(generation),
+        "wall_time": wall_time,
+        "cpu_time": statistics.median(cpu),
+        "metrics_time": statistics.median(metrics),
+        "vehicles_per_sec": crossed / wall_time if wall_time > 0 else None,
+        "peak_rss_kb": rss_after,
+        "rss_growth_kb": rss_after - rss_before if rss_after is not None else None,
+    }
+
+
+def _measure_in_child(connection, case, mode, repeat):
+    try:
+        connection.send(measure_case(case, mode, repeat))
+    except Exception as e:
+        connection.send({**case, "id": case_id(case), "error": str(e)})
+    finally:
+        connection.close()
+
+
+def run_case(case, mode, repeat):
+    """
+    Measure a case in a forked child process so that its peak RSS is not hidden by earlier, larger
+    cases. Platforms without fork measure in this process.
+    """
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return measure_case(case, mode, repeat)
+
+    context = multiprocessing.get_context("fork")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_measure_in_child, args=(sender, case, mode, repeat))
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = {**case, "id": case_id(case), "error": f"Benchmark process exited with code {process.exitcode}"}
+    process.join()
+    return result
+
+
+def run_benchmark(matrix=None, mode=SimulationEngine.EVENT_DRIVEN, repeat=3, progress=None):
+    """
+    Run every case of the matrix and return a JSON-serializable report.
+    Args:
+        matrix (list): Cases from build_matrix, the default matrix if None.
+        mode (str): Engine mode to benchmark.
+        repeat (int): Runs per case, timings are medians.
+        progress (callable): Called with each case result as it completes.
+    """
+    matrix = matrix if matrix is not None else build_matrix()
+    started_at = time.perf_counter()
+    cases = []
+    for case in matrix:
+        result = run_case(case, mode, repeat)
+        cases.append(result)
+        if progress is not None:
+            progress(result)
+
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "engine_version": ENGINE_VERSION,
+        },
+        "mode": mode,
+        "repeat": repeat,
+        "seed": SEED,
+        "total_time": time.perf_counter() - started_at,
+        "cases": cases,
+    }
+
+
+def compare(report, baseline, tolerance=TOLERANCE):
+    """
+    Compare the throughput of every case with the baseline.
+    Raises ValueError if the baseline was recorded in another mode, whose throughput can't be compared.
+    Returns:
+        dict: Per-case ratio of current to baseline vehicles/sec, the ids of cases that regressed by more
+        than tolerance, and cases missing from the baseline.
+    """
+    if baseline.get("mode") not in (None, report["mode"]):
+        raise ValueError(f"The baseline was recorded in {baseline['mode']} mode, this run is in {report['mode']} mode")
+    baseline_cases = {case["id"]: case for case in baseline.get("cases", [])}
+    ratios, regressions, missing = {}, [], []
+    for case in report["cases"]:
+        reference = baseline_cases.get(case["id"])
+        if reference is None or not reference.get("vehicles_per_sec") or case.get("vehicles_per_sec") is None:
+            missing.append(case["id"])
+            continue
+        ratio = case["vehicles_per_sec"] / reference["vehicles_per_sec"]
+        ratios[case["id"]] = ratio
+        if ratio < 1 - tolerance:
+            regressions.append(case["id"])
+    return {
+        "tolerance": tolerance,
+        "baseline_mode": baseline.get("mode"),
+        "geometric_mean_ratio": float(np.exp(np.mean(np.log(list(ratios.values()))))) if ratios else None,
+        "ratios": ratios,
+        "regressions": regressions,
+        "missing": missing,
+    }
+
+
+def load_baseline(path=BASELINE_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_report(report, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
@@ -0,0 +1,95 @@
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import F
+from django.utils import timezone
+
+from .config import config_hash
+from .models import CachedSimulationResult
+from .simulation_engine import ENGINE_VERSION
+
+
+def cache_size():
+    return getattr(settings, "SIMULATION_RESULT_CACHE_SIZE", 1000)
+
+
+def result_key(junction_config, seed):
+    """
+    Key of the cached result of a configuration run with a seed by the current engine.
+    Raises ValueError if the configuration cannot be canonicalized.
+    """
+    return {"config_hash": config_hash(junction_config), "seed": seed, "engine_version": ENGINE_VERSION}
+
+
+def get_cached_result(junction_config, seed):
+    """
+    The cached result of a run, or None. A hit marks the entry as recently used.
+    """
+    try:
+        key = result_key(junction_config, seed)
+    except ValueError:
+        return None
+
+    entry = CachedSimulationResult.objects.filter(**key).first()
+    if entry is None:
+        return None
+
+    entry.hits += 1
+    entry.last_used_at = timezone.now()
+    entry.save(update_fields=["hits", "last_used_at"])
+    return entry
+
+
+def get_cached_results(keys):
+    """
+    The cached results of many runs in one query, by (config_hash, seed) key. Hits are marked as recently used.
+    """
+    keys = set(keys)
+    entries = CachedSimulationResult.objects.filter(
+        config_hash__in={config_hash for config_hash, _ in keys}, engine_version=ENGINE_VERSION,
+    )
+    hits = {(entry.config_hash, entry.seed): entry for entry in entries if (entry.config_hash, entry.seed) in keys}
+    if hits:
+        CachedSimulationResult.objects.filter(pk__in=[entry.pk for entry in hits.values()]).update(
+            hits=F("hits") + 1, last_used_at=timezone.now(),
+        )
+    return hits
+
+
+def store_result(junction_config, seed, results):
+    """
+    Cache the results of a run, then evict the least recently used entries beyond the cache size.
+    """
+    try:
+        key = result_key(junction_config, seed)
+    except ValueError:
+        return None
+
+    try:
+        entry, _ = CachedSimulationResult.objects.update_or_create(
+            **key,
+            defaults={
+                "metrics": results.get("metrics", {}),
+                "efficiency_score": results.get("efficiency_score"),
+                "run_stats": results.get("run_stats"),
+                "last_used_at": timezone.now(),
+            },
+        )
+    except IntegrityError:
+        # Another worker stored the same run in the meantime
+        return None
+
+    evict(cache_size())
+    return entry
+
+
+def evict(size):
+    """
+    Keep only the size most recently used entries.
+    """
+    if CachedSimulationResult.objects.count() <= size:
+        return
+    stale = list(
+        CachedSimulationResult.objects.order_by("-last_used_at", "-pk").values_list("pk", flat=True)[size:]
+    )
+    if stale:
+        CachedSimulationResult.objects.filter(pk__in=stale).delete()
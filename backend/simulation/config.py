@@ -0,0 +1,128 @@
+import hashlib
+import json
+
+DIRECTIONS = ("north", "east", "south", "west")
+DEFAULT_LEFT_TURN = False
+DEFAULT_NUM_LANES = 2
+DEFAULT_SEED = 0 # Seed of simulations created without one, so that the same config always gives the same result
+MAX_SEED = 2 ** 63 - 1 # Seeds are stored in a BigIntegerField
+DETERMINISTIC = "deterministic" # One vehicle every 3600 / inbound seconds
+POISSON = "poisson" # Exponential headways with the same mean
+ARRIVAL_PROCESSES = (DETERMINISTIC, POISSON)
+DEFAULT_DURATION = 3600 # Simulated seconds of a time-horizon run that sets no duration
+MAX_DURATION = 7 * 24 * 3600
+
+
+def canonical_number(name, value):
+    """
+    Parse a vehicles per hour value, accepting numeric strings as sent by HTML inputs.
+    Integral values become ints so that 300, 300.0 and "300" hash the same.
+    """
+    if isinstance(value, bool):
+        raise ValueError(f"{name} must be a number")
+    if isinstance(value, str):
+        try:
+            value = float(value.strip())
+        except ValueError:
+            raise ValueError(f"{name} must be a number")
+    if not isinstance(value, (int, float)) or value != value or value in (float("inf"), float("-inf")):
+        raise ValueError(f"{name} must be a number")
+    if value < 0:
+        raise ValueError(f"{name} cannot be negative")
+    return int(value) if float(value).is_integer() else float(value)
+
+
+def canonicalize_junction_config(junction_config):
+    """
+    Return the canonical form of a junction configuration:
+        - every direction is present, in a fixed order, with its inbound flow followed by its exit
+          flows in a fixed order, missing flows being 0,
+        - numbers are normalized (see canonical_number),
+        - leftTurn and numLanes are always set, to their defaults when missing,
+        - arrivals and duration are only set for time-horizon runs (see arrival_settings), both of them as soon
+          as either is given, so that configurations without them keep their hash.
+    Raises ValueError on unknown keys or invalid values, e.g. a U-turn flow or a negative rate.
+    """
+    if not isinstance(junction_config, dict):
+        raise ValueError("The junction configuration must be an object")
+
+    unknown = set(junction_config) - set(DIRECTIONS) - {"leftTurn", "numLanes", "arrivals", "duration"}
+    if unknown:
+        raise ValueError(f"Unknown junction configuration keys: {', '.join(sorted(unknown))}")
+
+    canonical = {}
+    for d in DIRECTIONS:
+        flows = junction_config.get(d, {})
+        if not isinstance(flows, dict):
+            raise ValueError(f"Flows of {d} must be an object")
+        exits = [e for e in DIRECTIONS if e != d]
+        unknown = set(flows) - {"inbound", *exits}
+        if unknown:
+            raise ValueError(f"Unknown flows for {d}: {', '.join(sorted(unknown))}")
+        canonical[d] = {"inbound": canonical_number(f"{d}.inbound", flows.get("inbound", 0))}
+        for e in exits:
+            canonical[d][e] = canonical_number(f"{d}.{e}", flows.get(e, 0))
+
+    left_turn = junction_config.get("leftTurn", DEFAULT_LEFT_TURN)
+    if not isinstance(left_turn, bool):
+        raise ValueError("leftTurn must be true or false")
+    canonical["leftTurn"] = left_turn
+
+    num_lanes = junction_config.get("numLanes", DEFAULT_NUM_LANES)
+    try:
+        num_lanes = canonical_number("numLanes", num_lanes)
+    except ValueError:
+        raise ValueError("numLanes must be a positive integer")
+    if not isinstance(num_lanes, int) or num_lanes < 1:
+        raise ValueError("numLanes must be a positive integer")
+    canonical["numLanes"] = num_lanes
+
+    settings = arrival_settings(junction_config)
+    if settings is not None:
+        canonical["arrivals"], canonical["duration"] = settings
+
+    return canonical
+
+
+def arrival_settings(junction_config):
+    """
+    The (arrival process, duration in simulated seconds) of a time-horizon run, None for a run that stocks a
+    warehouse of vehicles and stops as soon as one approach runs dry.
+    Raises ValueError on an unknown arrival process or an invalid duration.
+    """
+    if "arrivals" not in junction_config and "duration" not in junction_config:
+        return None
+    process = junction_config.get("arrivals", DETERMINISTIC)
+    if process not in ARRIVAL_PROCESSES:
+        raise ValueError(f"arrivals must be one of {', '.join(ARRIVAL_PROCESSES)}")
+    try:
+        duration = canonical_number("duration", junction_config.get("duration", DEFAULT_DURATION))
+    except ValueError:
+        raise ValueError(f"duration must be a number of seconds between 0 and {MAX_DURATION}")
+    if not 0 < duration <= MAX_DURATION:
+        raise ValueError(f"duration must be a number of seconds between 0 and {MAX_DURATION}")
+    return process, duration
+
+
+def parse_seed(value):
+    """
+    Parse a seed given as a query parameter or JSON value, DEFAULT_SEED when there is none.
+    """
+    if value is None or value == "":
+        return DEFAULT_SEED
+    try:
+        seed = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("The seed must be an integer")
+    if isinstance(value, (bool, float)) or not 0 <= seed <= MAX_SEED:
+        raise ValueError(f"The seed must be an integer between 0 and {MAX_SEED}")
+    return seed
+
+
+def config_hash(junction_config):
+    """
+    SHA-256 of the canonical configuration, identical for every spelling of the same configuration.
+    """
+    canonical = canonicalize_junction_config(junction_config)
+    payload = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
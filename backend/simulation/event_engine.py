@@ -0,0 +1,209 @@
+import heapq
+from collections import deque
+
+from .models import Vehicle
+from .statistics import MetricsAccumulator
+
+# Event kinds, ordered so that simultaneous events are handled in a stable order
+ARRIVAL = 0
+LIGHT_SWITCH = 1
+DEPARTURE = 2
+DISPATCH = 3
+
+
+class DiscreteEventJunction:
+    """
+    Discrete-event counterpart of the threaded Junction.
+
+    Instead of sleeping on wall time, every arrival, light phase change and crossing is an
+    event on a heap ordered by a virtual clock measured in simulated seconds. The arrival,
+    light-phase and crossing semantics mirror Enqueuer, TrafficLight and Dequeuer:
+        - each approach receives one vehicle every 3600 / inbound seconds,
+        - the lights start north-south green and swap every phase_duration seconds on average, north-south
+          being green for green_split of each cycle of two phases,
+        - each approach crosses one vehicle at a time, holding the exit lane for crossing_time,
+        - a right-turning vehicle yields to straight-going vehicles at the head of the opposite lanes,
+        - the run stops as soon as one approach has no vehicles left in the warehouse.
+    With an ArrivalSource instead of a warehouse, each approach draws its arrivals from an endless stream and
+    the run stops at the source's horizon instead, so that every approach is measured over the same window.
+    """
+
+    def __init__(self, junction_config, vehicle_warehouse, phase_duration=20, crossing_time=1, green_split=0.5):
+        self.junction_config = junction_config
+        self.vehicle_warehouse = vehicle_warehouse
+        self.horizon = getattr(vehicle_warehouse, "horizon", None)
+        self.phase_duration = phase_duration
+        self.green_split = green_split
+        self.crossing_time = crossing_time
+        self.lane_count = junction_config["numLanes"]
+        self.directions = ["north", "south", "east", "west"]
+
+        self.lanes = {d: [deque() for _ in range(self.lane_count)] for d in self.directions}
+        self.exit_free_at = {d: [0.0] * self.lane_count for d in self.directions}
+        self.next_lane = {d: 0 for d in self.directions}
+        self.server_busy = {d: False for d in self.directions}
+        self.NS_traffic = True
+
+        self.clock = 0.0
+        self.events = []
+        self.sequence = 0
+        self.accumulator = MetricsAccumulator(self.directions, self.lane_count)
+        self.departed = 0
+        self.stocked = []
+        self.stopped = False
+        self.next_vehicles = {} # Vehicle of each approach's scheduled arrival, in time-horizon runs
+
+    @staticmethod
+    def get_opposite_direction(direction):
+        return {"north": "south", "south": "north", "east": "west", "west": "east"}[direction]
+
+    def schedule(self, time, kind, payload=None):
+        heapq.heappush(self.events, (time, self.sequence, kind, payload))
+        self.sequence += 1
+
+    def phase_length(self):
+        '''
+        Length of the current phase. A cycle is two phases and north-south is green for green_split of it.
+        '''
+        share = self.green_split if self.NS_traffic else 1 - self.green_split
+        return 2 * self.phase_duration * share
+
+    def is_green(self, direction):
+        if direction == "north" or direction == "south":
+            return self.NS_traffic
+        return not self.NS_traffic
+
+    def schedule_arrival(self, direction):
+        '''
+        Schedule the next arrival of an approach drawn from the arrival source of a time-horizon run.
+        '''
+        arrival_time, self.next_vehicles[direction] = self.vehicle_warehouse.next_arrival(direction)
+        self.schedule(arrival_time, ARRIVAL, direction)
+
+    def on_arrival(self, direction):
+        if self.horizon is not None:
+            vehicle = self.next_vehicles.pop(direction)
+        else:
+            vehicle = self.vehicle_warehouse.get_vehicle(direction)
+        vehicle.arrival_time = self.clock
+        self.lanes[direction][vehicle.incoming_lane].append(vehicle)
+        self.accumulator.arrived(direction, vehicle.incoming_lane, self.clock)
+
+        if self.horizon is not None:
+            self.schedule_arrival(direction)
+        elif self.vehicle_warehouse.is_empty(direction):
+            # Enqueuer stops the whole simulation as soon as one approach runs dry
+            self.stopped = True
+            return
+        else:
+            self.schedule(self.clock + 3600 / self.junction_config[direction]["inbound"], ARRIVAL, direction)
+
+        if self.is_green(direction) and not self.server_busy[direction]:
+            self.schedule(self.clock, DISPATCH, direction)
+
+    def on_light_switch(self):
+        self.NS_traffic = not self.NS_traffic
+        for direction in self.directions:
+            if self.is_green(direction) and not self.server_busy[direction]:
+                self.schedule(self.clock, DISPATCH, direction)
+        self.schedule(self.clock + self.phase_length(), LIGHT_SWITCH)
+
+    def cross(self, vehicle, start):
+        """
+        Reserve the exit lane for a vehicle that just left its lane and schedule its departure.
+        Returns the time at which the crossing is over.
+        """
+        self.accumulator.left_queue(vehicle.incoming_direction, vehicle.incoming_lane, self.clock)
+        exit_dir = vehicle.exit_direction
+        exit_lane = vehicle.exit_lane
+        departure = max(start, self.exit_free_at[exit_dir][exit_lane])
+        self.exit_free_at[exit_dir][exit_lane] = departure + self.crossing_time
+        self.schedule(departure, DEPARTURE, vehicle)
+        return departure + self.crossing_time
+
+    def on_dispatch(self, direction):
+        self.server_busy[direction] = False
+        if not self.is_green(direction):
+            return
+
+        lanes = self.lanes[direction]
+        for offset in range(self.lane_count):
+            index = (self.next_lane[direction] + offset) % self.lane_count
+            lane = lanes[index]
+            if not lane:
+                continue
+
+            self.next_lane[direction] = (index + 1) % self.lane_count
+            vehicle = lane[0]
+            free_at = self.clock
+            yielded = False
+
+            if vehicle.turn == Vehicle.TURNING_RIGHT:
+                # Straight-going vehicles from the opposite direction have the right of way,
+                # the right-turning vehicle is skipped for this pass over the lanes
+                opp_dir = self.get_opposite_direction(direction)
+                for opp_lane in self.lanes[opp_dir]:
+                    if opp_lane and self.is_green(opp_dir) and opp_lane[0].turn == Vehicle.GOING_STRAIGHT:
+                        free_at = self.cross(opp_lane.popleft(), free_at)
+                        yielded = True
+
+            if not yielded:
+                free_at = self.cross(lane.popleft(), free_at)
+
+            self.server_busy[direction] = True
+            self.schedule(free_at, DISPATCH, direction)
+            return
+
+    def on_departure(self, vehicle):
+        vehicle.departure_time = self.clock
+        self.accumulator.crossed(vehicle.incoming_direction, vehicle.incoming_lane, vehicle.waiting_time)
+        self.departed += 1
+
+    def run(self):
+        """
+        Process events until one approach runs out of vehicles, or up to the horizon of a time-horizon run,
+        and return the per-direction metrics in the same shape as SimulationEngine.start.
+        """
+        self.stocked = self.vehicle_warehouse.stocked_directions()
+        for direction in self.stocked:
+            if self.horizon is not None:
+                self.schedule_arrival(direction)
+            elif self.junction_config[direction]["inbound"] > 0:
+                self.schedule(3600 / self.junction_config[direction]["inbound"], ARRIVAL, direction)
+        if not self.events:
+            return self.compute_metrics()
+        self.schedule(self.phase_length(), LIGHT_SWITCH)
+
+        handlers = {
+            ARRIVAL: self.on_arrival,
+            DISPATCH: self.on_dispatch,
+            DEPARTURE: self.on_departure,
+        }
+        while self.events and not self.stopped:
+            if self.horizon is not None and self.events[0][0] > self.horizon:
+                break
+            self.clock, _, kind, payload = heapq.heappop(self.events)
+            if kind == LIGHT_SWITCH:
+                self.on_light_switch()
+            else:
+                handlers[kind](payload)
+
+        if self.horizon is not None:
+            # Every approach is measured up to the horizon, whenever its last event happened
+            self.clock = self.horizon
+        return self.compute_metrics()
+
+    def queue_depths(self):
+        '''
+        Vehicles currently waiting in each incoming lane, per direction.
+        '''
+        return {d: [len(lane) for lane in lanes] for d, lanes in self.lanes.items()}
+
+    def light_phase(self):
+        return "north-south" if self.NS_traffic else "east-west"
+
+    def compute_metrics(self):
+        '''
+        Metrics of every direction that had vehicles in the warehouse, read from the streaming accumulator.
+        '''
+        return self.accumulator.metrics(self.stocked, self.clock)
@@ -0,0 +1,156 @@
+import collections
+import queue
+import sys
+import threading
+import time
+
+from django.conf import settings
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+LEVELS = {name: level for level, name in LEVEL_NAMES.items()}
+
+# Categories used by the engine
+ENGINE = "engine"
+LIGHT = "light"
+ARRIVAL = "arrival"
+DEPARTURE = "departure"
+QUEUE = "queue"
+WAREHOUSE = "warehouse"
+PERSISTENCE = "persistence"
+
+DEFAULTS = {
+    "level": "INFO", # Events below this level are dropped before anything is formatted
+    "capacity": 1000, # Events kept in each simulation's ring buffer
+    "file": None, # Path of a file that also receives every event, "-" for stdout, None for no output
+}
+
+
+def parse_level(level):
+    if isinstance(level, int):
+        return level
+    try:
+        return LEVELS[str(level).upper()]
+    except KeyError:
+        raise ValueError(f"Unknown event level {level}")
+
+
+def format_record(record):
+    timestamp, level, category, message, args = record
+    return {
+        "time": timestamp,
+        "level": LEVEL_NAMES.get(level, str(level)),
+        "category": category,
+        "message": message % args if args else message,
+    }
+
+
+class FileSink:
+    """
+    Writes events to a file or stdout from a background thread, so that logging never waits on I/O.
+    Events are dropped, and counted, when the thread falls more than queue_size events behind.
+    """
+
+    def __init__(self, path, queue_size=10000):
+        self.path = path
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.thread = threading.Thread(target=self.run, name="event-log-sink", daemon=True)
+        self.thread.start()
+
+    def emit(self, simulation_id, record):
+        try:
+            self.queue.put_nowait((simulation_id, record))
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        stream = sys.stdout if self.path == "-" else open(self.path, "a", buffering=1)
+        while True:
+            simulation_id, record = self.queue.get()
+            event = format_record(record)
+            timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(event["time"]))
+            stream.write(f"[{timestamp} simulation {simulation_id} {event['level']} {event['category']}] {event['message']}\n")
+
+
+_sinks = {}
+_sinks_lock = threading.Lock()
+
+
+def get_sink(path):
+    """
+    One sink per path and process, shared by every simulation.
+    """
+    if not path:
+        return None
+    with _sinks_lock:
+        if path not in _sinks:
+            _sinks[path] = FileSink(path)
+        return _sinks[path]
+
+
+def log_settings():
+    return {**DEFAULTS, **getattr(settings, "SIMULATION_EVENT_LOG", {})}
+
+
+class EventLog:
+    """
+    Structured event log of one simulation.
+
+    Events have a level, a category and a printf-style message whose arguments are only formatted
+    when the events are read, so an event below the log level costs a single comparison and an
+    enabled one an append to a ring buffer that keeps the most recent capacity events. Appending
+    to a bounded deque is thread-safe, so the engine's threads share one log without a lock.
+    """
+
+    def __init__(self, simulation_id=None, level=None, capacity=None, path=None):
+        options = log_settings()
+        self.simulation_id = simulation_id
+        self.level = parse_level(level if level is not None else options["level"])
+        self.buffer = collections.deque(maxlen=capacity or options["capacity"])
+        self.sink = get_sink(path if path is not None else options["file"])
+
+    def is_enabled_for(self, level):
+        return level >= self.level
+
+    def log(self, level, category, message, *args):
+        if level < self.level:
+            return
+        record = (time.time(), level, category, message, args)
+        self.buffer.append(record)
+        if self.sink is not None:
+            self.sink.emit(self.simulation_id, record)
+
+    def debug(self, category, message, *args):
+        self.log(DEBUG, category, message, *args)
+
+    def info(self, category, message, *args):
+        self.log(INFO, category, message, *args)
+
+    def warning(self, category, message, *args):
+        self.log(WARNING, category, message, *args)
+
+    def error(self, category, message, *args):
+        self.log(ERROR, category, message, *args)
+
+    def records(self, level=None, category=None, limit=None):
+        """
+        The buffered events, oldest first, formatted as dicts and optionally filtered.
+        """
+        events = filter_events([format_record(record) for record in list(self.buffer)], level, category)
+        return events[-limit:] if limit else events
+
+
+def filter_events(events, level=None, category=None):
+    """
+    Keep the formatted events at or above a level and in a category.
+    """
+    if level is not None:
+        minimum = parse_level(level)
+        events = [event for event in events if LEVELS.get(event["level"], 0) >= minimum]
+    if category is not None:
+        events = [event for event in events if event["category"] == category]
+    return events
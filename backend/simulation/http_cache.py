@@ -0,0 +1,60 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+PAYLOAD_CACHE = "simulation_payloads" # Cache alias of the rendered completed-simulation payloads
+
+
+def payload_cache():
+    return caches[PAYLOAD_CACHE if PAYLOAD_CACHE in settings.CACHES else "default"]
+
+
+def payload_key(simulation_id):
+    return f"completed-simulation:{simulation_id}"
+
+
+def render_payload(data, last_modified=None):
+    """
+    Render a JSON payload once, with the validators that let clients revalidate it.
+    """
+    body = json.dumps(data, cls=DjangoJSONEncoder).encode()
+    return {
+        "body": body,
+        "etag": f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+        "last_modified": last_modified.timestamp() if last_modified is not None else None,
+    }
+
+
+def get_payload(simulation_id):
+    return payload_cache().get(payload_key(simulation_id))
+
+
+def store_payload(simulation_id, payload):
+    payload_cache().set(payload_key(simulation_id), payload, timeout=None)
+
+
+def invalidate_payload(simulation_id):
+    payload_cache().delete(payload_key(simulation_id))
+
+
+def conditional_json_response(request, payload):
+    """
+    A 304 Not Modified if the client's If-None-Match or If-Modified-Since still matches the payload,
+    the payload otherwise, with its ETag and Last-Modified so the client can revalidate next time.
+    """
+    last_modified = int(payload["last_modified"]) if payload["last_modified"] is not None else None
+    response = get_conditional_response(request, etag=payload["etag"], last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(payload["body"], content_type="application/json")
+    response["ETag"] = payload["etag"]
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    # Revalidate every time, a deleted simulation must not be served from the browser's cache
+    patch_cache_control(response, no_cache=True)
+    return response
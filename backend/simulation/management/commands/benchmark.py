@@ -0,0 +1,79 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from simulation.benchmark import (
+    BASELINE_PATH, INBOUND, LANES, LEFT_TURN, TOLERANCE, VEHICLES,
+    build_matrix, compare, load_baseline, run_benchmark, save_report,
+)
+from simulation.simulation_engine import SimulationEngine
+
+
+def int_list(value):
+    return [int(v) for v in value.split(",") if v]
+
+
+def bool_list(value):
+    return [v.strip().lower() in ("1", "true", "yes") for v in value.split(",") if v]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the simulation engine over a matrix of lane counts, left-turn lanes, inbound flows and "
+        "vehicle counts, and compare the throughput with the stored baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lanes", type=int_list, default=list(LANES), help="Comma-separated numLanes values")
+        parser.add_argument("--left-turn", type=bool_list, default=list(LEFT_TURN), help="Comma-separated leftTurn values")
+        parser.add_argument("--inbound", type=int_list, default=list(INBOUND), help="Comma-separated inbound flows in vph")
+        parser.add_argument("--vehicles", type=int_list, default=list(VEHICLES), help="Comma-separated vehicles per approach")
+        parser.add_argument("--mode", choices=[SimulationEngine.EVENT_DRIVEN, SimulationEngine.THREADED, SimulationEngine.ASYNC], default=SimulationEngine.EVENT_DRIVEN)
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per case, timings are medians")
+        parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+        parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline report to compare with")
+        parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="Relative throughput drop reported as a regression")
+        parser.add_argument("--update-baseline", action="store_true", help="Store this run as the new baseline")
+        parser.add_argument("--check", action="store_true", help="Exit with an error if any case regressed")
+
+    def handle(self, *args, **options):
+        matrix = build_matrix(options["lanes"], options["left_turn"], options["inbound"], options["vehicles"])
+        if options["repeat"] < 1:
+            raise CommandError("--repeat must be at least 1")
+
+        def progress(case):
+            if "error" in case:
+                self.stderr.write(f"{case['id']}: {case['error']}")
+            else:
+                self.stderr.write(
+                    f"{case['id']}: {case['vehicles_per_sec']:.0f} vehicles/s, wall {case['wall_time'] * 1000:.1f} ms, "
+                    f"cpu {case['cpu_time'] * 1000:.1f} ms, peak RSS {case['peak_rss_kb']} kB"
+                )
+
+        report = run_benchmark(matrix, options["mode"], options["repeat"], progress)
+
+        if options["update_baseline"]:
+            save_report(report, options["baseline"])
+            self.stderr.write(f"Baseline written to {options['baseline']}")
+        elif os.path.exists(options["baseline"]):
+            try:
+                report["comparison"] = compare(report, load_baseline(options["baseline"]), options["tolerance"])
+            except ValueError as e:
+                if options["check"]:
+                    raise CommandError(f"{e}, pass a baseline of the same mode with --baseline")
+                self.stderr.write(self.style.WARNING(f"{e}, the comparison is skipped"))
+        if "comparison" in report:
+            comparison = report["comparison"]
+            if comparison["geometric_mean_ratio"] is not None:
+                self.stderr.write(f"Throughput vs baseline: x{comparison['geometric_mean_ratio']:.2f} (geometric mean)")
+            for case_id in comparison["regressions"]:
+                self.stderr.write(self.style.ERROR(f"Regression: {case_id} at x{comparison['ratios'][case_id]:.2f} of the baseline"))
+
+        if options["output"]:
+            save_report(report, options["output"])
+        else:
+            self.stdout.write(json.dumps(report, indent=2))
+
+        if options["check"] and report.get("comparison", {}).get("regressions"):
+            raise CommandError(f"{len(report['comparison']['regressions'])} benchmark cases regressed")
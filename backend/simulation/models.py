@@ -8,14 +8,89 @@ class Simulation(models.Model):
     max_queue_length = models.IntegerField(blank=True, null=True)
     efficiency_score = models.FloatField(default=0.0)
     metrics = models.JSONField(blank=True, null=True)
+    run_stats = models.JSONField(blank=True, null=True) # Cost of the run, e.g. wall time and CPU time
+    seed = models.BigIntegerField(blank=True, null=True) # Seed of the vehicle generation
+    events = models.JSONField(blank=True, null=True) # Most recent entries of the engine's event log
+    timings = models.JSONField(blank=True, null=True) # Seconds spent in each phase, from the Celery queue to the stored result
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, null=True) # Last save, e.g. completion or deletion, sent as Last-Modified
     junction_config = models.JSONField(blank=False)
     is_deleted = models.BooleanField(default=False)
+    batch = models.ForeignKey("SimulationBatch", on_delete=models.SET_NULL, null=True, blank=True, related_name="simulations")
+
+    class Meta:
+        indexes = [
+            # The history pages through completed, non-deleted simulations by creation time. Only those rows
+            # are indexed, so that each page is a range scan of this index without a sort
+            models.Index(
+                fields=["created_at", "simulation_id"],
+                condition=models.Q(simulation_status="completed", is_deleted=False),
+                name="simulation_history_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"Simulation {self.simulation_id}"
 
 
+class CachedSimulationResult(models.Model):
+    '''
+    Result of a seeded run, keyed by the hash of the canonical junction configuration, the seed and
+    the engine version, so that a configuration that was already simulated completes without a new run.
+    '''
+    config_hash = models.CharField(max_length=64)
+    seed = models.BigIntegerField()
+    engine_version = models.CharField(max_length=50)
+    metrics = models.JSONField()
+    efficiency_score = models.FloatField(blank=True, null=True)
+    run_stats = models.JSONField(blank=True, null=True)
+    hits = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(db_index=True) # Least recently used entries are evicted first
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["config_hash", "seed", "engine_version"], name="unique_cached_result"),
+        ]
+
+    def __str__(self):
+        return f"Cached result {self.config_hash[:12]} seed {self.seed}"
+
+
+class SimulationBatch(models.Model):
+    '''
+    Simulations created and started together by one batch request, so that their progress can be followed at once.
+    '''
+    batch_id = models.AutoField(primary_key=True)
+    size = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Batch {self.batch_id} of {self.size} simulations"
+
+
+class SimulationStudy(models.Model):
+    '''
+    A job made of many simulation runs whose results are only kept in aggregate,
+    e.g. a parameter sweep, the replications of one configuration, a road network or a signal timing search.
+    '''
+    SWEEP = "sweep"
+    REPLICATIONS = "replications"
+    NETWORK = "network"
+    SIGNAL_TIMING = "signal_timing"
+
+    study_id = models.AutoField(primary_key=True)
+    kind = models.CharField(max_length=50, blank=False)
+    study_status = models.CharField(max_length=50, blank=False)
+    parameters = models.JSONField(blank=False) # Request that defines the study
+    results = models.JSONField(blank=True, null=True)
+    run_stats = models.JSONField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.kind.capitalize()} study {self.study_id}"
+
+
 from django.utils import timezone
 
 class Queue(models.Model):
@@ -101,6 +176,7 @@ class Vehicle(models.Model):
 
     #make car id the primary key
     id = models.AutoField(primary_key=True)
+    simulation = models.ForeignKey(Simulation, on_delete=models.CASCADE, null=True, blank=True, related_name="vehicles")
     arrival_time = models.DateTimeField(null=True, blank=True)
     departure_time = models.DateTimeField(null=True, blank=True)
     incoming_direction = models.CharField(max_length=50, blank=False)
@@ -0,0 +1,505 @@
+import atexit
+import bisect
+import json
+import multiprocessing
+import multiprocessing.util
+import os
+import tempfile
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+from django.conf import settings
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+DEFAULTS = {
+    "directory": os.path.join(tempfile.gettempdir(), "traffic_sim_metrics"), # Shared by every process of the host
+    "flush_interval": 1.0, # Seconds between two snapshots of a process's metrics
+}
+STALE_INTERVALS = 5 # Gauges of a process that has not written a snapshot for this many intervals are dropped
+EXPIRED_INTERVALS = 60 # A snapshot this old is folded even if its PID now belongs to another live process
+EXITED_FILE = "metrics-exited.json" # Counters and histograms of the processes that exited, added up
+LOCK_FILE = "metrics.lock"
+LOCK_TIMEOUT = 5
+DURATION_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900)
+THROUGHPUT_BUCKETS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+
+def metrics_settings():
+    return {**DEFAULTS, **getattr(settings, "SIMULATION_METRICS", {})}
+
+
+class CounterChild:
+    """
+    One labelled series of a counter. Incrementing takes a lock that is only ever held for an addition.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def sample(self):
+        return self.value
+
+
+class GaugeChild(CounterChild):
+    def set(self, value):
+        self.value = value
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+
+class HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.reset()
+
+    def reset(self):
+        self.lock = threading.Lock()
+        self.counts = [0] * (len(self.buckets) + 1) # The last bucket is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def sample(self):
+        return {"counts": list(self.counts), "sum": self.sum}
+
+
+class Metric:
+    """
+    A metric family of one process. Series are created on first use of their label values, and
+    callers on hot paths keep the series returned by labels() instead of looking it up every time.
+    """
+
+    def __init__(self, kind, name, help, labelnames=(), buckets=None):
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) if buckets is not None else None
+        self.lock = threading.Lock()
+        self.children = {}
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self.children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects the labels {', '.join(self.labelnames) or 'none'}")
+            with self.lock:
+                child = self.children.setdefault(key, HistogramChild(self.buckets) if self.kind == HISTOGRAM else
+                                                 GaugeChild() if self.kind == GAUGE else CounterChild())
+        return child
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def clear(self):
+        with self.lock:
+            self.children = {}
+
+    def reset(self):
+        self.lock = threading.Lock()
+        for child in self.children.values():
+            child.reset()
+
+    def snapshot(self):
+        return {
+            "kind": self.kind,
+            "help": self.help,
+            "labelnames": list(self.labelnames),
+            "buckets": list(self.buckets) if self.buckets is not None else None,
+            "samples": [[list(key), child.sample()] for key, child in list(self.children.items())],
+        }
+
+
+class Registry:
+    """
+    Metrics of one process, written to its own file of a directory shared by every process of the host.
+
+    Django and every Celery worker periodically replace their file with a snapshot of their metrics,
+    from a background thread, and the metrics endpoint adds the files up. Counters and histograms
+    of processes that exited are kept, folded into a single file so that the directory doesn't grow
+    with every process that ever ran, while gauges describe live state and are only read from
+    processes that wrote a recent snapshot.
+    The process pools of studies don't write snapshots: their workers come and go with every study.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = [] # Called before every snapshot to refresh gauges that read live state
+        self.engines = weakref.WeakSet()
+        self.lock = threading.Lock()
+        self.snapshot_lock = threading.Lock() # Collectors clear and refill gauges, one snapshot at a time
+        self.thread = None
+        self.pid = os.getpid()
+        self.token = f"{self.pid}-{time.time()}" # Tells this process's file from one left by an earlier process with the same PID
+        self.owned = set() # Files this process has written
+
+    def add(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.add(Metric(COUNTER, name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self.add(Metric(GAUGE, name, help, labelnames))
+
+    def histogram(self, name, help, buckets, labelnames=()):
+        return self.add(Metric(HISTOGRAM, name, help, labelnames, buckets))
+
+    def path(self, directory=None):
+        return os.path.join(directory or metrics_settings()["directory"], f"metrics-{os.getpid()}.json")
+
+    def snapshot(self):
+        with self.snapshot_lock:
+            for collector in self.collectors:
+                collector()
+            return {"pid": os.getpid(), "token": self.token, "time": time.time(), "metrics": {name: m.snapshot() for name, m in self.metrics.items()}}
+
+    def flush(self, directory=None):
+        """
+        Replace this process's file with a snapshot of its metrics. Readers never see a partial file.
+        A file left by an exited process that had the same PID is folded first, or its counters would go down.
+        """
+        path = self.path(directory)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if path not in self.owned:
+            previous = read_snapshot(path)
+            if previous is not None and previous.get("token") != self.token:
+                with directory_lock(os.path.dirname(path)):
+                    fold(os.path.dirname(path), [path])
+            self.owned.add(path)
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temporary, path)
+
+    def start(self):
+        """
+        Start the thread that writes this process's snapshots, once per process, except in pool workers.
+        """
+        if multiprocessing.parent_process() is not None:
+            return # A study's pool worker would leave one more file behind, the study reports on its runs
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self.run, args=(metrics_settings()["flush_interval"],), name="metrics-flusher", daemon=True)
+            self.thread.start()
+        # Flush once more on exit, including pool workers which skip atexit handlers
+        atexit.register(self.flush_quietly)
+        multiprocessing.util.Finalize(self, self.flush_quietly, exitpriority=10)
+
+    def run(self, interval):
+        while True:
+            time.sleep(interval)
+            self.flush_quietly()
+
+    def flush_quietly(self):
+        try:
+            self.flush()
+        except OSError:
+            pass # Metrics must never break a simulation, the next flush will try again
+
+    def after_fork(self):
+        # A forked child starts from zero, or its file would count the parent's metrics twice
+        self.lock = threading.Lock()
+        self.snapshot_lock = threading.Lock()
+        self.thread = None
+        self.pid = os.getpid()
+        self.token = f"{self.pid}-{time.time()}"
+        self.owned = set()
+        self.engines = weakref.WeakSet()
+        for metric in self.metrics.values():
+            metric.reset()
+
+
+REGISTRY = Registry()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=REGISTRY.after_fork)
+
+SIMULATIONS = REGISTRY.counter("traffic_sim_simulations_total", "Simulations that reached a state: queued, started, completed, failed or cached.", ("state",))
+SIMULATION_DURATION = REGISTRY.histogram("traffic_sim_simulation_duration_seconds", "Worker time of simulation tasks, from loading the simulation to storing its results.", DURATION_BUCKETS)
+QUEUE_WAIT = REGISTRY.histogram("traffic_sim_simulation_queue_wait_seconds", "Time simulation tasks waited in the Celery queue.", DURATION_BUCKETS)
+VEHICLES_CROSSED = REGISTRY.counter("traffic_sim_vehicles_crossed_total", "Vehicles that crossed the junction.", ("mode",))
+VEHICLES_PER_SECOND = REGISTRY.histogram("traffic_sim_run_vehicles_per_second", "Vehicles crossed per second of wall time by each engine run.", THROUGHPUT_BUCKETS, ("mode",))
+ENGINES_RUNNING = REGISTRY.gauge("traffic_sim_engines_running", "Simulation engines currently running.", ("mode",))
+LANE_QUEUE_DEPTH = REGISTRY.gauge("traffic_sim_lane_queue_depth", "Vehicles waiting in each incoming lane of running simulations.", ("simulation_id", "direction", "lane"))
+WAREHOUSE_REMAINING = REGISTRY.gauge("traffic_sim_warehouse_remaining", "Vehicles left in the warehouse of running simulations.", ("simulation_id", "direction"))
+
+
+def collect_engines():
+    """
+    Read the lane queues and warehouses of the running engines of this process.
+    """
+    engines = list(REGISTRY.engines)
+    for gauge in (ENGINES_RUNNING, LANE_QUEUE_DEPTH, WAREHOUSE_REMAINING):
+        gauge.clear()
+    for engine in engines:
+        ENGINES_RUNNING.labels(engine.mode).inc()
+        simulation_id = engine.simulation.simulation_id
+        if simulation_id is None:
+            continue # Sweep and benchmark runs are not stored, their depths would all share one label
+        for direction, depths in engine.junction.queue_depths().items():
+            for lane, depth in enumerate(depths):
+                LANE_QUEUE_DEPTH.labels(simulation_id, direction, lane).set(depth)
+        for direction, remaining in engine.vehicle_warehouse.remaining().items():
+            WAREHOUSE_REMAINING.labels(simulation_id, direction).set(remaining)
+
+
+REGISTRY.collectors.append(collect_engines)
+
+
+def track(engine):
+    REGISTRY.start()
+    REGISTRY.engines.add(engine)
+
+
+def untrack(engine):
+    REGISTRY.engines.discard(engine)
+
+
+def count_simulations(state, amount=1):
+    """
+    Count simulations that reached a state. Django processes never track an engine, so the first count starts
+    their flusher, or their counts would only reach the directory when the same process serves a scrape.
+    """
+    REGISTRY.start()
+    SIMULATIONS.labels(state).inc(amount)
+
+
+def read_snapshot(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None # Missing, or removed or replaced while reading
+
+
+@contextmanager
+def directory_lock(directory, timeout=LOCK_TIMEOUT):
+    """
+    Hold the lock of a metrics directory, shared by every process of the host. A lock file older than the timeout
+    was left by a process that died while holding it and is broken. Raises TimeoutError if the lock stays busy.
+    """
+    path = os.path.join(directory, LOCK_FILE)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) > timeout:
+                    os.remove(path)
+                    continue
+            except OSError:
+                continue
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"The metrics directory {directory} is locked")
+            time.sleep(0.01)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(path)
+
+
+def process_alive(pid):
+    if os.name != "posix":
+        return False # Staleness alone tells, a live process rewrites its file every interval
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def fold(directory, paths):
+    """
+    Add the counters and histograms of the given snapshots to the file of exited processes and delete them.
+    Gauges are dropped, they only describe live processes. Must be called with the directory lock held.
+    """
+    exited_path = os.path.join(directory, EXITED_FILE)
+    snapshots = [(snapshot, 0) for snapshot in map(read_snapshot, [exited_path, *paths]) if snapshot is not None]
+    families = aggregate(snapshots, now=0, stale_after=-1)
+    exited = {
+        "pid": None,
+        "time": time.time(),
+        "metrics": {name: {**family, "samples": [[list(key), value] for key, value in family["samples"].items()]} for name, family in families.items()},
+    }
+    temporary = f"{exited_path}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(exited, f)
+    os.replace(temporary, exited_path)
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def compact(directory, now=None):
+    """
+    Fold the snapshots of processes that exited, found by their age and their PID. Must be called with the directory lock held.
+    """
+    now = time.time() if now is None else now
+    interval = metrics_settings()["flush_interval"]
+    dead = []
+    for name in os.listdir(directory):
+        if not (name.startswith("metrics-") and name.endswith(".json")) or name == EXITED_FILE:
+            continue
+        path = os.path.join(directory, name)
+        try:
+            age = now - os.path.getmtime(path)
+            pid = int(name[len("metrics-"):-len(".json")])
+        except (OSError, ValueError):
+            continue
+        if pid == os.getpid() or age <= STALE_INTERVALS * interval:
+            continue
+        if age > EXPIRED_INTERVALS * interval or not process_alive(pid):
+            dead.append(path)
+    if dead:
+        fold(directory, dead)
+    return len(dead)
+
+
+def read_snapshots(directory):
+    snapshots = []
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return snapshots
+    for name in names:
+        if not (name.startswith("metrics-") and name.endswith(".json")):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            modified_at = os.path.getmtime(path)
+        except OSError:
+            continue # Removed while listing
+        snapshot = read_snapshot(path)
+        if snapshot is not None:
+            snapshots.append((snapshot, modified_at))
+    return snapshots
+
+
+def aggregate(snapshots, now=None, stale_after=None):
+    """
+    Add up the snapshots of several processes into one family per metric name.
+    Histograms are only merged with histograms that have the same buckets.
+    """
+    now = time.time() if now is None else now
+    if stale_after is None:
+        stale_after = STALE_INTERVALS * metrics_settings()["flush_interval"]
+
+    families = {}
+    for snapshot, modified_at in snapshots:
+        live = now - modified_at <= stale_after
+        for name, metric in snapshot["metrics"].items():
+            if metric["kind"] == GAUGE and not live:
+                continue
+            family = families.setdefault(name, {**metric, "samples": {}})
+            if family["kind"] != metric["kind"] or family["buckets"] != metric["buckets"]:
+                continue
+            for labels, value in metric["samples"]:
+                key = tuple(labels)
+                if metric["kind"] == HISTOGRAM:
+                    total = family["samples"].setdefault(key, {"counts": [0] * len(value["counts"]), "sum": 0.0})
+                    total["counts"] = [a + b for a, b in zip(total["counts"], value["counts"])]
+                    total["sum"] += value["sum"]
+                else:
+                    family["samples"][key] = family["samples"].get(key, 0) + value
+    return families
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{name}="{escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def exposition(families):
+    """
+    Render metric families in the Prometheus text exposition format.
+    """
+    lines = []
+    for name in sorted(families):
+        family = families[name]
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['kind']}")
+        for key, value in sorted(family["samples"].items()):
+            if family["kind"] == HISTOGRAM:
+                cumulative = 0
+                for bound, count in zip([*family["buckets"], float("inf")], value["counts"]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{format_labels(family['labelnames'], key, [('le', format_value(bound))])} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(family['labelnames'], key)} {format_value(value['sum'])}")
+                lines.append(f"{name}_count{format_labels(family['labelnames'], key)} {cumulative}")
+            else:
+                lines.append(f"{name}{format_labels(family['labelnames'], key)} {format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def collect(directory=None):
+    """
+    Flush this process's metrics and add up the files of every process of the host, after folding the files
+    of processes that exited. Folding and reading hold the directory lock, so no file is ever counted twice.
+    """
+    directory = directory or metrics_settings()["directory"]
+    REGISTRY.flush(directory)
+    try:
+        with directory_lock(directory):
+            compact(directory)
+            return aggregate(read_snapshots(directory))
+    except TimeoutError:
+        return aggregate(read_snapshots(directory))
+
+
+def queued_simulations(families):
+    """
+    Simulations handed to Celery that no worker has started yet.
+    """
+    states = families.get(SIMULATIONS.name, {}).get("samples", {})
+    return max(states.get(("queued",), 0) - states.get(("started",), 0), 0)
+
+
+def gauge_family(help, labelnames, samples):
+    """
+    A family of gauges computed at scrape time, in the form used by exposition().
+    """
+    return {"kind": GAUGE, "help": help, "labelnames": list(labelnames), "buckets": None, "samples": samples}
@@ -0,0 +1,430 @@
+import heapq
+import math
+import multiprocessing
+import os
+import queue
+import time
+from collections import deque
+
+import numpy as np
+
+from .config import DIRECTIONS, canonicalize_junction_config, parse_seed
+from .event_engine import DiscreteEventJunction, ARRIVAL, LIGHT_SWITCH, DEPARTURE, DISPATCH
+from .simulation_engine import SimulationEngine, SPEED_FACTOR, TRAFFIC_LIGHT_CYCLE_TIME
+from .statistics import Histogram, RunningStats
+from .sweep import parse_max_workers
+from .vehicles import generate_fleet
+
+LINK_ARRIVAL = 4 # Event kind of a vehicle reaching a junction from an upstream one
+MAX_NETWORK_JUNCTIONS = 100
+MAX_NETWORK_DURATION = 24 * 3600 # Simulated seconds
+DEFAULT_NETWORK_DURATION = 3600
+FLEET_CHUNK = 256 # Vehicles generated at a time for each approach
+CHANNEL_CAPACITY = 4 # Windows of vehicles a partition may send ahead of the partition that receives them
+OPPOSITE_DIRECTIONS = {"north": "south", "south": "north", "east": "west", "west": "east"}
+
+
+def parse_network(data):
+    """
+    Validate a network request and return it in canonical form:
+        {"junctions": {"A": {...}, "B": {...}},
+         "links": [{"from": "A", "exit": "east", "to": "B", "approach": "west", "delay": 30}],
+         "duration": 3600, "cycleTime": 3, "seed": 0}
+    A link carries the vehicles leaving junction "from" by its "exit" to the "approach" of junction "to",
+    which they reach "delay" simulated seconds later. Approaches fed by a link get no traffic of their own,
+    their flows only give the turning proportions of the vehicles coming in.
+    Raises ValueError on an invalid network.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("junctions"), dict) or not data["junctions"]:
+        raise ValueError("Expected at least one junction in junctions")
+    if len(data["junctions"]) > MAX_NETWORK_JUNCTIONS:
+        raise ValueError(f"A network holds at most {MAX_NETWORK_JUNCTIONS} junctions")
+
+    junctions = {}
+    for name, junction_config in data["junctions"].items():
+        try:
+            junctions[str(name)] = canonicalize_junction_config(junction_config)
+        except ValueError as e:
+            raise ValueError(f"Junction {name}: {e}")
+
+    links, exits, approaches = [], set(), set()
+    for index, link in enumerate(data.get("links") or []):
+        try:
+            source, exit, target, approach, delay = (link[key] for key in ("from", "exit", "to", "approach", "delay"))
+        except (KeyError, TypeError):
+            raise ValueError(f"Link {index}: expected from, exit, to, approach and delay")
+        source, target = str(source), str(target)
+        if source not in junctions or target not in junctions:
+            raise ValueError(f"Link {index}: unknown junction")
+        if exit not in DIRECTIONS or approach not in DIRECTIONS:
+            raise ValueError(f"Link {index}: exit and approach must be one of {', '.join(DIRECTIONS)}")
+        if isinstance(delay, bool) or not isinstance(delay, (int, float)) or not delay > 0:
+            raise ValueError(f"Link {index}: the delay must be a positive number of seconds")
+        if (source, exit) in exits or (target, approach) in approaches:
+            raise ValueError(f"Link {index}: an exit or an approach is linked twice")
+        exits.add((source, exit))
+        approaches.add((target, approach))
+        links.append({"from": source, "exit": exit, "to": target, "approach": approach, "delay": float(delay)})
+
+    duration = data.get("duration", DEFAULT_NETWORK_DURATION)
+    cycle_time = data.get("cycleTime", TRAFFIC_LIGHT_CYCLE_TIME)
+    for key, value, limit in (("duration", duration, MAX_NETWORK_DURATION), ("cycleTime", cycle_time, math.inf)):
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 < value <= limit:
+            raise ValueError(f"The {key} must be a positive number of seconds" + (f" up to {limit}" if limit < math.inf else ""))
+
+    network = {"junctions": junctions, "links": links, "duration": duration, "cycleTime": cycle_time, "seed": parse_seed(data.get("seed"))}
+    if data.get("max_workers") is not None:
+        network["max_workers"] = parse_max_workers(data["max_workers"])
+    return network
+
+
+def partition_junctions(names, links, workers):
+    """
+    Split the junctions into at most workers groups of near-equal size. The link graph is walked
+    breadth first, so that neighbouring junctions share a group and few links cross between processes.
+    """
+    neighbours = {name: set() for name in names}
+    for link in links:
+        neighbours[link["from"]].add(link["to"])
+        neighbours[link["to"]].add(link["from"])
+
+    order, seen = [], set()
+    for start in names:
+        if start in seen:
+            continue
+        seen.add(start)
+        pending = deque([start])
+        while pending:
+            name = pending.popleft()
+            order.append(name)
+            for neighbour in sorted(neighbours[name] - seen):
+                seen.add(neighbour)
+                pending.append(neighbour)
+
+    workers = max(1, min(workers, len(order)))
+    size, extra = divmod(len(order), workers)
+    groups, start = [], 0
+    for index in range(workers):
+        end = start + size + (index < extra)
+        groups.append(order[start:end])
+        start = end
+    return groups
+
+
+def window_ends(network):
+    """
+    Times at which the partitions exchange vehicles. A vehicle leaving a junction during a window reaches
+    the next one after the shortest link delay at the earliest, i.e. not before the window is over, so
+    that every partition can run a whole window without hearing from the others.
+    """
+    duration = network["duration"]
+    window = min((link["delay"] for link in network["links"]), default=duration)
+    return [min(k * window, duration) for k in range(1, math.ceil(duration / window) + 1)]
+
+
+class ApproachStock:
+    """
+    Endless supply of vehicles for one approach, generated FLEET_CHUNK at a time with the turning
+    proportions of the configuration. An approach without exit flows sends its vehicles straight on.
+    """
+
+    def __init__(self, junction_config, direction, rng):
+        self.direction = direction
+        self.rng = rng
+        # The exit flows are shares of their own total, an approach fed by a link may have no inbound flow
+        flows = {exit: flow for exit, flow in junction_config[direction].items() if exit != "inbound" and flow > 0}
+        if not flows:
+            flows = {OPPOSITE_DIRECTIONS[direction]: 1}
+        self.junction_config = {**junction_config, direction: {"inbound": sum(flows.values()), **flows}}
+        self.fleet = None
+        self.next_id = 1
+
+    def pop(self):
+        if self.fleet is None or not len(self.fleet):
+            self.fleet = generate_fleet(self.junction_config, self.direction, FLEET_CHUNK, self.rng, self.next_id)
+            self.next_id += self.fleet.size
+        return self.fleet.pop()
+
+
+class NetworkJunction(DiscreteEventJunction):
+    """
+    Discrete-event junction of a network. Approaches that are not fed by a link receive one vehicle every
+    3600 / inbound seconds for as long as the run lasts, approaches fed by a link receive the vehicles
+    of the upstream junction. A vehicle that crosses towards a linked exit is put in the outbox,
+    the others leave the network and their time in the network is recorded.
+    """
+
+    def __init__(self, name, junction_config, rng, exits, fed, phase_duration=20, crossing_time=1):
+        super().__init__(junction_config, None, phase_duration, crossing_time)
+        self.name = name
+        self.exits = exits # Exit direction -> link
+        self.fed = fed # Approaches fed by a link
+        self.stocks = {d: ApproachStock(junction_config, d, rng) for d in self.directions}
+        self.entered_at = {} # Vehicle -> time at which it entered the network
+        self.outbox = []
+        self.sent = 0
+        self.entered = 0
+        self.exited = 0
+        self.link_counts = {exit: 0 for exit in exits}
+        self.travel_times = RunningStats()
+        self.travel_histogram = Histogram()
+        self.handlers = {
+            ARRIVAL: self.on_arrival,
+            DISPATCH: self.on_dispatch,
+            DEPARTURE: self.on_departure,
+            LINK_ARRIVAL: self.on_link_arrival,
+        }
+
+    def sources(self):
+        return [d for d in self.directions if d not in self.fed and self.junction_config[d]["inbound"] > 0]
+
+    def start(self):
+        for direction in self.sources():
+            self.schedule(3600 / self.junction_config[direction]["inbound"], ARRIVAL, direction)
+        self.schedule(self.phase_length(), LIGHT_SWITCH)
+
+    def enter(self, direction, entered_at):
+        vehicle = self.stocks[direction].pop()
+        vehicle.arrival_time = self.clock
+        self.entered_at[vehicle] = entered_at
+        self.lanes[direction][vehicle.incoming_lane].append(vehicle)
+        self.accumulator.arrived(direction, vehicle.incoming_lane, self.clock)
+        if self.is_green(direction) and not self.server_busy[direction]:
+            self.schedule(self.clock, DISPATCH, direction)
+
+    def on_arrival(self, direction):
+        self.entered += 1
+        self.enter(direction, self.clock)
+        self.schedule(self.clock + 3600 / self.junction_config[direction]["inbound"], ARRIVAL, direction)
+
+    def on_link_arrival(self, payload):
+        direction, entered_at = payload
+        self.enter(direction, entered_at)
+
+    def receive(self, approach, arrival_time, entered_at):
+        self.schedule(arrival_time, LINK_ARRIVAL, (approach, entered_at))
+
+    def on_departure(self, vehicle):
+        super().on_departure(vehicle)
+        entered_at = self.entered_at.pop(vehicle)
+        link = self.exits.get(vehicle.exit_direction)
+        if link is None:
+            self.exited += 1
+            self.travel_times.add(self.clock - entered_at)
+            self.travel_histogram.add(self.clock - entered_at)
+            return
+        self.link_counts[vehicle.exit_direction] += 1
+        # Transfers sort by arrival time, then origin, so that they are always handed over in the same order
+        self.outbox.append((self.clock + link["delay"], self.name, self.sent, link["to"], link["approach"], entered_at))
+        self.sent += 1
+
+    def take_outbox(self):
+        outbox, self.outbox = self.outbox, []
+        return outbox
+
+    def run_until(self, end):
+        """
+        Process the events that happen before end.
+        """
+        while self.events and self.events[0][0] < end:
+            self.clock, _, kind, payload = heapq.heappop(self.events)
+            if kind == LIGHT_SWITCH:
+                self.on_light_switch()
+            else:
+                self.handlers[kind](payload)
+
+    def result(self, now):
+        directions = [d for d in self.directions if d in self.fed or d in self.sources()]
+        metrics = self.accumulator.metrics(directions, now)
+        return {
+            "metrics": metrics,
+            "efficiency_score": SimulationEngine.calculate_efficiency_score(metrics) if metrics else None,
+            "vehicles_crossed": self.departed,
+        }
+
+
+class NetworkPartition:
+    """
+    The junctions of a network run by one process, advanced window by window.
+    Every junction has its own random stream derived from the network's seed, and vehicles are always
+    handed over at the end of a window in the same order, so the results do not depend on how the
+    network is partitioned.
+    """
+
+    def __init__(self, network, names):
+        all_names = sorted(network["junctions"])
+        seeds = dict(zip(all_names, np.random.SeedSequence(network["seed"]).spawn(len(all_names))))
+        self.junctions = {}
+        for name in names:
+            exits = {link["exit"]: link for link in network["links"] if link["from"] == name}
+            fed = {link["approach"] for link in network["links"] if link["to"] == name}
+            junction = NetworkJunction(
+                name, network["junctions"][name], np.random.default_rng(seeds[name]), exits, fed,
+                phase_duration=network["cycleTime"] * SPEED_FACTOR,
+            )
+            junction.start()
+            self.junctions[name] = junction
+
+    def advance(self, end):
+        """
+        Run every junction up to end and return the vehicles that left for another junction.
+        """
+        transfers = []
+        for junction in self.junctions.values():
+            junction.run_until(end)
+            transfers.extend(junction.take_outbox())
+        return transfers
+
+    def deliver(self, transfers):
+        for arrival_time, _, _, target, approach, entered_at in sorted(transfers):
+            self.junctions[target].receive(approach, arrival_time, entered_at)
+
+    def result(self, now):
+        travel_times, travel_histogram = RunningStats(), Histogram()
+        for junction in self.junctions.values():
+            travel_times.merge(junction.travel_times)
+            travel_histogram.merge(junction.travel_histogram)
+        return {
+            "junctions": {name: junction.result(now) for name, junction in self.junctions.items()},
+            "entered": sum(junction.entered for junction in self.junctions.values()),
+            "exited": sum(junction.exited for junction in self.junctions.values()),
+            "links": {(name, exit): count for name, junction in self.junctions.items() for exit, count in junction.link_counts.items()},
+            "travel_times": travel_times,
+            "travel_histogram": travel_histogram.to_dict(),
+        }
+
+
+def run_partition(network, groups, index, channels, results):
+    """
+    Run one partition in a worker process. At the end of every window, the vehicles bound for each other
+    partition are sent on its bounded channel, which blocks a partition that runs too far ahead, and the
+    vehicles sent by the other partitions for that window are received before the next one starts.
+    """
+    try:
+        owner = {name: group for group, names in enumerate(groups) for name in names}
+        partition = NetworkPartition(network, groups[index])
+        outgoing = {target: channel for (source, target), channel in channels.items() if source == index}
+        incoming = [channel for (source, target), channel in channels.items() if target == index]
+        sent = 0
+        for end in window_ends(network):
+            local, remote = [], {target: [] for target in outgoing}
+            for transfer in partition.advance(end):
+                target = owner[transfer[3]]
+                (local if target == index else remote[target]).append(transfer)
+            for target, channel in outgoing.items():
+                channel.put(remote[target])
+                sent += len(remote[target])
+            for channel in incoming:
+                local.extend(channel.get())
+            partition.deliver(local)
+        results.put((index, partition.result(network["duration"]), sent))
+    except Exception as e:
+        results.put((index, {"error": f"{type(e).__name__}: {e}"}, 0))
+
+
+def receive_result(results, processes):
+    while True:
+        try:
+            return results.get(timeout=1)
+        except queue.Empty:
+            crashed = [process for process in processes if process.exitcode not in (None, 0)]
+            if crashed:
+                raise RuntimeError(f"A network partition exited with code {crashed[0].exitcode}")
+
+
+def run_partitions(network, groups):
+    """
+    Run each group of junctions in its own process, with a bounded channel for every pair of
+    partitions that a link crosses. Returns the results of the partitions and the vehicles sent across.
+    """
+    context = multiprocessing.get_context()
+    owner = {name: group for group, names in enumerate(groups) for name in names}
+    channels = {}
+    for link in network["links"]:
+        source, target = owner[link["from"]], owner[link["to"]]
+        if source != target and (source, target) not in channels:
+            channels[(source, target)] = context.Queue(maxsize=CHANNEL_CAPACITY)
+    results = context.Queue()
+    processes = [
+        context.Process(target=run_partition, args=(network, groups, index, channels, results), daemon=True)
+        for index in range(len(groups))
+    ]
+    for process in processes:
+        process.start()
+
+    partials, transfers = [None] * len(groups), 0
+    try:
+        for _ in groups:
+            index, partial, sent = receive_result(results, processes)
+            if "error" in partial:
+                raise RuntimeError(f"Network partition {index} failed: {partial['error']}")
+            partials[index] = partial
+            transfers += sent
+    except BaseException:
+        # The other partitions may be blocked on a channel of the failed one
+        for process in processes:
+            process.terminate()
+        raise
+    finally:
+        for process in processes:
+            process.join()
+    return partials, transfers
+
+
+def run_network(network, max_workers=None):
+    """
+    Simulate a road network of linked junctions on discrete-event junctions, partitioned across worker processes.
+    Args:
+        network (dict): Junctions, links and run parameters, see parse_network.
+        max_workers (int): Number of processes, the number of CPU cores by default. With a single worker
+            the network is simulated in this process.
+    Returns:
+        dict: The metrics and efficiency score of every junction, the network-wide metrics (vehicles that entered,
+            left and are still in the network, time spent in the network, vehicles carried by each link) and "run_stats".
+    """
+    network = parse_network(network)
+    started_at = time.perf_counter()
+    names = sorted(network["junctions"])
+    groups = partition_junctions(names, network["links"], max_workers or os.cpu_count() or 1)
+    ends = window_ends(network)
+
+    if len(groups) == 1:
+        partition = NetworkPartition(network, groups[0])
+        for end in ends:
+            partition.deliver(partition.advance(end))
+        partials, transfers = [partition.result(network["duration"])], 0
+    else:
+        partials, transfers = run_partitions(network, groups)
+
+    junctions, travel_times, travel_histogram, link_counts = {}, RunningStats(), Histogram(), {}
+    for partial in partials:
+        junctions.update(partial["junctions"])
+        travel_times.merge(partial["travel_times"])
+        travel_histogram.merge(Histogram.from_dict(partial["travel_histogram"]))
+        link_counts.update(partial["links"])
+    entered = sum(partial["entered"] for partial in partials)
+    exited = sum(partial["exited"] for partial in partials)
+    scores = [junction["efficiency_score"] for junction in junctions.values() if junction["efficiency_score"] is not None]
+
+    return {
+        "junctions": {name: junctions[name] for name in names},
+        "network": {
+            "efficiency_score": round(sum(scores) / len(scores), 1) if scores else None,
+            "vehicles_entered": entered,
+            "vehicles_exited": exited,
+            "vehicles_in_network": entered - exited,
+            "throughput": exited * 3600 / network["duration"], # Vehicles per hour leaving the network
+            "average_travel_time": travel_times.mean if travel_times.count else None,
+            "max_travel_time": travel_times.max,
+            "travel_time_percentiles": travel_histogram.percentiles(),
+            "links": [{**link, "vehicles": link_counts[(link["from"], link["exit"])]} for link in network["links"]],
+        },
+        "run_stats": {
+            "junctions": len(names),
+            "links": len(network["links"]),
+            "workers": len(groups),
+            "windows": len(ends),
+            "vehicles_transferred": transfers, # Vehicles sent between processes
+            "wall_time": time.perf_counter() - started_at,
+        },
+    }
@@ -0,0 +1,75 @@
+import base64
+import json
+from datetime import datetime
+
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+NEWEST = "newest"
+OLDEST = "oldest"
+
+
+def encode_cursor(created_at, pk, order):
+    """
+    Opaque cursor pointing just past the row with this creation time and primary key.
+    """
+    payload = json.dumps({"created_at": created_at.isoformat(), "pk": pk, "order": order}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, order):
+    """
+    Inverse of encode_cursor. Raises ValueError on a malformed cursor or one issued for another order.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        created_at = datetime.fromisoformat(payload["created_at"])
+        pk = int(payload["pk"])
+    except (ValueError, TypeError, KeyError):
+        raise ValueError("Invalid cursor")
+    if payload.get("order") != order:
+        raise ValueError("The cursor was issued for another order")
+    return created_at, pk
+
+
+def parse_page_size(value):
+    if value is None or value == "":
+        return DEFAULT_PAGE_SIZE
+    try:
+        size = int(value)
+    except ValueError:
+        raise ValueError("The limit must be an integer")
+    if not 1 <= size <= MAX_PAGE_SIZE:
+        raise ValueError(f"The limit must be between 1 and {MAX_PAGE_SIZE}")
+    return size
+
+
+def cursor_page(queryset, cursor=None, limit=DEFAULT_PAGE_SIZE, order=NEWEST, time_field="created_at", pk_field="pk"):
+    """
+    One page of a queryset in (time_field, pk_field) order, starting after the cursor.
+
+    The position is expressed as "time_field up to the cursor's time, minus the rows at exactly that
+    time already returned", so that the database walks an index on (..., time_field, pk_field) from the
+    cursor onwards instead of skipping OFFSET rows, and each page costs the same however deep it is.
+    Returns the rows and the cursor of the next page, None on the last page.
+    """
+    if order not in (NEWEST, OLDEST):
+        raise ValueError(f"The order must be {NEWEST} or {OLDEST}")
+    descending = order == NEWEST
+    if cursor:
+        created_at, pk = decode_cursor(cursor, order)
+        if descending:
+            queryset = queryset.filter(**{f"{time_field}__lte": created_at}).exclude(Q(**{time_field: created_at, f"{pk_field}__gte": pk}))
+        else:
+            queryset = queryset.filter(**{f"{time_field}__gte": created_at}).exclude(Q(**{time_field: created_at, f"{pk_field}__lte": pk}))
+    sign = "-" if descending else ""
+    rows = list(queryset.order_by(f"{sign}{time_field}", f"{sign}{pk_field}")[:limit + 1])
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        get = last.get if isinstance(last, dict) else lambda name: getattr(last, name)
+        next_cursor = encode_cursor(get(time_field), get(pk_field), order)
+    return rows, next_cursor
@@ -0,0 +1,150 @@
+import queue
+import threading
+import time
+
+from django.db import connection, transaction
+
+from .models import Vehicle
+
+WRITER_QUEUE_SIZE = 10000 # Vehicles waiting for the writer before submitters spill into the overflow list
+FLUSH_INTERVAL = 0.5 # Longest time in seconds a vehicle waits in the writer's buffer
+_CLOSE = object() # Sentinel telling the writer to flush and stop
+
+
+class VehicleWriter:
+    """
+    Write-behind persistence of vehicles on a single background thread.
+
+    Engine threads hand finished vehicles over with submit(), which never waits on the database:
+    vehicles go into a bounded queue, or into an overflow list if the writer has fallen that far
+    behind. The writer converts them to Vehicle rows and inserts them with batched INSERTs, one
+    transaction per flush, whenever batch_size rows are buffered or flush_interval has passed.
+    Only this thread ever talks to the database, so SQLite's write lock is never taken inside the
+    junction's critical sections.
+    """
+
+    def __init__(self, simulation, wall_origin, clock_origin=0.0, time_scale=1.0, batch_size=500,
+                 flush_interval=FLUSH_INTERVAL, queue_size=WRITER_QUEUE_SIZE):
+        self.simulation = simulation
+        self.wall_origin = wall_origin
+        self.clock_origin = clock_origin
+        self.time_scale = time_scale
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.overflow = []
+        self.overflow_lock = threading.Lock()
+        self.thread = None
+
+        self.overflowed = 0
+        self.flush_sizes = [] # Rows written by each flush
+        self.flush_time = 0.0
+        self.error = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="vehicle-writer", daemon=True)
+        self.thread.start()
+        return self
+
+    def submit(self, vehicle):
+        """
+        Queue a vehicle for insertion without blocking.
+        """
+        try:
+            self.queue.put_nowait(vehicle)
+        except queue.Full:
+            with self.overflow_lock:
+                self.overflow.append(vehicle)
+                self.overflowed += 1
+
+    def submit_many(self, vehicles):
+        for vehicle in vehicles:
+            self.submit(vehicle)
+
+    def write_all(self, vehicles):
+        """
+        Write vehicles on the calling thread with the same batching, for callers that have no
+        threads to keep off the database, such as a finished event-driven run.
+        """
+        buffer = []
+        for vehicle in vehicles:
+            buffer.append(vehicle)
+            if len(buffer) >= self.batch_size:
+                self.flush(buffer)
+        self.flush(buffer)
+        return self.stats()
+
+    def take_overflow(self):
+        with self.overflow_lock:
+            vehicles, self.overflow = self.overflow, []
+        return vehicles
+
+    def flush(self, buffer):
+        if not buffer:
+            return
+        started_at = time.perf_counter()
+        rows = [vehicle.to_model(self.simulation, self.wall_origin, self.clock_origin, self.time_scale) for vehicle in buffer]
+        with transaction.atomic():
+            Vehicle.objects.bulk_create(rows, batch_size=self.batch_size)
+        self.flush_time += time.perf_counter() - started_at
+        self.flush_sizes.append(len(rows))
+        buffer.clear()
+
+    def run(self):
+        buffer = []
+        closing = False
+        deadline = time.monotonic() + self.flush_interval
+        try:
+            while not closing:
+                try:
+                    item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    if item is _CLOSE:
+                        closing = True
+                    else:
+                        buffer.append(item)
+                except queue.Empty:
+                    pass
+
+                if closing or len(buffer) >= self.batch_size or time.monotonic() >= deadline:
+                    # Drain whatever else is ready so that a flush writes as many rows as possible
+                    while len(buffer) < self.batch_size or closing:
+                        try:
+                            item = self.queue.get_nowait()
+                        except queue.Empty:
+                            break
+                        if item is _CLOSE:
+                            closing = True
+                        else:
+                            buffer.append(item)
+                    buffer.extend(self.take_overflow())
+                    self.flush(buffer)
+                    deadline = time.monotonic() + self.flush_interval
+        except Exception as e:
+            self.error = e
+        finally:
+            # The writer's connection belongs to this thread
+            connection.close()
+
+    def close(self, timeout=None):
+        """
+        Flush everything that was submitted, stop the writer and return its statistics.
+        Raises the writer's error if a flush failed.
+        """
+        if self.thread is not None:
+            if self.thread.is_alive():
+                self.queue.put(_CLOSE)
+            self.thread.join(timeout)
+        if self.error is not None:
+            raise self.error
+        return self.stats()
+
+    def stats(self):
+        rows = sum(self.flush_sizes)
+        return {
+            "rows": rows,
+            "flushes": len(self.flush_sizes),
+            "rows_per_flush": rows / len(self.flush_sizes) if self.flush_sizes else 0,
+            "max_rows_per_flush": max(self.flush_sizes, default=0),
+            "overflowed": self.overflowed,
+            "flush_time": self.flush_time,
+        }
@@ -0,0 +1,296 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+FINAL_STATUSES = (COMPLETED, FAILED)
+
+DEFAULTS = {
+    "directory": os.path.join(tempfile.gettempdir(), "traffic_sim_progress"), # Shared by Django and the Celery workers of the host
+    "interval": 0.5, # Shortest time in seconds between two updates of a simulation
+    "heartbeat": 15, # Seconds between keep-alive comments of an idle stream
+    "timeout": 600, # Longest time in seconds a stream stays open
+    "retention": 60, # Seconds the final update of a simulation is kept for late subscribers
+    "max_streams": 32, # Most streams a WSGI process serves at once, each of them holds a worker thread
+}
+
+
+def progress_settings():
+    return {**DEFAULTS, **getattr(settings, "SIMULATION_PROGRESS", {})}
+
+
+def progress_path(simulation_id, directory=None):
+    return os.path.join(directory or progress_settings()["directory"], f"simulation-{simulation_id}.json")
+
+
+def write_progress(simulation_id, progress, directory=None):
+    """
+    Publish the latest progress of a simulation. Readers never see a partial file.
+    """
+    path = progress_path(simulation_id, directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{threading.get_ident()}.tmp"
+    with open(temporary, "w") as f:
+        json.dump({"simulation_id": simulation_id, "time": time.time(), **progress}, f)
+    os.replace(temporary, path)
+
+
+def read_progress(simulation_id, directory=None):
+    try:
+        with open(progress_path(simulation_id, directory)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def prune(directory=None, retention=None):
+    """
+    Remove the final updates of simulations that finished more than retention seconds ago.
+    """
+    options = progress_settings()
+    directory = directory or options["directory"]
+    retention = options["retention"] if retention is None else retention
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            if name.endswith(".json") and time.time() - os.path.getmtime(path) > retention:
+                with open(path) as f:
+                    final = json.load(f).get("status") in FINAL_STATUSES
+                if final:
+                    os.remove(path)
+        except (OSError, ValueError):
+            continue
+
+
+def engine_progress(engine):
+    """
+    Progress of a running engine: the fraction of the warehouse released so far, or of the duration of a
+    time-horizon run, the vehicles that crossed, the vehicles queued in each direction and the light phase.
+    """
+    directions = engine.junction.accumulator.progress()
+    return {
+        "status": RUNNING,
+        "fraction": engine.vehicle_warehouse.fraction_released(),
+        "vehicles_departed": sum(d["vehicles_crossed"] for d in directions.values()),
+        "queue_lengths": {d: progress["queue_length"] for d, progress in directions.items()},
+        "light_phase": engine.junction.light_phase(),
+    }
+
+
+class ProgressReporter:
+    """
+    Publishes the progress of an engine from a background thread, at most once per interval, and
+    its final status once the run is over.
+    """
+
+    def __init__(self, engine, simulation_id, interval=None):
+        self.engine = engine
+        self.simulation_id = simulation_id
+        self.interval = interval if interval is not None else progress_settings()["interval"]
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.publish(engine_progress(self.engine))
+        self.thread = threading.Thread(target=self.run, name="progress-reporter", daemon=True)
+        self.thread.start()
+        return self
+
+    def publish(self, progress):
+        try:
+            write_progress(self.simulation_id, progress)
+        except OSError:
+            pass # Progress is best effort, it must never fail the run
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.publish(engine_progress(self.engine))
+
+    def close(self, status, **details):
+        """
+        Stop reporting and publish the final status with the last progress of the engine.
+        """
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.publish({**engine_progress(self.engine), **details, "status": status})
+        prune()
+
+
+class Subscription:
+    """
+    Mailbox of one stream. Only the latest update is kept, so a slow client skips the updates it
+    missed instead of building a backlog.
+    """
+
+    def __init__(self, simulation_id, loop=None):
+        self.simulation_id = simulation_id
+        self.condition = threading.Condition()
+        self.latest = None
+        self.primed = False # Whether the hub handed the subscription an update yet
+        self.loop = loop # Event loop of an async stream, woken from the hub thread
+        self.ready = asyncio.Event() if loop is not None else None
+
+    def push(self, update):
+        with self.condition:
+            self.latest = update
+            self.condition.notify_all()
+        if self.loop is not None:
+            try:
+                self.loop.call_soon_threadsafe(self.ready.set)
+            except RuntimeError:
+                pass # The loop is closed, the stream is gone
+
+    def get(self, timeout=None):
+        """
+        The update received since the last call, waiting up to timeout for one. None on timeout.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.latest is not None, timeout)
+            update, self.latest = self.latest, None
+            return update
+
+    async def next(self, timeout=None):
+        """
+        Async counterpart of get for streams served from an event loop, waiting without holding a thread.
+        """
+        deadline = None if timeout is None else self.loop.time() + timeout
+        while True:
+            remaining = None if deadline is None else deadline - self.loop.time()
+            if remaining is not None and remaining <= 0:
+                return None
+            try:
+                await asyncio.wait_for(self.ready.wait(), remaining)
+            except asyncio.TimeoutError:
+                return None
+            self.ready.clear()
+            with self.condition:
+                update, self.latest = self.latest, None
+            if update is not None:
+                return update
+
+
+class ProgressHub:
+    """
+    Fans progress updates out to every stream of this process.
+
+    A single thread looks at the progress files of the watched simulations once per interval, only
+    reads the files that changed and hands each update to every subscriber of that simulation, so
+    many clients watching many simulations cost one stat per simulation per interval, and no
+    database query at all. The thread stops when nobody is subscribed.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = {} # Simulation id to its subscriptions
+        self.thread = None
+        self.blocking_streams = 0 # Streams currently holding a worker thread
+
+    def subscribe(self, simulation_id, loop=None):
+        # Runs that never close, killed workers for instance, leave files behind that only a subscriber would notice
+        prune()
+        subscription = Subscription(simulation_id, loop)
+        with self.lock:
+            self.subscriptions.setdefault(simulation_id, []).append(subscription)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="progress-hub", daemon=True)
+                self.thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.simulation_id, [])
+            if subscription in subscriptions:
+                subscriptions.remove(subscription)
+            if not subscriptions:
+                self.subscriptions.pop(subscription.simulation_id, None)
+
+    def reserve_stream(self, limit=None):
+        """
+        Take one of the limited slots of blocking streams. False if they are all taken.
+        """
+        limit = progress_settings()["max_streams"] if limit is None else limit
+        with self.lock:
+            if self.blocking_streams >= limit:
+                return False
+            self.blocking_streams += 1
+            return True
+
+    def release_stream(self):
+        with self.lock:
+            self.blocking_streams -= 1
+
+    def run(self):
+        seen = {} # Simulation id to the version of the last update handed out
+        while True:
+            with self.lock:
+                if not self.subscriptions:
+                    self.thread = None
+                    return
+                watched = {simulation_id: list(subscriptions) for simulation_id, subscriptions in self.subscriptions.items()}
+
+            for simulation_id, subscriptions in watched.items():
+                try:
+                    # Every update replaces the file, so a new inode is a new update even within one mtime tick
+                    stat = os.stat(progress_path(simulation_id))
+                    version = (stat.st_ino, stat.st_mtime_ns)
+                except OSError:
+                    continue # Not started yet
+                # Every subscriber gets a new update, and new subscribers the current one
+                if version != seen.get(simulation_id):
+                    targets = subscriptions
+                else:
+                    targets = [subscription for subscription in subscriptions if not subscription.primed]
+                if not targets:
+                    continue
+                update = read_progress(simulation_id)
+                if update is None:
+                    continue
+                seen[simulation_id] = version
+                for subscription in targets:
+                    subscription.primed = True
+                    subscription.push(update)
+
+            seen = {simulation_id: version for simulation_id, version in seen.items() if simulation_id in watched}
+            time.sleep(progress_settings()["interval"])
+
+
+HUB = ProgressHub()
+
+
+class ReservedStream:
+    """
+    Blocking stream holding a slot of the hub, given back once the response is closed, even if it was never iterated.
+    """
+
+    def __init__(self, events, hub=HUB):
+        self.events = events
+        self.hub = hub
+        self.closed = False
+
+    def __iter__(self):
+        return self.events
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.events.close()
+            self.hub.release_stream()
+
+
+def format_event(event, data):
+    """
+    A server-sent event carrying JSON data.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
@@ -0,0 +1,106 @@
+import time
+
+import numpy as np
+
+from .models import Simulation
+from .simulation_engine import SimulationEngine, TRAFFIC_LIGHT_CYCLE_TIME
+from .statistics import Histogram, RunningStats
+from .sweep import map_in_pool
+
+MAX_REPLICATIONS = 1000
+# Per-direction metrics that are summarized across replications
+REPLICATED_METRICS = (
+    "average_waiting_time",
+    "max_waiting_time",
+    "max_queue_length",
+    "average_queue_length",
+    "vehicles_crossed",
+    "throughput",
+)
+
+
+def replication_seeds(count, seed=None):
+    """
+    Seeds of independent random streams for count replications, derived from one seed so that the
+    whole study can be reproduced. A fresh seed is drawn when none is given.
+    """
+    sequence = np.random.SeedSequence(seed)
+    return sequence.entropy, [int(child.generate_state(1)[0]) for child in sequence.spawn(count)]
+
+
+def run_replication(task):
+    """
+    Run one seeded replication in a pool worker. Histograms are sent back as dicts so that the
+    parent can merge them.
+    """
+    junction_config, cycle_time, seed = task
+    simulation = Simulation(simulation_status="running", junction_config=junction_config)
+    engine = SimulationEngine(simulation, traffic_light_cycle_time=cycle_time, mode=SimulationEngine.EVENT_DRIVEN, seed=seed)
+    results = engine.start()
+    return {
+        "seed": seed,
+        "efficiency_score": results["efficiency_score"],
+        "metrics": results["metrics"],
+        "histograms": {d: histogram.to_dict() for d, histogram in engine.wait_histograms().items()},
+    }
+
+
+def summarize_replications(runs):
+    """
+    Mean and 95% confidence interval of the efficiency score and of each per-direction metric,
+    plus waiting time percentiles over the pooled vehicles of every replication.
+    """
+    score = RunningStats()
+    stats = {}
+    histograms = {}
+    for run in runs:
+        score.add(run["efficiency_score"])
+        for d, values in run["metrics"].items():
+            direction_stats = stats.setdefault(d, {metric: RunningStats() for metric in REPLICATED_METRICS})
+            for metric in REPLICATED_METRICS:
+                # Directions where no vehicle crossed have no waiting times in that replication
+                if values.get(metric) is not None:
+                    direction_stats[metric].add(values[metric])
+        for d, data in run["histograms"].items():
+            histograms.setdefault(d, Histogram()).merge(Histogram.from_dict(data))
+
+    metrics = {}
+    for d, direction_stats in stats.items():
+        metrics[d] = {metric: direction_stats[metric].confidence_interval() for metric in REPLICATED_METRICS}
+        metrics[d]["waiting_time_percentiles"] = histograms[d].percentiles() if d in histograms else None
+
+    return {
+        "efficiency_score": score.confidence_interval(),
+        "metrics": metrics,
+    }
+
+
+def run_replications(junction_config, replications, seed=None, cycle_time=TRAFFIC_LIGHT_CYCLE_TIME, max_workers=None):
+    """
+    Run independent seeded replications of one configuration across a process pool.
+    Args:
+        junction_config (dict): The configuration to replicate.
+        replications (int): Number of replications, at least 2 for a confidence interval.
+        seed (int): Seed from which the seed of every replication is derived.
+        cycle_time (float): Traffic light cycle time.
+        max_workers (int): Size of the process pool, the number of CPU cores by default.
+    Returns:
+        dict: The "summary" across replications, the "seed" and per-replication "seeds" and scores, and "run_stats".
+    """
+    if not isinstance(replications, int) or not 1 <= replications <= MAX_REPLICATIONS:
+        raise ValueError(f"The number of replications must be between 1 and {MAX_REPLICATIONS}")
+
+    started_at = time.perf_counter()
+    seed, seeds = replication_seeds(replications, seed)
+    runs, workers = map_in_pool(run_replication, [(junction_config, cycle_time, s) for s in seeds], max_workers)
+
+    return {
+        "seed": seed,
+        "summary": summarize_replications(runs),
+        "replications": [{"seed": run["seed"], "efficiency_score": run["efficiency_score"]} for run in runs],
+        "run_stats": {
+            "replications": replications,
+            "workers": workers,
+            "wall_time": time.perf_counter() - started_at,
+        },
+    }
@@ -0,0 +1,101 @@
+import numpy as np
+
+from .config import DIRECTIONS
+
+SCORED_METRICS = ("average_waiting_time", "max_waiting_time", "max_queue_length")
+DEFAULT_WEIGHTS = {"average_waiting_time": 0.5, "max_waiting_time": 0.25, "max_queue_length": 0.25}
+WITHIN_RUN = "run" # Metrics are normalized across the directions of each run, like SimulationEngine.calculate_efficiency_score
+ACROSS_HISTORY = "history" # Metrics are normalized across every direction of every run scored together
+SCOPES = (WITHIN_RUN, ACROSS_HISTORY)
+
+
+def parse_weights(weights=None):
+    """
+    The weights of the scored metrics, scaled to add up to 1 so that scores stay between 0 and 100.
+    Metrics left out get no weight. Raises ValueError on unknown metrics, negative weights or no weight at all.
+    """
+    if weights is None:
+        weights = DEFAULT_WEIGHTS
+    if not isinstance(weights, dict):
+        raise ValueError("The weights must be an object")
+    unknown = set(weights) - set(SCORED_METRICS)
+    if unknown:
+        raise ValueError(f"Unknown metrics: {', '.join(sorted(unknown))}, expected {', '.join(SCORED_METRICS)}")
+    values = [weights.get(metric, 0) for metric in SCORED_METRICS]
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) and v >= 0 for v in values) or sum(values) <= 0:
+        raise ValueError("The weights must be non-negative numbers, at least one of them positive")
+    total = sum(values)
+    return {metric: value / total for metric, value in zip(SCORED_METRICS, values)}
+
+
+def metric_array(metrics_list):
+    """
+    The scored metrics of many runs as a (runs, directions, metrics) array, NaN where a value is missing,
+    and a (runs, directions) mask of the directions each run has metrics for.
+    """
+    values = np.full((len(metrics_list), len(DIRECTIONS), len(SCORED_METRICS)), np.nan)
+    present = np.zeros((len(metrics_list), len(DIRECTIONS)), dtype=bool)
+    for i, metrics in enumerate(metrics_list):
+        for j, d in enumerate(DIRECTIONS):
+            direction = (metrics or {}).get(d)
+            if direction is None:
+                continue
+            present[i, j] = True
+            for k, metric in enumerate(SCORED_METRICS):
+                if direction.get(metric) is not None:
+                    values[i, j, k] = direction[metric]
+    return values, present
+
+
+def score_runs(metrics_list, weights=None, scope=WITHIN_RUN):
+    """
+    Efficiency scores of many runs at once, with NumPy operations over all of their directions.
+
+    The score of SimulationEngine.calculate_efficiency_score, generalized: every metric is min-max normalized,
+    inverted since lower is better, weighted, and averaged over the directions of the run, scaled to 0-100.
+    A missing waiting time counts as the worst of its scope. The scope is either each run on its own, which with
+    the default weights gives back the stored scores, or every run scored together, which also compares the runs.
+    Returns:
+        np.ndarray: One score per run, NaN for a run without metrics.
+    """
+    if scope not in SCOPES:
+        raise ValueError(f"The scope must be one of {', '.join(SCOPES)}")
+    weights = np.array(list(parse_weights(weights).values()))
+    values, present = metric_array(metrics_list)
+    if not len(metrics_list):
+        return np.empty(0)
+
+    valid = ~np.isnan(values)
+    axes = 1 if scope == WITHIN_RUN else (0, 1)
+    high = np.max(np.where(valid, values, -np.inf), axis=axes, keepdims=True)
+    low = np.min(np.where(valid, values, np.inf), axis=axes, keepdims=True)
+    # A metric with no value at all in its scope has no spread, like calculate_efficiency_score's 0 fallback
+    high = np.where(np.isfinite(high), high, 0.0)
+    low = np.where(np.isfinite(low), low, 0.0)
+
+    filled = np.where(valid, values, high)
+    spread = np.broadcast_to(high - low, filled.shape)
+    normalized = np.divide(filled - low, spread, out=np.zeros_like(filled), where=spread > 0)
+    direction_scores = ((1 - normalized) * weights).sum(axis=2)
+
+    counts = present.sum(axis=1)
+    totals = np.where(present, direction_scores, 0.0).sum(axis=1)
+    return np.divide(totals, counts, out=np.full(totals.shape, np.nan), where=counts > 0) * 100
+
+
+def rank_simulations(rows, weights=None, scope=WITHIN_RUN):
+    """
+    Rescore stored simulations without re-running them and rank them, best new score first.
+    Args:
+        rows (list): (simulation_id, stored efficiency score, metrics) of each simulation.
+    Returns:
+        list: One dict per simulation with its stored "efficiency_score", new "score" and "rank".
+    """
+    scores = score_runs([metrics for _, _, metrics in rows], weights, scope)
+    ranking = []
+    # Stable sort with NaN last, so ties keep the order of the rows
+    for rank, index in enumerate(np.argsort(-scores, kind="stable").tolist(), start=1):
+        simulation_id, efficiency_score, _ = rows[index]
+        score = None if np.isnan(scores[index]) else round(float(scores[index]), 1)
+        ranking.append({"simulation_id": simulation_id, "efficiency_score": efficiency_score, "score": score, "rank": rank})
+    return ranking
@@ -1,7 +1,12 @@
 from rest_framework import serializers
-from .models import Simulation
+from .models import Simulation, SimulationStudy
 
 class SimulationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Simulation
+        fields = '__all__'
+
+class SimulationStudySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SimulationStudy
         fields = '__all__'
\ No newline at end of file
@@ -0,0 +1,164 @@
+import math
+import time
+
+from .config import canonicalize_junction_config
+from .models import Simulation
+from .replications import replication_seeds, MAX_REPLICATIONS
+from .simulation_engine import SimulationEngine, SPEED_FACTOR
+from .statistics import RunningStats
+from .sweep import map_in_pool, parse_max_workers
+
+CYCLE_RANGE = (40, 240) # Simulated seconds of a full cycle, north-south then east-west
+SPLIT_RANGE = (0.2, 0.8) # Share of the cycle for which north-south is green
+MAX_CYCLE_LENGTH = 3600
+DEFAULT_REPLICATIONS = 3
+DEFAULT_EVALUATIONS = 30
+MAX_EVALUATIONS = 500 # Most timing plans a single search may evaluate
+GRID = 3 # Plans per dimension evaluated in each round of the search
+GOLDEN = (math.sqrt(5) - 1) / 2 # Share of the search box kept after each round
+
+
+def parse_range(name, values, low, high):
+    if not isinstance(values, (list, tuple)) or len(values) != 2 or not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+        raise ValueError(f"{name} must be a pair of numbers")
+    start, stop = values
+    if not low <= start <= stop <= high:
+        raise ValueError(f"{name} must lie between {low} and {high}, lowest first")
+    return [start, stop]
+
+
+def parse_optimization(data):
+    """
+    The parameters of a signal timing search, validated:
+        {"junction_config": {...}, "cycleRange": [40, 240], "splitRange": [0.2, 0.8],
+         "replications": 3, "maxEvaluations": 30, "seed": 7}
+    Everything but the junction_config is optional. Raises ValueError if anything is invalid.
+    """
+    if not isinstance(data, dict) or "junction_config" not in data:
+        raise ValueError("Expected a junction_config")
+    parameters = {
+        "junction_config": canonicalize_junction_config(data["junction_config"]),
+        "cycleRange": parse_range("cycleRange", data.get("cycleRange", CYCLE_RANGE), 2, MAX_CYCLE_LENGTH),
+        "splitRange": parse_range("splitRange", data.get("splitRange", SPLIT_RANGE), 0.05, 0.95),
+        "replications": data.get("replications", DEFAULT_REPLICATIONS),
+        "maxEvaluations": data.get("maxEvaluations", DEFAULT_EVALUATIONS),
+        "seed": data.get("seed"),
+    }
+    if not isinstance(parameters["replications"], int) or not 1 <= parameters["replications"] <= MAX_REPLICATIONS:
+        raise ValueError(f"The number of replications must be between 1 and {MAX_REPLICATIONS}")
+    if not isinstance(parameters["maxEvaluations"], int) or not 1 <= parameters["maxEvaluations"] <= MAX_EVALUATIONS:
+        raise ValueError(f"maxEvaluations must be between 1 and {MAX_EVALUATIONS}")
+    if parameters["seed"] is not None and (not isinstance(parameters["seed"], int) or parameters["seed"] < 0):
+        raise ValueError("The seed must be a non-negative integer")
+    if data.get("max_workers") is not None:
+        parameters["max_workers"] = parse_max_workers(data["max_workers"])
+    return parameters
+
+
+def plan_key(cycle_length, green_split):
+    """
+    Plans are rounded to whole seconds and hundredths, finer differences are lost in the noise of the runs.
+    """
+    return int(round(cycle_length)), round(green_split, 2)
+
+
+def lattice(box, grid=GRID):
+    """
+    The grid x grid plans spread evenly over a search box, without duplicates once rounded.
+    """
+    (cycle_low, cycle_high), (split_low, split_high) = box
+    steps = [i / (grid - 1) for i in range(grid)] if grid > 1 else [0.5]
+    plans = []
+    for cycle_step in steps:
+        for split_step in steps:
+            plan = plan_key(cycle_low + cycle_step * (cycle_high - cycle_low), split_low + split_step * (split_high - split_low))
+            if plan not in plans:
+                plans.append(plan)
+    return plans
+
+
+def shrink(box, bounds, center):
+    """
+    The search box scaled down by the golden ratio around a plan, kept within the bounds of the search.
+    """
+    shrunk = []
+    for (low, high), (lowest, highest), middle in zip(box, bounds, center):
+        width = (high - low) * GOLDEN
+        low = min(max(middle - width / 2, lowest), highest - width)
+        shrunk.append((low, low + width))
+    return shrunk
+
+
+def evaluate_plan(task):
+    """
+    Efficiency score of one seeded replication of a timing plan. Runs in a pool worker, so nothing is written to the database.
+    """
+    junction_config, cycle_length, green_split, seed = task
+    simulation = Simulation(simulation_status="running", junction_config=junction_config)
+    # The engine's cycle time is the average wall-clock length of a phase, half a cycle
+    engine = SimulationEngine(simulation, traffic_light_cycle_time=cycle_length / 2 / SPEED_FACTOR, mode=SimulationEngine.EVENT_DRIVEN, seed=seed, green_split=green_split)
+    return engine.start()["efficiency_score"]
+
+
+def optimize_signal_timing(junction_config, cycle_range=CYCLE_RANGE, split_range=SPLIT_RANGE, replications=DEFAULT_REPLICATIONS, max_evaluations=DEFAULT_EVALUATIONS, seed=None, max_workers=None, grid=GRID):
+    """
+    Search the cycle length and north-south green split that maximize the mean efficiency score of a junction.
+
+    Golden-section search narrows a bracket by one new point at a time, which would leave a process pool idle,
+    so each round evaluates a grid x grid lattice of plans over the current search box in a single pool map and
+    then shrinks the box by the golden ratio around the best plan so far. Every plan is run with the same seeded
+    replications, so plans are compared on the same arrivals and a few replications separate them.
+    The search stops once max_evaluations plans have been evaluated or the box is too small to hold new plans.
+    Args:
+        junction_config (dict): The demand to time the lights for.
+        cycle_range (tuple): Shortest and longest cycle, in simulated seconds.
+        split_range (tuple): Smallest and largest share of the cycle for which north-south is green.
+        replications (int): Seeded runs per plan.
+        max_evaluations (int): Most plans to evaluate.
+        seed (int): Seed from which the seed of every replication is derived.
+        max_workers (int): Size of the process pool, the number of CPU cores by default.
+    Returns:
+        dict: The "best" plan, the "frontier" of every evaluated plan, best first, the "seed" and "seeds", and "run_stats".
+    """
+    started_at = time.perf_counter()
+    seed, seeds = replication_seeds(replications, seed)
+    bounds = [tuple(cycle_range), tuple(split_range)]
+    box = list(bounds)
+    scores = {}
+    rounds, workers = 0, 1
+
+    while len(scores) < max_evaluations:
+        plans = [plan for plan in lattice(box, grid) if plan not in scores][:max_evaluations - len(scores)]
+        if not plans:
+            break
+        tasks = [(junction_config, cycle_length, green_split, s) for cycle_length, green_split in plans for s in seeds]
+        results, workers = map_in_pool(evaluate_plan, tasks, max_workers)
+        for index, plan in enumerate(plans):
+            stats = RunningStats()
+            for score in results[index * replications:(index + 1) * replications]:
+                stats.add(score)
+            scores[plan] = stats.confidence_interval()
+        rounds += 1
+        best = max(scores, key=lambda plan: scores[plan]["mean"])
+        box = shrink(box, bounds, best)
+
+    frontier = [
+        {"cycle_length": cycle_length, "green_split": green_split, "efficiency_score": score}
+        for (cycle_length, green_split), score in sorted(scores.items(), key=lambda item: item[1]["mean"], reverse=True)
+    ]
+    for rank, row in enumerate(frontier, start=1):
+        row["rank"] = rank
+
+    return {
+        "best": frontier[0],
+        "frontier": frontier,
+        "seed": seed,
+        "seeds": seeds,
+        "run_stats": {
+            "evaluations": len(scores),
+            "runs": len(scores) * replications,
+            "rounds": rounds,
+            "workers": workers,
+            "wall_time": time.perf_counter() - started_at,
+        },
+    }
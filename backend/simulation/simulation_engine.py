@@ -1,4 +1,4 @@
-import time, threading, numpy as np, os, django, random, sys
+import time, threading, asyncio, numpy as np, os, django, sys
 from queue import Queue
 from django.db import connection
 from django.utils import timezone
@@ -13,25 +13,97 @@ django.setup()
 
 # Import Django models and packages
 from simulation.models import Vehicle, Simulation
+from simulation.event_engine import DiscreteEventJunction
+from simulation.async_engine import AsyncJunction
+from simulation.arrivals import ArrivalSource
+from simulation.config import arrival_settings
+from simulation.vehicles import generate_fleet
+from simulation.statistics import MetricsAccumulator
+from simulation.persistence import VehicleWriter
+from simulation.timing import PhaseTimer
+from simulation import monitoring
+from simulation.event_log import EventLog, ENGINE, LIGHT, ARRIVAL, DEPARTURE, QUEUE, WAREHOUSE, PERSISTENCE
 
 # Global variables
-counter = 0
 SPEED_FACTOR = 20
-stop_event = threading.Event()
+TRAFFIC_LIGHT_CYCLE_TIME = 3 # Default seconds per light phase, i.e. 60 simulated seconds
+ENGINE_VERSION = "event-1" # Bump whenever seeded runs of the background task would give different results, it invalidates cached results
+AWT_MWT_QUERY_PATH = os.path.join(settings.BASE_DIR, "queries", "compute_AWT_MWT.sql")
+VEHICLE_BATCH_SIZE = 500 # Rows per INSERT when a run is persisted, Django lowers it to fit SQLite's parameter limit
+stop_event = threading.Event() # Default stop signal for components created outside of a SimulationEngine
+IDLE_WAIT = 0.5 # Longest time an idle dequeuer sleeps before re-checking the stop signal on its own
+
+
+class JunctionSignal:
+    '''
+    Wakes the dequeuer threads up when something they are waiting for happens: a vehicle reaching
+    one of their lanes, a traffic light phase change or the end of the simulation.
+    Each direction has a version number that is bumped on every notification, so a dequeuer that
+    remembers the version it last looked at cannot miss a notification sent while it was busy.
+    '''
+    def __init__(self, directions=("north", "south", "east", "west")):
+        self.condition = threading.Condition()
+        self.versions = {d: 0 for d in directions}
+
+    def notify(self, direction=None):
+        '''
+        Wake up the dequeuer of one direction, or of every direction if none is given.
+        '''
+        with self.condition:
+            for d in ([direction] if direction is not None else self.versions):
+                self.versions[d] += 1
+            self.condition.notify_all()
+
+    def version(self, direction):
+        with self.condition:
+            return self.versions[direction]
+
+    def wait(self, direction, seen_version, stop_event, timeout=IDLE_WAIT):
+        '''
+        Block until the direction is notified after seen_version, the stop event is set or the timeout expires.
+        '''
+        with self.condition:
+            self.condition.wait_for(lambda: self.versions[direction] != seen_version or stop_event.is_set(), timeout)
+
+
+class CpuTimeTracker:
+    '''
+    Adds up the CPU time spent by the threads of one simulation.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.total = 0.0
+
+    def run(self, target, *args):
+        '''
+        Thread target wrapper that records the CPU time of the thread once target returns.
+        '''
+        try:
+            target(*args)
+        finally:
+            with self.lock:
+                self.total += time.thread_time()
 
 
 class TrafficLight:
-    def __init__(self, cycle_time=3):
+    def __init__(self, cycle_time=3, stop_event=None, signal=None, cpu_tracker=None, event_log=None, green_split=0.5):
         self.NS_traffic = True
         self.EW_traffic = False
         self.lock = threading.Lock()
-        self.cycle_time = cycle_time
+        self.cycle_time = cycle_time # Average phase length, a full cycle is two phases
+        self.green_split = green_split # Share of each cycle for which north-south is green
+        self.stop_event = stop_event if stop_event is not None else globals()["stop_event"]
+        self.signal = signal
+        self.cpu_tracker = cpu_tracker if cpu_tracker is not None else CpuTimeTracker()
+        self.event_log = event_log if event_log is not None else EventLog()
+        self.threads = []
 
     def switch_state(self):
         with self.lock:
             self.NS_traffic, self.EW_traffic = self.EW_traffic, self.NS_traffic
-            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')} north-south Traffic Light] {self.NS_traffic}")
-            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')} east-west Traffic Light] {self.EW_traffic}")
+            self.event_log.debug(LIGHT, "north-south green: %s, east-west green: %s", self.NS_traffic, self.EW_traffic)
+        if self.signal is not None:
+            self.signal.notify() # Phase change, every dequeuer has something new to look at
 
     def is_green(self, direction:str):
         with self.lock:
@@ -40,23 +112,45 @@ class TrafficLight:
             else :
                 return self.EW_traffic
             
+    def phase_length(self):
+        with self.lock:
+            share = self.green_split if self.NS_traffic else 1 - self.green_split
+        return 2 * self.cycle_time * share
+
     def operation(self):
-        while not stop_event.is_set():
-            time.sleep(self.cycle_time)
+        # Waiting on the stop event sleeps for the phase but returns as soon as the simulation stops
+        while not self.stop_event.wait(self.phase_length()):
             self.switch_state() # Switch traffic light state
 
     def start(self):
-        threading.Thread(target=self.operation, daemon=True).start()  
-        print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')} Traffic Light] A thread for a traffic light has started.")
+        thread = threading.Thread(target=self.cpu_tracker.run, args=(self.operation,), daemon=True)
+        thread.start()
+        self.threads.append(thread)
+        self.event_log.debug(ENGINE, "A thread for a traffic light has started.")
+
+def default_accumulator(traffic_dict):
+    '''
+    Accumulator on the threaded engine's clock for components created outside of a Junction.
+    '''
+    lane_count = len(next(iter(traffic_dict.values()))["incoming"])
+    return MetricsAccumulator(traffic_dict.keys(), lane_count, start=time.monotonic(), time_scale=SPEED_FACTOR)
 
 class Enqueuer:
-    def __init__(self, traffic_dict, locks_dict, vehicle_warehouse, junction_config):
+    def __init__(self, traffic_dict, locks_dict, vehicle_warehouse, junction_config, stop_event=None, signal=None, cpu_tracker=None, accumulator=None, event_log=None):
         self.traffic_dict = traffic_dict
         self.junction_config = junction_config
         self.locks_dict = locks_dict
         self.vehicle_warehouse = vehicle_warehouse
+        self.stop_event = stop_event if stop_event is not None else globals()["stop_event"]
+        self.signal = signal if signal is not None else JunctionSignal()
+        self.cpu_tracker = cpu_tracker if cpu_tracker is not None else CpuTimeTracker()
+        self.accumulator = accumulator if accumulator is not None else default_accumulator(traffic_dict)
+        self.event_log = event_log if event_log is not None else EventLog()
+        self.threads = []
 
     def enqueue_vehicles(self, direction):
+        if self.vehicle_warehouse.horizon is not None:
+            return self.enqueue_arrivals(direction)
         while not self.vehicle_warehouse.is_empty(direction):
             VPH = self.junction_config[direction]["inbound"]  # Vehicles per hour
             VPS = VPH / 3600  # Vehicles per second
@@ -72,30 +166,61 @@ class Enqueuer:
             #     self.traffic_dict[direction]["incoming"][incoming_lane].put(vehicle)
             #     vehicle.arrival_time = timezone.now()
             #     vehicle.save()
+            vehicle.arrival_time = time.monotonic()
             self.traffic_dict[direction]["incoming"][incoming_lane].put(vehicle)
-            vehicle.arrival_time = timezone.now()
-            vehicle.save()
+            self.accumulator.arrived(direction, incoming_lane, vehicle.arrival_time)
+            self.signal.notify(direction)
 
-            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')} {direction} traffic, lane {incoming_lane}] A new vehicle going to the {vehicle.exit_direction} reached the junction.")
+            self.event_log.debug(ARRIVAL, "%s traffic, lane %d: a new vehicle going to the %s reached the junction.", direction, incoming_lane, vehicle.exit_direction)
         
         if self.vehicle_warehouse.is_one_empty():
-            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] No more vehicles in the warehouse. Stopping the simulation.")
-            stop_event.set()
+            self.event_log.info(ENGINE, "No more vehicles in the %s warehouse. Stopping the simulation.", direction)
+            self.stop_event.set()
+            self.signal.notify()
+
+    def enqueue_arrivals(self, direction):
+        '''
+        Enqueue the arrival stream of a time-horizon run, each vehicle at its own arrival time counted from the
+        start of the run, so that a late wake-up doesn't delay every later arrival. The engine stops the run.
+        '''
+        if direction not in self.vehicle_warehouse.stocked_directions():
+            return
+        origin = self.accumulator.start
+        while not self.stop_event.is_set():
+            arrival_time, vehicle = self.vehicle_warehouse.next_arrival(direction)
+            if self.stop_event.wait(max(origin + arrival_time / SPEED_FACTOR - time.monotonic(), 0)):
+                return
+            vehicle.arrival_time = time.monotonic()
+            self.traffic_dict[direction]["incoming"][vehicle.incoming_lane].put(vehicle)
+            self.accumulator.arrived(direction, vehicle.incoming_lane, vehicle.arrival_time)
+            self.signal.notify(direction)
+            self.event_log.debug(ARRIVAL, "%s traffic, lane %d: a new vehicle going to the %s reached the junction.", direction, vehicle.incoming_lane, vehicle.exit_direction)
 
     def start(self):
         for direction in self.traffic_dict:
             # Only start threads for directions with inbound traffic
             if self.junction_config[direction]["inbound"] > 0:
-                threading.Thread(target=self.enqueue_vehicles, args=(direction,), daemon=True).start()
-                print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')} {direction} traffic ] Thread for enqueueing traffic has started.")
+                thread = threading.Thread(target=self.cpu_tracker.run, args=(self.enqueue_vehicles, direction), daemon=True)
+                thread.start()
+                self.threads.append(thread)
+                self.event_log.debug(ENGINE, "Thread for enqueueing %s traffic has started.", direction)
 
 class Dequeuer:
-    def __init__(self, traffic_dict, locks_dict, max_queue_length_tracker, junction_config, traffic_light, crossing_time=1/SPEED_FACTOR):   
+    def __init__(self, traffic_dict, locks_dict, junction_config, traffic_light, crossing_time=1/SPEED_FACTOR, stop_event=None, signal=None, cpu_tracker=None, accumulator=None, writer=None, event_log=None, keep_exited=True):   
         self.traffic_dict = traffic_dict
         self.junction_config = junction_config
         self.traffic_light = traffic_light
         self.locks_dict = locks_dict
-        self.max_queue_length_tracker = max_queue_length_tracker
+        self.stop_event = stop_event if stop_event is not None else globals()["stop_event"]
+        self.signal = signal if signal is not None else JunctionSignal()
+        self.cpu_tracker = cpu_tracker if cpu_tracker is not None else CpuTimeTracker()
+        self.accumulator = accumulator if accumulator is not None else default_accumulator(traffic_dict)
+        self.writer = writer # Write-behind persistence of crossed vehicles, if they are stored
+        self.keep_exited = keep_exited # Time-horizon runs don't keep crossed vehicles in the exit lanes, they never end
+        self.event_log = event_log if event_log is not None else EventLog()
+        self.crossed_counter = monitoring.VEHICLES_CROSSED.labels(SimulationEngine.THREADED)
+        self.threads = []
+        self.counter = 0
         
         self.CROSSING_TIME = crossing_time
     
@@ -113,16 +238,15 @@ class Dequeuer:
 
 
     def dequeue_vehicles(self, dir):
-        global counter
-
         # Initialize the old queue size for the incoming lanes
         old_inc_q_size = [int(lane.qsize()) for lane in self.traffic_dict[dir]["incoming"]]
 
-        # Initialize the old queue size for the exiting lanes
-        old_ext_q_size = [int(lane.qsize()) for lane in self.traffic_dict[dir]["exiting"]]
-
         # Dequeue vehicles as long as the stop event is not set, i.e., the simulation is not stopped
-        while not stop_event.is_set():
+        while not self.stop_event.is_set():
+
+            # Remember what this pass over the lanes has seen, and whether any vehicle could cross
+            seen_version = self.signal.version(dir)
+            moved = False
 
             # Iterate over the lanes in the direction this function is handling
             for index,lane in enumerate(self.traffic_dict[dir]["incoming"]):
@@ -142,7 +266,7 @@ class Dequeuer:
                     if self.traffic_light.is_green(vehicle.incoming_direction): 
 
                         # Check if the vehicle is turning right
-                        if vehicle.get_relative_dir(vehicle.incoming_direction, vehicle.exit_direction) == Vehicle.TURNING_RIGHT:  
+                        if vehicle.turn == Vehicle.TURNING_RIGHT:  
                             # Need to check ALL lanes from the opposite direction
                             opp_dir = self.get_opposite_direction(vehicle.incoming_direction)
                             
@@ -165,13 +289,13 @@ class Dequeuer:
                                     if not opp_lane.empty():
                                         opp_vehicle = opp_lane.queue[0]
                                         
-                                        if (opp_vehicle.get_relative_dir(opp_vehicle.incoming_direction, 
-                                            opp_vehicle.exit_direction) == Vehicle.GOING_STRAIGHT and
+                                        if (opp_vehicle.turn == Vehicle.GOING_STRAIGHT and
                                             self.traffic_light.is_green(opp_vehicle.incoming_direction)):
                                             
                                             # Found a straight-going vehicle with right of way
                                             # Get the vehicle and add to our processing list
                                             opp_vehicle = opp_lane.get()
+                                            self.accumulator.left_queue(opp_dir, opp_idx, time.monotonic())
                                             straight_going_vehicles.append((opp_idx, opp_vehicle))
                                 
                                 # Process all straight-going vehicles first
@@ -181,16 +305,20 @@ class Dequeuer:
                                     exit_lane = opp_vehicle.exit_lane
                                     
                                     with self.locks_dict[exit_dir]["exiting"][exit_lane]:
-                                        opp_vehicle.departure_time = timezone.now()
-                                        time_diff = (opp_vehicle.departure_time - opp_vehicle.arrival_time).total_seconds()
-                                        opp_vehicle.waiting_time = time_diff
-                                        opp_vehicle.save()
+                                        opp_vehicle.departure_time = time.monotonic()
+                                        time_diff = opp_vehicle.waiting_time
+                                        self.accumulator.crossed(incoming_dir, opp_idx, time_diff)
+                                        self.crossed_counter.inc()
+                                        if self.writer is not None:
+                                            self.writer.submit(opp_vehicle)
                                         time.sleep(self.CROSSING_TIME)
-                                        self.traffic_dict[exit_dir]["exiting"][exit_lane].put(opp_vehicle)
-                                        print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} [RIGHT-OF-WAY] Vehicle{opp_vehicle.id} from {incoming_dir} lane {opp_idx} went straight to {exit_dir}, waited for {time_diff*SPEED_FACTOR}")
+                                        if self.keep_exited:
+                                            self.traffic_dict[exit_dir]["exiting"][exit_lane].put(opp_vehicle)
+                                        self.event_log.debug(DEPARTURE, "[RIGHT-OF-WAY] Vehicle %d from %s lane %d went straight to %s, waited for %.2fs", opp_vehicle.id, incoming_dir, opp_idx, exit_dir, time_diff * SPEED_FACTOR)
                                 
                                 # If we processed any straight-going vehicles, skip this cycle for the right-turning vehicle
                                 if straight_going_vehicles:
+                                    moved = True
                                     continue
                                     
                             finally:
@@ -199,113 +327,74 @@ class Dequeuer:
                                     lock.release()
                         
                         vehicle = lane.get()
+                        self.accumulator.left_queue(dir, index, time.monotonic())
 
                         incoming_dir = vehicle.incoming_direction
                         exit_dir = vehicle.exit_direction
                         exit_lane = vehicle.exit_lane
                         
                         with self.locks_dict[exit_dir]["exiting"][exit_lane]:
-                            vehicle.departure_time = timezone.now()
-                            time_diff = (vehicle.departure_time - vehicle.arrival_time).total_seconds()
-                            vehicle.waiting_time = time_diff
-                            vehicle.save()
+                            vehicle.departure_time = time.monotonic()
+                            time_diff = vehicle.waiting_time
+                            self.accumulator.crossed(incoming_dir, index, time_diff)
+                            self.crossed_counter.inc()
+                            if self.writer is not None:
+                                self.writer.submit(vehicle)
                             time.sleep(self.CROSSING_TIME) 
-                            self.traffic_dict[exit_dir]["exiting"][exit_lane].put(vehicle)
-                            print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} Vehicle{vehicle.id} from {incoming_dir} exited to {exit_dir}, waited for {time_diff*SPEED_FACTOR}")
+                            if self.keep_exited:
+                                self.traffic_dict[exit_dir]["exiting"][exit_lane].put(vehicle)
+                            self.event_log.debug(DEPARTURE, "Vehicle %d from %s exited to %s, waited for %.2fs", vehicle.id, incoming_dir, exit_dir, time_diff * SPEED_FACTOR)
                         
-                        counter += 1
-                        print(f"COUNTERR: {counter}")
+                        self.counter += 1
+                        moved = True
 
                     else:
-                        self.max_queue_length_tracker[dir] = max(self.max_queue_length_tracker[dir], lane.qsize())
                         new_q_size = [lane.qsize() for lane in self.traffic_dict[dir]["incoming"]]
                         if new_q_size != old_inc_q_size:
                             old_inc_q_size = new_q_size
-                            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')} {dir} traffic] Traffic light is red, current queue length: {new_q_size}")
+                            self.event_log.debug(QUEUE, "%s traffic light is red, current queue lengths: %s", dir, new_q_size)
+
+            # Nothing could cross: sleep until a vehicle arrives, the lights change or the simulation stops
+            if not moved:
+                self.signal.wait(dir, seen_version, self.stop_event)
                        
 
     def start(self):
         for direction in self.traffic_dict:
-            threading.Thread(target=self.dequeue_vehicles, daemon=True, args=(direction,)).start()
-            print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')} {direction} traffic ] A thread for dequeuing traffic has stared.")
+            thread = threading.Thread(target=self.cpu_tracker.run, daemon=True, args=(self.dequeue_vehicles, direction))
+            thread.start()
+            self.threads.append(thread)
+            self.event_log.debug(ENGINE, "A thread for dequeuing %s traffic has started.", direction)
 
 class VehiclesWarehouse:
     
-    def __init__(self, junction_config, num_vehicle=50):
-        print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Warehouse is creating vehicles...")
-        self.warehouse = {
-            "north": [],
-            "east": [], 
-            "south": [],
-            "west": []
-        }
+    def __init__(self, junction_config, num_vehicle=50, seed=None, event_log=None):
+        self.event_log = event_log if event_log is not None else EventLog()
+        self.event_log.debug(WAREHOUSE, "Warehouse is creating vehicles...")
+        self.warehouse = {}
         self.junction_config = junction_config
         self.num_vehicle = num_vehicle
         self.lock = threading.Lock()
+        self.rng = np.random.default_rng(seed) # The same seed always stocks the same vehicles
+        self.vehicle_count = 0
+        self.horizon = None # The run ends when one approach runs dry, see ArrivalSource for time-horizon runs
 
-        for d in self.warehouse:
+        for d in ["north", "east", "south", "west"]:
             self.warehouse[d] = self.generateVehicles(d)
+            self.vehicle_count += self.warehouse[d].size
 
-        print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Warehouse has been stocked with vehicles.")
+        self.event_log.debug(WAREHOUSE, "Warehouse has been stocked with %d vehicles.", self.vehicle_count)
 
-    def vehicleBuilder(self, incoming_direction:str, exit_direction:str) -> Vehicle:
-        lane_count = self.junction_config["numLanes"]
-        random_lane = random.randint(0,  lane_count - 1)
-        relative_dir = Vehicle.get_relative_dir(incoming_direction, exit_direction)
-        match relative_dir:
-            case Vehicle.TURNING_LEFT:
-                incoming_lane = 0
-            case Vehicle.GOING_STRAIGHT:
-                if self.junction_config["leftTurn"]:
-                    # For straight, use any lane except left turn lane (which is 0)
-                    incoming_lane = random.randint(1, lane_count - 1)
-                else:
-                    incoming_lane = random_lane
-            case Vehicle.TURNING_RIGHT:
-                incoming_lane = lane_count - 1
-            case _:
-                incoming_lane = random_lane
-        
-       
-        #create vehicle
-        vehicle = Vehicle.objects.create(
-            incoming_direction=incoming_direction,
-            exit_direction=exit_direction,
-            incoming_lane=incoming_lane,
-            exit_lane=list(range(lane_count))[::-1][incoming_lane]  
-        )
-        vehicle.save()
-
-        return vehicle
-    
     def generateVehicles(self, incoming_direction):
         """
-        Generate a list of Vehicle objects based on junction configuration data.
+        Generate the fleet of one approach based on junction configuration data.
         Args:
-            junction_config (dict): Dictionary containing junction configuration with flow rates and lane information.
             incoming_direction (str): The direction from which vehicles are entering the junction.
         Returns:
-            list: A shuffled list of Vehicle objects generated according to the flow rates relative to the inbound flow.
+            Fleet: A shuffled struct-of-arrays fleet generated according to the flow rates relative to the inbound flow.
         """
-        vehicles = []
-        incoming_flow_rate = self.junction_config[incoming_direction]["inbound"]
-        # Skip directions with no inbound traffic
-        if incoming_flow_rate == 0:
-            return vehicles
-        exit_flow_rates = self.junction_config[incoming_direction]
-
-        for d,v in exit_flow_rates.items():
-            if d == "inbound": continue # Skip the inbound direction
-
-            n = round(self.num_vehicle*(v/incoming_flow_rate)) # Number of vehicles exiting at this direction            
-            for i in range(n):
+        return generate_fleet(self.junction_config, incoming_direction, self.num_vehicle, self.rng, self.vehicle_count + 1)
 
-                vehicles.append(self.vehicleBuilder(incoming_direction, d))
-
-        vehicles = list(np.random.permutation(vehicles))
-
-        return vehicles
-    
     def get_vehicle(self, direction):
         """
         Retrieves a vehicle from the warehouse for the given direction.
@@ -321,8 +410,36 @@ class VehiclesWarehouse:
         if not self.warehouse[direction]:
             raise ValueError("No vehicle available in the warehouse.")
 
-        return self.warehouse[direction].pop(0)
+        return self.warehouse[direction].pop()
     
+    def uncrossed_vehicles(self):
+        """
+        Vehicles that did not cross the junction, whether they reached it or are still in stock.
+        """
+        for fleet in self.warehouse.values():
+            for vehicle in fleet.all_vehicles():
+                if vehicle.departure_time is None:
+                    yield vehicle
+
+    def all_vehicles(self):
+        for fleet in self.warehouse.values():
+            yield from fleet.all_vehicles()
+
+    def remaining(self):
+        """
+        Vehicles of each direction that have not been released yet.
+        """
+        return {d: len(fleet) for d, fleet in self.warehouse.items()}
+
+    def fraction_released(self):
+        return 1 - sum(self.remaining().values()) / self.vehicle_count if self.vehicle_count else 1.0
+
+    def stocked_directions(self):
+        """
+        Directions that had vehicles when the warehouse was stocked.
+        """
+        return [d for d in self.warehouse if self.warehouse[d].size > 0]
+
     def is_empty(self, direction):
         with self.lock:
             return not bool(self.warehouse[direction])
@@ -336,7 +453,7 @@ class VehiclesWarehouse:
             return all([not bool(self.warehouse[d]) for d in self.warehouse])
 
 class Junction:
-    def __init__(self, junction_config, vehicle_warehouse, traffic_light_cycle_time=20/SPEED_FACTOR):
+    def __init__(self, junction_config, vehicle_warehouse, traffic_light_cycle_time=20/SPEED_FACTOR, stop_event=None, writer=None, event_log=None, green_split=0.5):
         self.junction_config = junction_config
         self.vehicle_warehouse = vehicle_warehouse
         lane_count = self.junction_config["numLanes"]
@@ -373,16 +490,15 @@ class Junction:
             direction: threading.Lock() for direction in self.traffic_dict
         }
 
-        self.max_queue_length_tracker = {
-            "north": 0,
-            "south": 0,
-            "east": 0,   
-            "west": 0
-        }
-
-        self.traffic_light = TrafficLight(traffic_light_cycle_time)
-        self.enqueuer = Enqueuer(self.traffic_dict, self.locks_dict, self.vehicle_warehouse, self.junction_config)
-        self.dequeuer = Dequeuer(self.traffic_dict, self.locks_dict, self.max_queue_length_tracker, self.junction_config, self.traffic_light)
+        self.stop_event = stop_event if stop_event is not None else globals()["stop_event"]
+        self.signal = JunctionSignal(self.traffic_dict.keys())
+        self.cpu_tracker = CpuTimeTracker()
+        self.accumulator = MetricsAccumulator(self.traffic_dict.keys(), lane_count, start=time.monotonic(), time_scale=SPEED_FACTOR)
+        self.event_log = event_log if event_log is not None else EventLog()
+        components = {"stop_event": self.stop_event, "signal": self.signal, "cpu_tracker": self.cpu_tracker, "event_log": self.event_log}
+        self.traffic_light = TrafficLight(traffic_light_cycle_time, green_split=green_split, **components)
+        self.enqueuer = Enqueuer(self.traffic_dict, self.locks_dict, self.vehicle_warehouse, self.junction_config, accumulator=self.accumulator, **components)
+        self.dequeuer = Dequeuer(self.traffic_dict, self.locks_dict, self.junction_config, self.traffic_light, accumulator=self.accumulator, writer=writer, keep_exited=self.vehicle_warehouse.horizon is None, **components)
         self.threads = []
 
     def start(self):
@@ -399,23 +515,115 @@ class Junction:
         # Store references
         self.threads = [enqueuer_thread, dequeuer_thread, traffic_light_thread]
 
+    def worker_threads(self):
+        '''
+        The enqueuing, dequeuing and traffic light threads started by the launcher threads.
+        '''
+        return self.enqueuer.threads + self.dequeuer.threads + self.traffic_light.threads
+
+    def queue_depths(self):
+        '''
+        Vehicles currently waiting in each incoming lane, per direction.
+        '''
+        return {d: [lane.qsize() for lane in traffic["incoming"]] for d, traffic in self.traffic_dict.items()}
+
+    def light_phase(self):
+        return "north-south" if self.traffic_light.is_green("north") else "east-west"
+
+    def stop(self):
+        self.stop_event.set()
+        self.signal.notify()
+
 class SimulationEngine:
-    def __init__(self, simulation:Simulation, traffic_light_cycle_time=3):
-        global stop_event
-        stop_event = threading.Event()
-        
+    THREADED = "threaded"
+    EVENT_DRIVEN = "event"
+    ASYNC = "async"
+
+    def __init__(self, simulation:Simulation, traffic_light_cycle_time=TRAFFIC_LIGHT_CYCLE_TIME, mode=THREADED, persist_vehicles=False, seed=None, num_vehicle=50, timer=None, green_split=0.5):
+        '''
+        mode selects how the junction is run:
+            - "threaded": enqueuer, dequeuer and traffic light threads sleeping on wall time.
+            - "event": a discrete-event run on a virtual clock with the same semantics, which
+              finishes as fast as the events can be processed.
+            - "async": the threaded semantics on wall time with coroutines instead of threads, so that
+              run_concurrently can run many simulations in one event loop.
+        Metrics are accumulated while the run goes on. With persist_vehicles, every vehicle of the
+        run is also stored in the Vehicle table for later inspection, by a write-behind VehicleWriter
+        thread so that the junction's threads never wait on the database.
+        seed makes the generated vehicles reproducible, which together with the event mode makes
+        the whole run deterministic. num_vehicle scales the fleet of each approach.
+        A junction config with "arrivals" or "duration" makes a time-horizon run instead: vehicles are drawn
+        lazily by an ArrivalSource, deterministically or as a Poisson process, and every approach is measured
+        until the duration has elapsed in simulated seconds. Those vehicles are not kept, so they can't be persisted.
+        traffic_light_cycle_time is the average length of a light phase and green_split the share of each
+        cycle of two phases for which north-south is green, an even split by default.
+        The wall time of every phase, from stocking the warehouse to deleting the vehicles, is
+        recorded by timer, a PhaseTimer that callers may share to time their own phases too.
+        '''
+        if mode not in (SimulationEngine.THREADED, SimulationEngine.EVENT_DRIVEN, SimulationEngine.ASYNC):
+            raise ValueError(f"Unknown simulation mode: {mode}")
+        if not 0 < green_split < 1:
+            raise ValueError("The green split must be between 0 and 1")
+
+        self.mode = mode
+        self.persist_vehicles = persist_vehicles
+        # Each engine has its own stop signal so that several simulations can run in one process
+        self.stop_event = threading.Event()
         self.junction_config = simulation.junction_config
-        self.vehicle_warehouse = VehiclesWarehouse(self.junction_config, 50)
-        self.junction = Junction(self.junction_config, self.vehicle_warehouse, traffic_light_cycle_time)
+        self.seed = seed
+        self.event_log = EventLog(simulation.simulation_id)
+        self.timer = timer if timer is not None else PhaseTimer()
+        settings = arrival_settings(self.junction_config)
+        if settings is not None and persist_vehicles:
+            raise ValueError("Vehicles of a time-horizon run are not kept, they can't be persisted")
+        with self.timer.phase("stocking"):
+            if settings is not None:
+                process, duration = settings
+                self.vehicle_warehouse = ArrivalSource(self.junction_config, duration, process, seed=seed, event_log=self.event_log)
+            else:
+                self.vehicle_warehouse = VehiclesWarehouse(self.junction_config, num_vehicle, seed=seed, event_log=self.event_log)
+        self.wall_origin = timezone.now()
+        self.clock_origin = time.monotonic()
+        self.writer = None
+        if persist_vehicles:
+            # The event-driven clock counts simulated seconds, the threaded one real seconds
+            clock_origin, time_scale = (0.0, 1 / SPEED_FACTOR) if mode == SimulationEngine.EVENT_DRIVEN else (self.clock_origin, 1.0)
+            self.writer = VehicleWriter(simulation, self.wall_origin, clock_origin, time_scale, batch_size=VEHICLE_BATCH_SIZE)
+        with self.timer.phase("junction_setup"):
+            if mode == SimulationEngine.EVENT_DRIVEN:
+                # Wall-clock durations of the threaded engine converted to simulated seconds
+                self.junction = DiscreteEventJunction(
+                    self.junction_config,
+                    self.vehicle_warehouse,
+                    phase_duration=traffic_light_cycle_time * SPEED_FACTOR,
+                    crossing_time=1,
+                    green_split=green_split,
+                )
+            elif mode == SimulationEngine.ASYNC:
+                self.junction = AsyncJunction(
+                    self.junction_config,
+                    self.vehicle_warehouse,
+                    phase_duration=traffic_light_cycle_time,
+                    crossing_time=1 / SPEED_FACTOR,
+                    time_scale=SPEED_FACTOR,
+                    writer=self.writer,
+                    event_log=self.event_log,
+                    green_split=green_split,
+                )
+            else:
+                self.junction = Junction(self.junction_config, self.vehicle_warehouse, traffic_light_cycle_time, stop_event=self.stop_event, writer=self.writer, event_log=self.event_log, green_split=green_split)
         self.simulation = simulation
 
     @classmethod
-    def compute_AWT_MWT(cls, path_to_queries):
+    def compute_AWT_MWT(cls, simulation_id, path_to_queries=AWT_MWT_QUERY_PATH):
+        '''
+        Average and maximum waiting time of every direction, queried from the persisted vehicles of one simulation.
+        '''
         with open(path_to_queries, "r") as file:
             sql_query = file.read()
         
         with connection.cursor() as cursor:
-            cursor.execute(sql_query)
+            cursor.execute(sql_query, (simulation_id,))
             result = cursor.fetchall()         
         metrics = {}
         for direction, average_waiting_time, max_waiting_time in result:
@@ -504,58 +712,210 @@ class SimulationEngine:
 
     def start(self):
         '''
-        Run the simulation and return the metrics upon completion.
+        Run the simulation and return the metrics upon completion, along with the wall time
+        and the CPU time spent by all of the simulation's threads.
         '''
-        self.junction.start()
+        if self.mode == SimulationEngine.ASYNC:
+            return asyncio.run(self.run_async())
+        if self.vehicle_warehouse.horizon is not None:
+            self.event_log.info(ENGINE, "Simulation started in %s mode for %.0f simulated seconds.", self.mode, self.vehicle_warehouse.horizon)
+        else:
+            self.event_log.info(ENGINE, "Simulation started in %s mode with %d vehicles.", self.mode, self.vehicle_warehouse.vehicle_count)
+        monitoring.track(self)
+        if self.mode == SimulationEngine.EVENT_DRIVEN:
+            return self.run_event_driven()
+
+        started_at = time.perf_counter()
+        main_cpu_started_at = time.thread_time()
+        with self.timer.phase("thread_start"):
+            if self.writer is not None:
+                self.writer.start()
+            self.junction.start()
         try:
             # Main simulation loop
-            while not stop_event.is_set() and not self.vehicle_warehouse.is_abs_empty():
-                time.sleep(1)
+            horizon = self.vehicle_warehouse.horizon
+            with self.timer.phase("run"):
+                if horizon is not None:
+                    # Time-horizon runs end once the duration has elapsed
+                    self.stop_event.wait(max(self.junction.accumulator.start + horizon / SPEED_FACTOR - time.monotonic(), 0))
+                else:
+                    while not self.stop_event.is_set() and not self.vehicle_warehouse.is_abs_empty():
+                        self.stop_event.wait(1)
                 
             # Signal threads to stop
-            stop_event.set()
-            print("Simulation completed.")
-            print("Computing metrics...")
+            self.junction.stop()
+            ended_at = time.monotonic()
+            if horizon is not None:
+                # Every approach is measured over the same window, however late the main thread woke up
+                ended_at = min(ended_at, self.junction.accumulator.start + horizon / SPEED_FACTOR)
+            self.event_log.info(ENGINE, "Simulation completed. Computing metrics...")
             
             # Wait for threads to finish
-            for thread in self.junction.threads:
-                thread.join(timeout=5)
-                
-            # Calculate metrics
-            path_to_queries = r"queries\compute_AWT_MWT.sql"
-            metrics = SimulationEngine.compute_AWT_MWT(path_to_queries)
-            
-            # Add queue lengths to metrics
-            for dir in metrics:
-                metrics[dir]["max_queue_length"] = self.junction.max_queue_length_tracker[dir]
+            with self.timer.phase("thread_join"):
+                for thread in self.junction.threads + self.junction.worker_threads():
+                    thread.join(timeout=5)
+
+            # Metrics were accumulated while vehicles crossed, no need to read the vehicles back
+            with self.timer.phase("metrics"):
+                metrics = self.junction.accumulator.metrics(self.vehicle_warehouse.stocked_directions(), ended_at)
+
+            run_stats = {}
+            if self.writer is not None:
+                # Crossed vehicles were written during the run, add the ones left behind
+                with self.timer.phase("persistence"):
+                    self.writer.submit_many(self.vehicle_warehouse.uncrossed_vehicles())
+                    run_stats["persistence"] = self.writer.close()
+                self.event_log.info(PERSISTENCE, "Stored %d vehicles in %d flushes.", run_stats["persistence"]["rows"], run_stats["persistence"]["flushes"])
             
             # IMPORTANT: Calculate the efficiency score
-            efficiency_score = SimulationEngine.calculate_efficiency_score(metrics)
-            print(f"Efficiency Score: {efficiency_score}")
+            with self.timer.phase("scoring"):
+                efficiency_score = SimulationEngine.calculate_efficiency_score(metrics)
+            self.event_log.info(ENGINE, "Efficiency score: %s", efficiency_score)
+            wall_time = time.perf_counter() - started_at
+            self.record_throughput(metrics, wall_time)
             
             # Return BOTH metrics AND efficiency_score
             return {
                 "metrics": metrics,
-                "efficiency_score": efficiency_score
+                "efficiency_score": efficiency_score,
+                "run_stats": {
+                    "wall_time": wall_time,
+                    "cpu_time": self.junction.cpu_tracker.total + time.thread_time() - main_cpu_started_at,
+                    **run_stats,
+                }
             }
 
         except KeyboardInterrupt:
-            stop_event.set()
-            print("Simulation stopped.")
+            self.junction.stop()
+            self.event_log.warning(ENGINE, "Simulation stopped.")
         
         finally:
+            monitoring.untrack(self)
             # Wait for threads to finish if they haven't already
             for thread in self.junction.threads:
                 if thread.is_alive():
                     thread.join(timeout=2)
-            
-            Vehicle.objects.all().delete()
-            from django.db import connection
-            with connection.cursor() as cursor:
-                cursor.execute("DELETE FROM simulation_vehicle;")
-                cursor.execute("DELETE FROM sqlite_sequence WHERE name='simulation_vehicle';")
-            
-            print("Vehicle table was reset.")
+            # Don't leave the writer behind if the run was interrupted
+            if self.writer is not None and self.writer.thread is not None and self.writer.thread.is_alive():
+                self.writer.close(timeout=5)
+
+    def run_event_driven(self):
+        '''
+        Run the simulation on the discrete-event junction and return the metrics upon completion.
+        The result has the same shape as the threaded run.
+        '''
+        started_at = time.perf_counter()
+        cpu_started_at = time.thread_time()
+        try:
+            with self.timer.phase("run"):
+                metrics = self.junction.run()
+            run_stats = {}
+            if self.writer is not None:
+                with self.timer.phase("persistence"):
+                    run_stats["persistence"] = self.writer.write_all(self.vehicle_warehouse.all_vehicles())
+                self.event_log.info(PERSISTENCE, "Stored %d vehicles in %d flushes.", run_stats["persistence"]["rows"], run_stats["persistence"]["flushes"])
+            self.event_log.info(ENGINE, "Simulation completed at simulated time %.1fs, %d vehicles crossed.", self.junction.clock, self.junction.departed)
+
+            with self.timer.phase("scoring"):
+                efficiency_score = SimulationEngine.calculate_efficiency_score(metrics)
+            self.event_log.info(ENGINE, "Efficiency score: %s", efficiency_score)
+            wall_time = time.perf_counter() - started_at
+            monitoring.VEHICLES_CROSSED.labels(self.mode).inc(self.junction.departed)
+            self.record_throughput(metrics, wall_time)
+
+            return {
+                "metrics": metrics,
+                "efficiency_score": efficiency_score,
+                "run_stats": {
+                    "wall_time": wall_time,
+                    "cpu_time": time.thread_time() - cpu_started_at,
+                    **run_stats,
+                }
+            }
+        except Exception:
+            if self.persist_vehicles:
+                self.delete_vehicles()
+            raise
+        finally:
+            monitoring.untrack(self)
+
+    async def run_async(self):
+        '''
+        Run the simulation on the asyncio junction in the running event loop and return the metrics upon completion.
+        The result has the same shape as the threaded run, its CPU time only counts the steps of this simulation's coroutines.
+        '''
+        if self.vehicle_warehouse.horizon is not None:
+            self.event_log.info(ENGINE, "Simulation started in %s mode for %.0f simulated seconds.", self.mode, self.vehicle_warehouse.horizon)
+        else:
+            self.event_log.info(ENGINE, "Simulation started in %s mode with %d vehicles.", self.mode, self.vehicle_warehouse.vehicle_count)
+        monitoring.track(self)
+        started_at = time.perf_counter()
+        try:
+            if self.writer is not None:
+                self.writer.start()
+            with self.timer.phase("run"):
+                metrics = await self.junction.run()
+            self.event_log.info(ENGINE, "Simulation completed. Computing metrics...")
+
+            run_stats = {}
+            if self.writer is not None:
+                # Crossed vehicles were written during the run, add the ones left behind. Closing waits on the
+                # writer's last flush, which must not hold up the other simulations of the loop
+                with self.timer.phase("persistence"):
+                    self.writer.submit_many(self.vehicle_warehouse.uncrossed_vehicles())
+                    run_stats["persistence"] = await asyncio.to_thread(self.writer.close)
+                self.event_log.info(PERSISTENCE, "Stored %d vehicles in %d flushes.", run_stats["persistence"]["rows"], run_stats["persistence"]["flushes"])
+
+            with self.timer.phase("scoring"):
+                efficiency_score = SimulationEngine.calculate_efficiency_score(metrics)
+            self.event_log.info(ENGINE, "Efficiency score: %s", efficiency_score)
+            wall_time = time.perf_counter() - started_at
+            monitoring.VEHICLES_CROSSED.labels(self.mode).inc(self.junction.departed)
+            self.record_throughput(metrics, wall_time)
+
+            return {
+                "metrics": metrics,
+                "efficiency_score": efficiency_score,
+                "run_stats": {
+                    "wall_time": wall_time,
+                    "cpu_time": self.junction.cpu_tracker.total,
+                    **run_stats,
+                }
+            }
+        finally:
+            monitoring.untrack(self)
+            # Don't leave the writer behind if the run failed
+            if self.writer is not None and self.writer.thread is not None and self.writer.thread.is_alive():
+                self.writer.close(timeout=5)
+
+    def record_throughput(self, metrics, wall_time):
+        crossed = sum(m["vehicles_crossed"] for m in metrics.values())
+        if wall_time > 0:
+            monitoring.VEHICLES_PER_SECOND.labels(self.mode).observe(crossed / wall_time)
+
+    def wait_histograms(self):
+        '''
+        Waiting time histograms of the finished run per direction, e.g. to merge runs together.
+        '''
+        return {d: self.junction.accumulator.histogram(d) for d in self.vehicle_warehouse.stocked_directions()}
+
+    def delete_vehicles(self):
+        '''
+        Delete the vehicles of this simulation, leaving the rows of simulations running concurrently untouched.
+        '''
+        with self.timer.phase("cleanup"):
+            Vehicle.objects.filter(simulation_id=self.simulation.simulation_id).delete()
+        self.event_log.info(PERSISTENCE, "Vehicles of simulation %s were deleted.", self.simulation.simulation_id)
+
+
+def run_concurrently(engines):
+    '''
+    Run async mode engines concurrently in one event loop on the calling thread and return their results in order.
+    A run that failed has its exception in place of its result, the others carry on.
+    '''
+    async def run_all():
+        return await asyncio.gather(*(engine.run_async() for engine in engines), return_exceptions=True)
+    return asyncio.run(run_all())
 
 
 # simulation = Simulation.objects.create(
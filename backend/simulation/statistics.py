@@ -0,0 +1,305 @@
+import math
+import threading
+
+# Two-sided 95% critical values of Student's t distribution for 1 to 30 degrees of freedom
+T_CRITICAL_95 = (
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+)
+
+
+def t_critical_95(degrees_of_freedom):
+    """
+    Two-sided 95% critical value of Student's t distribution, from the table up to 30 degrees of
+    freedom and from the Cornish-Fisher expansion around the normal quantile above that.
+    """
+    if degrees_of_freedom <= len(T_CRITICAL_95):
+        return T_CRITICAL_95[degrees_of_freedom - 1]
+    z, df = 1.959964, degrees_of_freedom
+    return z + (z ** 3 + z) / (4 * df) + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+
+
+class RunningStats:
+    """
+    Mean, variance and maximum of a stream of values, updated in O(1) per value with Welford's algorithm.
+    Two instances can be merged, e.g. to combine lanes into a direction.
+    """
+    __slots__ = ("count", "mean", "m2", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.max = None
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """
+        Fold another RunningStats into this one (Chan et al. parallel update).
+        """
+        if other.count == 0:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def confidence_interval(self):
+        """
+        Mean with its 95% confidence interval, treating the values as independent samples.
+        The interval is None with fewer than two values.
+        """
+        if self.count == 0:
+            return {"mean": None, "std": None, "ci_low": None, "ci_high": None, "samples": 0}
+        std = math.sqrt(self.variance)
+        if self.count < 2:
+            low = high = None
+        else:
+            half_width = t_critical_95(self.count - 1) * std / math.sqrt(self.count)
+            low, high = self.mean - half_width, self.mean + half_width
+        return {"mean": self.mean, "std": std, "ci_low": low, "ci_high": high, "samples": self.count}
+
+
+class TimeWeightedValue:
+    """
+    Time average and maximum of a piecewise-constant value, such as a queue length.
+    """
+    __slots__ = ("value", "max", "area", "start", "last_change")
+
+    def __init__(self, start=0.0):
+        self.value = 0
+        self.max = 0
+        self.area = 0.0
+        self.start = start
+        self.last_change = start
+
+    def update(self, value, now):
+        self.area += self.value * (now - self.last_change)
+        self.last_change = now
+        self.value = value
+        if value > self.max:
+            self.max = value
+
+    def average(self, now):
+        elapsed = now - self.start
+        if elapsed <= 0:
+            return float(self.value)
+        return (self.area + self.value * (now - self.last_change)) / elapsed
+
+
+class Histogram:
+    """
+    Log-linear histogram of non-negative values in the spirit of HdrHistogram.
+
+    Values are counted in units of resolution. Below 2**precision units every unit has its own
+    bucket, above that buckets double in width every power of two so that each one spans less
+    than 2**(1 - precision) of its value. Memory therefore grows with the logarithm of the
+    largest value rather than with the number of values, and two histograms with the same
+    resolution and precision merge by adding their buckets. Each bucket also keeps the sum of its
+    values, so percentiles are reported as the mean of the bucket they fall in.
+    """
+    __slots__ = ("resolution", "precision", "buckets", "count", "min", "max")
+
+    PERCENTILES = (50, 90, 95, 99)
+
+    def __init__(self, resolution=0.01, precision=7):
+        self.resolution = resolution
+        self.precision = precision
+        self.buckets = {} # Lower bound in units -> [count, sum of values]
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def bucket(self, value):
+        units = int(value / self.resolution)
+        shift = max(units.bit_length() - self.precision, 0)
+        return (units >> shift) << shift
+
+    def add(self, value):
+        bucket = self.buckets.setdefault(self.bucket(value), [0, 0.0])
+        bucket[0] += 1
+        bucket[1] += value
+        self.count += 1
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """
+        Add the buckets of another histogram with the same resolution and precision to this one.
+        """
+        if (other.resolution, other.precision) != (self.resolution, self.precision):
+            raise ValueError("Only histograms with the same resolution and precision can be merged")
+        for key, (count, total) in other.buckets.items():
+            bucket = self.buckets.setdefault(key, [0, 0.0])
+            bucket[0] += count
+            bucket[1] += total
+        self.count += other.count
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def percentile(self, q):
+        """
+        Value below which q percent of the values fall, None if the histogram is empty.
+        """
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(q / 100 * self.count))
+        seen = 0
+        for key in sorted(self.buckets):
+            count, total = self.buckets[key]
+            seen += count
+            if seen >= rank:
+                return total / count
+        return self.max
+
+    def percentiles(self, qs=PERCENTILES):
+        return {f"p{q}": self.percentile(q) for q in qs}
+
+    def to_dict(self):
+        """
+        JSON-serializable form, e.g. to send a histogram back from another process.
+        """
+        return {
+            "resolution": self.resolution,
+            "precision": self.precision,
+            "buckets": {str(key): bucket for key, bucket in self.buckets.items()},
+            "count": self.count,
+            "min": self.min,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data["resolution"], data["precision"])
+        histogram.buckets = {int(key): list(bucket) for key, bucket in data["buckets"].items()}
+        histogram.count = data["count"]
+        histogram.min = data["min"]
+        histogram.max = data["max"]
+        return histogram
+
+
+class MetricsAccumulator:
+    """
+    Online per-direction and per-lane metrics of one simulation run.
+
+    The engine reports every arrival, every vehicle leaving its lane and every crossing, and the
+    accumulator keeps the waiting time statistics and histograms, time-averaged and maximum queue
+    lengths and throughput up to date, so the final metrics never need to look at individual vehicles again.
+
+    Times are read on the engine's clock and multiplied by time_scale, so that every duration is
+    expressed in simulated seconds (SPEED_FACTOR for the threaded engine's wall clock, 1 for the
+    discrete-event engine's virtual clock).
+    """
+
+    def __init__(self, directions, lane_count, start=0.0, time_scale=1.0):
+        self.lock = threading.Lock()
+        self.time_scale = time_scale
+        self.start = start
+        self.waits = {d: [RunningStats() for _ in range(lane_count)] for d in directions}
+        self.histograms = {d: [Histogram() for _ in range(lane_count)] for d in directions}
+        self.queues = {d: [TimeWeightedValue(start) for _ in range(lane_count)] for d in directions}
+        self.totals = {d: TimeWeightedValue(start) for d in directions} # Vehicles queued over all lanes of a direction
+
+    def restart(self, start):
+        """
+        Move the origin of the time averages to the actual start of a run built ahead of time. Nothing must be queued yet.
+        """
+        with self.lock:
+            self.start = start
+            for value in [*(queue for queues in self.queues.values() for queue in queues), *self.totals.values()]:
+                value.start = start
+                value.last_change = start
+
+    def arrived(self, direction, lane, now):
+        with self.lock:
+            queue = self.queues[direction][lane]
+            queue.update(queue.value + 1, now)
+            total = self.totals[direction]
+            total.update(total.value + 1, now)
+
+    def left_queue(self, direction, lane, now):
+        with self.lock:
+            queue = self.queues[direction][lane]
+            queue.update(queue.value - 1, now)
+            total = self.totals[direction]
+            total.update(total.value - 1, now)
+
+    def crossed(self, direction, lane, waiting_time):
+        waiting_time *= self.time_scale
+        with self.lock:
+            self.waits[direction][lane].add(waiting_time)
+            self.histograms[direction][lane].add(waiting_time)
+
+    def progress(self):
+        """
+        Vehicles crossed so far and vehicles queued right now in each direction, cheap enough to read
+        while the run goes on.
+        """
+        with self.lock:
+            return {
+                d: {"vehicles_crossed": sum(stats.count for stats in self.waits[d]), "queue_length": self.totals[d].value}
+                for d in self.waits
+            }
+
+    def histogram(self, direction):
+        """
+        Waiting time histogram of a direction, merged over its lanes.
+        """
+        with self.lock:
+            histogram = Histogram()
+            for lane_histogram in self.histograms[direction]:
+                histogram.merge(lane_histogram)
+            return histogram
+
+    def metrics(self, directions, now):
+        """
+        Metrics of the given directions at time now, in the shape stored in Simulation.metrics.
+        Waiting times are None for a direction or lane where no vehicle crossed yet.
+        """
+        histograms = {d: self.histogram(d) for d in directions}
+        with self.lock:
+            elapsed = (now - self.start) * self.time_scale
+            metrics = {}
+            for d in directions:
+                waits = RunningStats()
+                lanes = {}
+                for lane, (lane_waits, queue) in enumerate(zip(self.waits[d], self.queues[d])):
+                    waits.merge(lane_waits)
+                    lanes[str(lane)] = {
+                        "average_waiting_time": lane_waits.mean if lane_waits.count else None,
+                        "max_waiting_time": lane_waits.max,
+                        "waiting_time_percentiles": self.histograms[d][lane].percentiles(),
+                        "max_queue_length": queue.max,
+                        "average_queue_length": queue.average(now),
+                        "vehicles_crossed": lane_waits.count,
+                    }
+                metrics[d] = {
+                    "average_waiting_time": waits.mean if waits.count else None,
+                    "max_waiting_time": waits.max,
+                    "waiting_time_percentiles": histograms[d].percentiles(),
+                    "max_queue_length": max(queue.max for queue in self.queues[d]),
+                    "average_queue_length": self.totals[d].average(now),
+                    "vehicles_crossed": waits.count,
+                    "throughput": waits.count * 3600 / elapsed if elapsed > 0 else 0.0, # Vehicles per hour
+                    "lanes": lanes,
+                }
+            return metrics
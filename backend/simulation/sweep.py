@@ -0,0 +1,183 @@
+import copy
+import itertools
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .config import canonicalize_junction_config, parse_seed
+from .models import Simulation
+from .simulation_engine import SimulationEngine, TRAFFIC_LIGHT_CYCLE_TIME
+
+MAX_SWEEP_POINTS = 5000 # Largest grid a single sweep may expand to
+CYCLE_TIME = "cycleTime" # Sweep parameter for the traffic light cycle time, the others are paths into junction_config
+
+
+def parameter_values(name, spec):
+    """
+    Values taken by one sweep parameter.
+    Args:
+        name (str): Parameter name, only used in error messages.
+        spec (list | dict): Either an explicit list of values or an inclusive range
+            {"start": 100, "stop": 500, "step": 100}.
+    """
+    if isinstance(spec, list):
+        if not spec:
+            raise ValueError(f"No values given for {name}")
+        return spec
+    if isinstance(spec, dict):
+        try:
+            start, stop, step = spec["start"], spec["stop"], spec.get("step", 1)
+        except KeyError:
+            raise ValueError(f"Range of {name} needs a start and a stop")
+        if step <= 0 or stop < start:
+            raise ValueError(f"Invalid range for {name}")
+        count = math.floor((stop - start) / step + 1e-9) + 1
+        values = [start + i * step for i in range(count)]
+        return values if all(isinstance(v, int) for v in (start, stop, step)) else [round(v, 9) for v in values]
+    raise ValueError(f"Values of {name} must be a list or a range")
+
+
+def check_parameter(junction_config, name):
+    """
+    Make sure a sweep parameter refers to an existing setting, e.g. "north.inbound", "east.south",
+    "numLanes", "leftTurn" or "cycleTime".
+    """
+    if name == CYCLE_TIME:
+        return
+    node = junction_config
+    for key in name.split("."):
+        if not isinstance(node, dict) or key not in node:
+            raise ValueError(f"Unknown sweep parameter {name}")
+        node = node[key]
+    if isinstance(node, dict):
+        raise ValueError(f"Sweep parameter {name} must name a single value")
+
+
+def expand_grid(junction_config, ranges, seed=None):
+    """
+    Expand the sweep ranges into the list of points to simulate.
+    Args:
+        junction_config (dict): Base configuration, used for every parameter that is not swept.
+        ranges (dict): Parameter name -> values, see parameter_values and check_parameter.
+        seed (int): Seed of every point, DEFAULT_SEED by default, so that a sweep always gives the same table
+            and the points only differ by their parameters.
+    Returns:
+        list: One dict per point with the swept "parameters", the canonical "junction_config", the "cycle_time"
+            and the "seed". Raises ValueError naming the first invalid point.
+    """
+    if not isinstance(ranges, dict) or not ranges:
+        raise ValueError("At least one sweep parameter is required")
+    seed = parse_seed(seed)
+    junction_config = canonicalize_junction_config(junction_config)
+
+    names = list(ranges)
+    for name in names:
+        check_parameter(junction_config, name)
+    values = [parameter_values(name, ranges[name]) for name in names]
+
+    size = math.prod(len(v) for v in values)
+    if size > MAX_SWEEP_POINTS:
+        raise ValueError(f"Sweep expands to {size} points, at most {MAX_SWEEP_POINTS} are allowed")
+
+    points = []
+    for combination in itertools.product(*values):
+        parameters = dict(zip(names, combination))
+        config = copy.deepcopy(junction_config)
+        cycle_time = TRAFFIC_LIGHT_CYCLE_TIME
+        for name, value in parameters.items():
+            if name == CYCLE_TIME:
+                cycle_time = value
+                continue
+            *parents, key = name.split(".")
+            node = config
+            for parent in parents:
+                node = node[parent]
+            node[key] = value
+        try:
+            config = canonicalize_junction_config(config)
+        except ValueError as e:
+            raise ValueError(f"Point {parameters}: {e}")
+        if not isinstance(cycle_time, (int, float)) or isinstance(cycle_time, bool) or cycle_time <= 0:
+            raise ValueError("cycleTime must be positive")
+        points.append({"parameters": parameters, "junction_config": config, "cycle_time": cycle_time, "seed": seed})
+    return points
+
+
+def parse_max_workers(value):
+    """
+    Validate the pool size of a study given in a request, None for one worker per CPU core.
+    A request may not ask for more workers than the host has cores.
+    """
+    if value is None:
+        return None
+    limit = os.cpu_count() or 1
+    if isinstance(value, bool) or not isinstance(value, int) or not 1 <= value <= limit:
+        raise ValueError(f"max_workers must be an integer between 1 and {limit}")
+    return value
+
+
+def map_in_pool(function, items, max_workers=None):
+    """
+    Apply a top-level function to every item across a process pool, keeping the order of the items.
+    Args:
+        max_workers (int): Size of the pool, the number of CPU cores by default. With a single
+            worker the items are processed in this process.
+    Returns:
+        tuple: The results and the number of workers used.
+    """
+    workers = max(1, min(max_workers or os.cpu_count() or 1, len(items)))
+    if workers == 1:
+        return [function(item) for item in items], workers
+
+    # Hand out several items per task so that short runs don't drown in inter-process overhead
+    chunksize = max(1, len(items) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(function, items, chunksize=chunksize)), workers
+
+
+def run_point(point):
+    """
+    Simulate one point of a sweep. Runs in a pool worker, so nothing is written to the database.
+    """
+    simulation = Simulation(simulation_status="running", junction_config=point["junction_config"])
+    try:
+        engine = SimulationEngine(simulation, traffic_light_cycle_time=point["cycle_time"], mode=SimulationEngine.EVENT_DRIVEN, seed=point["seed"])
+        results = engine.start()
+    except Exception as e:
+        return {"parameters": point["parameters"], "efficiency_score": None, "metrics": None, "error": str(e)}
+    return {
+        "parameters": point["parameters"],
+        "efficiency_score": results["efficiency_score"],
+        "metrics": results["metrics"],
+    }
+
+
+def run_sweep(junction_config, ranges, max_workers=None, seed=None):
+    """
+    Simulate every point of a sweep across a process pool and rank them by efficiency score.
+    Args:
+        junction_config (dict): Base junction configuration.
+        ranges (dict): Swept parameters, see expand_grid.
+        max_workers (int): Size of the process pool, the number of CPU cores by default.
+        seed (int): Seed of every point, DEFAULT_SEED by default.
+    Returns:
+        dict: "table" with one row per point, best efficiency score first, and "run_stats".
+    """
+    started_at = time.perf_counter()
+    points = expand_grid(junction_config, ranges, seed)
+    rows, workers = map_in_pool(run_point, points, max_workers)
+
+    # Failed points go last
+    rows.sort(key=lambda row: row["efficiency_score"] if row["efficiency_score"] is not None else -1, reverse=True)
+    for rank, row in enumerate(rows, start=1):
+        row["rank"] = rank
+
+    return {
+        "table": rows,
+        "run_stats": {
+            "points": len(points),
+            "workers": workers,
+            "wall_time": time.perf_counter() - started_at,
+        },
+    }
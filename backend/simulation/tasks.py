@@ -2,8 +2,18 @@
 from celery import shared_task
 import time
 
-from .models import Simulation
-from .simulation_engine import SimulationEngine
+from .models import Simulation, SimulationStudy
+from .simulation_engine import SimulationEngine, TRAFFIC_LIGHT_CYCLE_TIME
+from .cache import store_result
+from .config import DEFAULT_SEED
+from .event_log import ENGINE
+from .timing import PhaseTimer
+from . import monitoring
+from .progress import ProgressReporter, COMPLETED, FAILED
+from .sweep import run_sweep
+from .replications import run_replications
+from .network import run_network
+from .signal_timing import optimize_signal_timing
 
 @shared_task
 def my_background_task():
@@ -11,28 +21,131 @@ def my_background_task():
     return "Task completed in the background."
 
 @shared_task
-def run_simulation(simulation_id):
+def run_simulation(simulation_id, enqueued_at=None):
+    '''
+    Run a simulation and store its results, together with the time spent in each phase of the run.
+    enqueued_at is the time.time() at which the task was queued, to measure how long it waited for a worker.
+    '''
+    timer = PhaseTimer()
+    monitoring.REGISTRY.start()
+    monitoring.SIMULATIONS.labels("started").inc()
+    if enqueued_at is not None:
+        # The worker may run on another host, so the queue wait is measured on the wall clock
+        timer.record("queue_wait", max(time.time() - enqueued_at, 0.0))
+        monitoring.QUEUE_WAIT.observe(timer.phases["queue_wait"])
+
     # Get the simulation instance
     try:
-        simulation = Simulation.objects.get(simulation_id=simulation_id)
+        with timer.phase("load"):
+            simulation = Simulation.objects.get(simulation_id=simulation_id)
     except Simulation.DoesNotExist:
         raise Exception("Simulation not found")
     
     # Create an instance of the simulation engine
+    engine = None
+    reporter = None
     try:
-        engine = SimulationEngine(simulation)
+        seed = simulation.seed if simulation.seed is not None else DEFAULT_SEED
+        engine = SimulationEngine(simulation, mode=SimulationEngine.EVENT_DRIVEN, seed=seed, timer=timer)
+        reporter = ProgressReporter(engine, simulation_id).start()
         
         # Run the simulation
         results = engine.start()
+        with timer.phase("cache_store"):
+            store_result(simulation.junction_config, seed, results)
         simulation.metrics = results.get("metrics", {})
         simulation.efficiency_score = results.get("efficiency_score", None)
+        simulation.run_stats = results.get("run_stats")
+        simulation.events = engine.event_log.records()
+        simulation.timings = timer.as_dict()
         simulation.simulation_status = "completed"
         simulation.save()
+        reporter.close(COMPLETED, efficiency_score=simulation.efficiency_score)
+        monitoring.SIMULATIONS.labels("completed").inc()
+        monitoring.SIMULATION_DURATION.observe(timer.elapsed())
         
         return results
     except Exception as e:
-        print(e)
+        if engine is not None:
+            engine.event_log.error(ENGINE, "Simulation failed: %s", e)
+            simulation.events = engine.event_log.records()
+        else:
+            simulation.events = [{"time": time.time(), "level": "ERROR", "category": ENGINE, "message": f"Simulation failed: {e}"}]
+        simulation.timings = timer.as_dict()
         simulation.simulation_status = "failed"
         simulation.save()
+        if reporter is not None:
+            reporter.close(FAILED, error=str(e))
+        monitoring.SIMULATIONS.labels("failed").inc()
+        monitoring.SIMULATION_DURATION.observe(timer.elapsed())
         return "Simulation failed"
 
+
+
+def run_study(study_id, runner):
+    '''
+    Run a study with runner(parameters), which returns the study's results and their run_stats.
+    '''
+    try:
+        study = SimulationStudy.objects.get(study_id=study_id)
+    except SimulationStudy.DoesNotExist:
+        raise Exception("Study not found")
+
+    try:
+        results, run_stats = runner(study.parameters)
+        study.results = results
+        study.run_stats = run_stats
+        study.study_status = "completed"
+        study.save()
+
+        return run_stats
+    except Exception as e:
+        study.run_stats = {"error": str(e)}
+        study.study_status = "failed"
+        study.save()
+        return "Study failed"
+
+@shared_task
+def run_sweep_study(study_id):
+    def runner(parameters):
+        results = run_sweep(parameters["junction_config"], parameters["ranges"], parameters.get("max_workers"), seed=parameters.get("seed"))
+        return results["table"], results["run_stats"]
+    return run_study(study_id, runner)
+
+@shared_task
+def run_replications_study(study_id):
+    def runner(parameters):
+        results = run_replications(
+            parameters["junction_config"],
+            parameters["replications"],
+            seed=parameters.get("seed"),
+            cycle_time=parameters.get("cycleTime", TRAFFIC_LIGHT_CYCLE_TIME),
+            max_workers=parameters.get("max_workers"),
+        )
+        run_stats = results.pop("run_stats")
+        return results, run_stats
+    return run_study(study_id, runner)
+
+@shared_task
+def run_network_study(study_id):
+    def runner(parameters):
+        results = run_network(parameters, parameters.get("max_workers"))
+        run_stats = results.pop("run_stats")
+        return results, run_stats
+    return run_study(study_id, runner)
+
+@shared_task
+def run_signal_timing_study(study_id):
+    def runner(parameters):
+        results = optimize_signal_timing(
+            parameters["junction_config"],
+            cycle_range=parameters["cycleRange"],
+            split_range=parameters["splitRange"],
+            replications=parameters["replications"],
+            max_evaluations=parameters["maxEvaluations"],
+            seed=parameters.get("seed"),
+            max_workers=parameters.get("max_workers"),
+        )
+        run_stats = results.pop("run_stats")
+        return results, run_stats
+    return run_study(study_id, runner)
@@ -1,5 +1,5 @@
 import unittest
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 from django.utils import timezone
 from datetime import timedelta
 import time
@@ -8,7 +8,8 @@ import tempfile
 import os
 
 from .simulation_engine import SimulationEngine, VehiclesWarehouse, TrafficLight, Dequeuer
-from .models import Simulation, Vehicle, Queue
+from .models import Simulation, SimulationStudy, CachedSimulationResult, Vehicle, Queue
+from .vehicles import SimVehicle, DIRECTION_CODES
 
 class TestVehicleWarehouse(TestCase):
     """Tests for the VehiclesWarehouse class"""
@@ -45,6 +46,34 @@ class TestVehicleWarehouse(TestCase):
         self.assertAlmostEqual(destinations["south"] / total, 0.4, delta=0.15)
         self.assertAlmostEqual(destinations["west"] / total, 0.2, delta=0.15)
     
+    def test_generation_does_not_touch_database(self):
+        """Test that stocking the warehouse builds vehicles in memory only"""
+        with self.assertNumQueries(0):
+            warehouse = VehiclesWarehouse(self.junction_config, num_vehicle=100)
+        self.assertEqual(Vehicle.objects.count(), 0)
+        self.assertGreater(warehouse.vehicle_count, 0)
+
+    def test_vectorized_fleet(self):
+        """Test that a large fleet is generated as compact arrays honoring the lane rules"""
+        from .vehicles import generate_fleet, DIRECTION_CODES
+        self.junction_config["leftTurn"] = True
+        self.junction_config["numLanes"] = 3
+
+        fleet = generate_fleet(self.junction_config, "north", 100_000)
+
+        self.assertEqual(len(fleet), 100_000)
+        for array in (fleet.incoming_dir, fleet.exit_dir, fleet.turn, fleet.incoming_lane, fleet.exit_lane):
+            self.assertEqual(array.dtype.itemsize, 1)
+        self.assertTrue((fleet.incoming_lane[fleet.turn == Vehicle.TURNING_LEFT] == 0).all())
+        self.assertTrue((fleet.incoming_lane[fleet.turn == Vehicle.TURNING_RIGHT] == 2).all())
+        self.assertTrue((fleet.incoming_lane[fleet.turn == Vehicle.GOING_STRAIGHT] >= 1).all())
+        self.assertTrue(((fleet.incoming_lane + fleet.exit_lane) == 2).all())
+        self.assertAlmostEqual((fleet.exit_dir == DIRECTION_CODES["west"]).mean(), 0.2, places=2)
+
+        vehicle = fleet.pop()
+        self.assertEqual(vehicle.incoming_direction, "north")
+        self.assertEqual(len(fleet), 99_999)
+
     def test_lane_assignment(self):
         """Test that vehicles are assigned to the correct lanes based on turn direction"""
         # Set leftTurn to True for this test
@@ -116,10 +145,12 @@ class TestMetricsCalculation(TestCase):
     def create_test_vehicles(self):
         """Create vehicles with predetermined waiting times"""
         base_time = timezone.now()
+        self.simulation = Simulation.objects.create(simulation_status="running", junction_config={})
         
         # North direction vehicles - 5s, 10s, 15s wait times
         for i, wait_time in enumerate([5, 10, 15]):
             vehicle = Vehicle.objects.create(
+                simulation=self.simulation,
                 incoming_direction="north",
                 exit_direction="south",
                 arrival_time=base_time - timedelta(seconds=wait_time),
@@ -130,6 +161,7 @@ class TestMetricsCalculation(TestCase):
         # South direction vehicles - 2s, 4s, 20s wait times
         for i, wait_time in enumerate([2, 4, 20]):
             vehicle = Vehicle.objects.create(
+                simulation=self.simulation,
                 incoming_direction="south",
                 exit_direction="north", 
                 arrival_time=base_time - timedelta(seconds=wait_time),
@@ -140,6 +172,7 @@ class TestMetricsCalculation(TestCase):
         # East direction vehicles - 3s, 12s wait times
         for i, wait_time in enumerate([3, 12]):
             vehicle = Vehicle.objects.create(
+                simulation=self.simulation,
                 incoming_direction="east",
                 exit_direction="west",
                 arrival_time=base_time - timedelta(seconds=wait_time),
@@ -154,13 +187,14 @@ class TestMetricsCalculation(TestCase):
             f.write("""
             SELECT incoming_direction, avg(waiting_time) AS avg_waiting_time, max(waiting_time) AS max_waiting_time
             FROM simulation_vehicle
+            WHERE simulation_id = %s
             GROUP BY incoming_direction
             """)
             temp_file_path = f.name
         
         try:
             # Calculate metrics
-            metrics = SimulationEngine.compute_AWT_MWT(temp_file_path)
+            metrics = SimulationEngine.compute_AWT_MWT(self.simulation.simulation_id, temp_file_path)
             
             # Check north direction metrics
             self.assertIn("north", metrics)
@@ -181,6 +215,48 @@ class TestMetricsCalculation(TestCase):
 
 
 
+class TestPerSimulationVehicles(TestCase):
+    """Tests for scoping vehicle rows, metrics and cleanup to one simulation"""
+
+    def setUp(self):
+        self.junction_config = {
+            "north": {"inbound": 300, "east": 100, "south": 100, "west": 100},
+            "east": {"inbound": 300, "north": 100, "south": 100, "west": 100},
+            "south": {"inbound": 300, "north": 100, "east": 100, "west": 100},
+            "west": {"inbound": 300, "north": 100, "east": 100, "south": 100},
+            "leftTurn": False,
+            "numLanes": 2
+        }
+        self.first = Simulation.objects.create(simulation_status="running", junction_config=self.junction_config)
+        self.second = Simulation.objects.create(simulation_status="running", junction_config=self.junction_config)
+
+        base_time = timezone.now()
+        for simulation, wait_time in [(self.first, 5), (self.second, 50)]:
+            Vehicle.objects.create(
+                simulation=simulation,
+                incoming_direction="north",
+                exit_direction="south",
+                arrival_time=base_time - timedelta(seconds=wait_time),
+                departure_time=base_time,
+            )
+
+    def test_metrics_are_scoped(self):
+        """Test that the metrics query only reads the vehicles of the requested simulation"""
+        metrics = SimulationEngine.compute_AWT_MWT(self.first.simulation_id)
+
+        # The query scales real seconds by the speed factor
+        self.assertAlmostEqual(metrics["north"]["max_waiting_time"], 5 * 20, places=2)
+
+    def test_cleanup_is_scoped(self):
+        """Test that an engine only deletes the vehicles of its own simulation"""
+        engine = SimulationEngine(self.first, mode=SimulationEngine.EVENT_DRIVEN)
+        engine.delete_vehicles()
+
+        self.assertFalse(Vehicle.objects.filter(simulation=self.first).exists())
+        self.assertEqual(Vehicle.objects.filter(simulation=self.second).count(), 1)
+        self.assertIsNot(engine.stop_event, SimulationEngine(self.second).stop_event)
+
+
 class TestDequeuer(TestCase):
     """Tests for the Dequeuer class"""
     
@@ -235,15 +311,10 @@ class TestDequeuer(TestCase):
             }
         }
         
-        self.max_queue_length_tracker = {
-            "north": 0, "south": 0, "east": 0, "west": 0
-        }
-        
         self.traffic_light = TrafficLight()
         self.dequeuer = Dequeuer(
             self.traffic_dict, 
             self.locks_dict,
-            self.max_queue_length_tracker,
             self.junction_config,
             self.traffic_light,
             crossing_time=0.001  # Fast crossing for tests
@@ -255,61 +326,72 @@ class TestDequeuer(TestCase):
         self.assertEqual(self.dequeuer.get_opposite_direction("south"), "north")
         self.assertEqual(self.dequeuer.get_opposite_direction("east"), "west")
         self.assertEqual(self.dequeuer.get_opposite_direction("west"), "east")
-    
-    def test_queue_length_tracking(self):
-        """Test that max queue length is tracked correctly"""
-        # Override save to prevent database operations
-        original_save = Vehicle.save
-        Vehicle.save = lambda self: None
-        
-        try:
-            # Create some vehicles
-            vehicle1 = Vehicle.objects.create(
-                incoming_direction="north",
-                exit_direction="south",
-                incoming_lane=0,
-                exit_lane=0
-            )
-            vehicle2 = Vehicle.objects.create(
-                incoming_direction="north",
-                exit_direction="east",
-                incoming_lane=0,
-                exit_lane=1
-            )
-            
-            # Add vehicles to queues
-            self.traffic_dict["north"]["incoming"][0].put(vehicle1)
-            self.traffic_dict["north"]["incoming"][0].put(vehicle2)
-            
-            # Check initial max queue length
-            self.assertEqual(self.max_queue_length_tracker["north"], 0)
-            
-            # Manually set traffic light state to stop north traffic
-            self.traffic_light.NS_traffic = False
-            self.traffic_light.EW_traffic = True
-            
-            # Run dequeue logic for a brief period
-            dequeue_thread = threading.Thread(
-                target=self.dequeuer.dequeue_vehicles,
-                args=("north",)
-            )
-            dequeue_thread.daemon = True
-            dequeue_thread.start()
-            time.sleep(0.1)  # Let it run briefly
-            
-            # Signal to stop
-            from simulation.simulation_engine import stop_event
-            stop_event.set()
-            dequeue_thread.join(timeout=1)
-            
-            # Check that max_queue_length was updated
-            self.assertEqual(self.max_queue_length_tracker["north"], 2)
-            
-        finally:
-            # Restore the original save method
-            Vehicle.save = original_save
-            # Clean up
-            stop_event.clear()
+
+
+class TestEventDrivenDequeuer(TestCase):
+    """Tests for dequeuer threads blocking on the junction signal instead of spinning"""
+
+    def setUp(self):
+        from queue import Queue as PyQueue
+        from .simulation_engine import JunctionSignal, CpuTimeTracker
+
+        self.traffic_dict = {
+            d: {"incoming": [PyQueue() for _ in range(2)], "exiting": [PyQueue() for _ in range(2)]}
+            for d in ["north", "south", "east", "west"]
+        }
+        self.locks_dict = {
+            d: {"incoming": [threading.Lock() for _ in range(2)], "exiting": [threading.Lock() for _ in range(2)]}
+            for d in ["north", "south", "east", "west"]
+        }
+        self.stop_event = threading.Event()
+        self.signal = JunctionSignal()
+        self.cpu_tracker = CpuTimeTracker()
+        self.traffic_light = TrafficLight(stop_event=self.stop_event, signal=self.signal)
+        self.dequeuer = Dequeuer(
+            self.traffic_dict,
+            self.locks_dict,
+            {"leftTurn": False, "numLanes": 2},
+            self.traffic_light,
+            crossing_time=0.001,
+            stop_event=self.stop_event,
+            signal=self.signal,
+            cpu_tracker=self.cpu_tracker,
+        )
+
+    def tearDown(self):
+        self.stop_event.set()
+        self.signal.notify()
+        for thread in self.dequeuer.threads:
+            thread.join(timeout=1)
+
+    def test_idle_dequeuers_do_not_spin(self):
+        """Test that dequeuers with empty lanes barely use any CPU"""
+        self.dequeuer.start()
+        time.sleep(0.3)
+        self.stop_event.set()
+        self.signal.notify()
+        for thread in self.dequeuer.threads:
+            thread.join(timeout=1)
+            self.assertFalse(thread.is_alive())
+
+        self.assertLess(self.cpu_tracker.total, 0.1)
+
+    def test_wakes_up_on_arrival(self):
+        """Test that a waiting dequeuer lets a vehicle cross as soon as it is signalled"""
+        self.dequeuer.start()
+        time.sleep(0.05)
+
+        vehicle = SimVehicle(1, DIRECTION_CODES["north"], DIRECTION_CODES["south"], 0, 1)
+        vehicle.arrival_time = time.monotonic()
+        self.traffic_dict["north"]["incoming"][0].put(vehicle)
+        self.signal.notify("north")
+
+        exit_lane = self.traffic_dict["south"]["exiting"][1]
+        deadline = time.monotonic() + 0.3 # Shorter than the idle timeout of the dequeuers
+        while exit_lane.empty() and time.monotonic() < deadline:
+            time.sleep(0.005)
+        self.assertEqual(exit_lane.qsize(), 1)
+        self.assertIsNotNone(vehicle.departure_time)
 
 
 class TestJunction(TestCase):
@@ -338,7 +420,6 @@ class TestJunction(TestCase):
         # Check that all components are initialized
         self.assertIsNotNone(junction.traffic_dict)
         self.assertIsNotNone(junction.locks_dict)
-        self.assertIsNotNone(junction.max_queue_length_tracker)
         self.assertIsNotNone(junction.traffic_light)
         self.assertIsNotNone(junction.enqueuer)
         self.assertIsNotNone(junction.dequeuer)
@@ -696,4 +777,1698 @@ class TestEdgeCases(TestCase):
         # Check that only north direction has vehicles
         self.assertTrue(len(warehouse.warehouse["north"]) > 0)
         for direction in ["east", "south", "west"]:
-            self.assertEqual(len(warehouse.warehouse[direction]), 0)
\ No newline at end of file
+            self.assertEqual(len(warehouse.warehouse[direction]), 0)
+
+class TestEventDrivenEngine(TestCase):
+    """Tests for the discrete-event simulation mode"""
+
+    def setUp(self):
+        self.junction_config = {
+            "north": {"inbound": 300, "east": 100, "south": 100, "west": 100},
+            "east": {"inbound": 300, "north": 100, "south": 100, "west": 100},
+            "south": {"inbound": 300, "north": 100, "east": 100, "west": 100},
+            "west": {"inbound": 300, "north": 100, "east": 100, "south": 100},
+            "leftTurn": True,
+            "numLanes": 2
+        }
+        self.simulation = Simulation.objects.create(
+            simulation_status="not_started",
+            junction_config=self.junction_config
+        )
+
+    def test_event_driven_run(self):
+        """Test that an event-driven run completes quickly with the usual result shape"""
+        engine = SimulationEngine(self.simulation, mode=SimulationEngine.EVENT_DRIVEN)
+
+        started = time.perf_counter()
+        result = engine.start()
+        self.assertLess(time.perf_counter() - started, 5)
+
+        for direction in ["north", "east", "south", "west"]:
+            self.assertIn(direction, result["metrics"])
+            self.assertIn("average_waiting_time", result["metrics"][direction])
+            self.assertIn("max_waiting_time", result["metrics"][direction])
+            self.assertIn("max_queue_length", result["metrics"][direction])
+        self.assertGreaterEqual(result["efficiency_score"], 0)
+        self.assertLessEqual(result["efficiency_score"], 100)
+        self.assertGreater(engine.junction.departed, 0)
+        # Metrics come from the accumulators, no vehicle rows are written by default
+        self.assertFalse(Vehicle.objects.filter(simulation=self.simulation).exists())
+
+    def test_persist_vehicles(self):
+        """Test that the vehicles of a run can still be kept for inspection"""
+        engine = SimulationEngine(self.simulation, mode=SimulationEngine.EVENT_DRIVEN, persist_vehicles=True)
+        result = engine.start()
+
+        self.assertEqual(Vehicle.objects.filter(simulation=self.simulation).count(), engine.vehicle_warehouse.vehicle_count)
+        self.assertEqual(result["run_stats"]["persistence"]["rows"], engine.vehicle_warehouse.vehicle_count)
+
+    def test_deleting_a_simulation_deletes_its_vehicles(self):
+        """Test that the vehicles persisted by a run are removed with their simulation, and only those"""
+        from django.test import Client
+
+        other = Simulation.objects.create(simulation_status="running", junction_config=self.simulation.junction_config)
+        for simulation in (self.simulation, other):
+            SimulationEngine(simulation, mode=SimulationEngine.EVENT_DRIVEN, persist_vehicles=True, seed=1).start()
+
+        response = Client().delete(f'/simulation/delete-simulation/?simulation_id={self.simulation.simulation_id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Vehicle.objects.filter(simulation=self.simulation).exists())
+        self.assertTrue(Vehicle.objects.filter(simulation=other).exists())
+
+    def test_right_turn_yields_to_opposite_straight(self):
+        """Test that a right-turning vehicle waits for straight-going vehicles from the opposite direction"""
+        from .event_engine import DiscreteEventJunction
+
+        empty_config = {d: {"inbound": 0} for d in ["north", "east", "south", "west"]}
+        empty_config.update({"leftTurn": False, "numLanes": 2})
+        junction = DiscreteEventJunction(empty_config, VehiclesWarehouse(empty_config), phase_duration=60)
+
+        turning_right = SimVehicle(1, DIRECTION_CODES["north"], DIRECTION_CODES["west"], incoming_lane=1, exit_lane=0)
+        straight = SimVehicle(2, DIRECTION_CODES["south"], DIRECTION_CODES["north"], incoming_lane=0, exit_lane=1)
+        for vehicle in (turning_right, straight):
+            vehicle.arrival_time = 0.0
+            junction.lanes[vehicle.incoming_direction][vehicle.incoming_lane].append(vehicle)
+
+        junction.on_dispatch("north")
+
+        # The straight-going vehicle was let through first, the right-turning one is still queued
+        self.assertFalse(junction.lanes["south"][0])
+        self.assertEqual(list(junction.lanes["north"][1]), [turning_right])
+
+
+class TestAsyncEngine(TestCase):
+    """Tests for the asyncio simulation mode"""
+
+    def setUp(self):
+        self.junction_config = {
+            "north": {"inbound": 3600, "east": 1200, "south": 1200, "west": 1200},
+            "east": {"inbound": 3600, "north": 1200, "south": 1200, "west": 1200},
+            "south": {"inbound": 3600, "north": 1200, "east": 1200, "west": 1200},
+            "west": {"inbound": 3600, "north": 1200, "east": 1200, "south": 1200},
+            "leftTurn": False,
+            "numLanes": 2
+        }
+
+    def make_engine(self, mode=SimulationEngine.ASYNC):
+        simulation = Simulation(simulation_status="running", junction_config=self.junction_config)
+        return SimulationEngine(simulation, traffic_light_cycle_time=0.25, mode=mode, seed=1, num_vehicle=10)
+
+    def test_async_run(self):
+        """Test that an async run has the result shape of the other modes"""
+        engine = self.make_engine()
+        result = engine.start()
+        expected = self.make_engine(SimulationEngine.EVENT_DRIVEN).start()
+
+        self.assertEqual(set(result["metrics"]), set(expected["metrics"]))
+        for direction, metrics in result["metrics"].items():
+            self.assertEqual(set(metrics), set(expected["metrics"][direction]))
+        self.assertGreater(engine.junction.departed, 0)
+        self.assertGreater(result["run_stats"]["cpu_time"], 0)
+        self.assertLessEqual(result["run_stats"]["cpu_time"], result["run_stats"]["wall_time"])
+
+    def test_run_concurrently(self):
+        """Test that one event loop runs many simulations at once and that a failed run does not stop the others"""
+        from .simulation_engine import run_concurrently
+
+        async def broken_light():
+            raise RuntimeError("broken light")
+
+        engines = [self.make_engine() for _ in range(20)]
+        engines[0].junction.traffic_light = broken_light
+        started = time.perf_counter()
+        results = run_concurrently(engines)
+        elapsed = time.perf_counter() - started
+
+        self.assertIsInstance(results[0], RuntimeError)
+        for result in results[1:]:
+            self.assertEqual(set(result["metrics"]), {"north", "east", "south", "west"})
+        # The runs overlapped instead of running one after the other
+        self.assertLess(elapsed, sum(result["run_stats"]["wall_time"] for result in results[1:]) / 4)
+
+    def test_clock_starts_with_the_run(self):
+        """Test that an engine built ahead of its run measures from the start of the run, not from its construction"""
+        self.junction_config = {**self.junction_config, "duration": 20}
+        engine = self.make_engine()
+        time.sleep(0.5)
+        started_at = time.monotonic()
+        result = engine.start()
+
+        accumulator = engine.junction.accumulator
+        self.assertGreaterEqual(accumulator.start, started_at)
+        self.assertTrue(all(queue.start == accumulator.start for queues in accumulator.queues.values() for queue in queues))
+        # 20 simulated seconds at 3600 vehicles per hour: about 20 arrivals per approach, not a backlog of 30 more
+        arrived = engine.vehicle_warehouse.vehicle_count
+        self.assertLess(arrived, 4 * 25)
+        self.assertEqual(set(result["metrics"]), {"north", "east", "south", "west"})
+
+    def test_step_cpu_tracker(self):
+        """Test that only the steps of a tracked coroutine are counted and that cancelling reaches the coroutine"""
+        import asyncio
+        from .async_engine import StepCpuTracker
+
+        tracker = StepCpuTracker()
+        cancelled = []
+
+        async def busy():
+            deadline = time.thread_time() + 0.05
+            while time.thread_time() < deadline:
+                pass
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def main():
+            task = asyncio.create_task(tracker.run(busy()))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(main())
+        self.assertEqual(cancelled, [True])
+        self.assertGreaterEqual(tracker.total, 0.05)
+        self.assertLess(tracker.total, 0.5)
+
+
+class TestArrivalStream(TestCase):
+    """Tests for lazy arrival streams and time-horizon runs"""
+
+    def setUp(self):
+        self.junction_config = {
+            "north": {"inbound": 360, "east": 120, "south": 120, "west": 120},
+            "east": {"inbound": 360, "north": 120, "south": 120, "west": 120},
+            "south": {"inbound": 360, "north": 120, "east": 120, "west": 120},
+            "west": {"inbound": 360, "north": 120, "east": 120, "south": 120},
+            "leftTurn": False,
+            "numLanes": 2
+        }
+
+    def make_engine(self, seed=5, **settings):
+        simulation = Simulation(simulation_status="running", junction_config={**self.junction_config, **settings})
+        return SimulationEngine(simulation, mode=SimulationEngine.EVENT_DRIVEN, seed=seed)
+
+    def test_stream_headways(self):
+        """Test that chunked streams keep the headways of their arrival process across chunks"""
+        import numpy as np
+        from itertools import islice
+        from .arrivals import arrival_stream
+
+        deterministic = list(islice(arrival_stream(self.junction_config, "north", process="deterministic", chunk=64), 200))
+        self.assertEqual([t for t, _ in deterministic], [10.0 * k for k in range(1, 201)])
+        self.assertEqual([vehicle.id for _, vehicle in deterministic], list(range(1, 201)))
+
+        poisson = [t for t, _ in islice(arrival_stream(self.junction_config, "north", np.random.default_rng(1), "poisson", chunk=64), 4000)]
+        headways = np.diff([0.0] + poisson)
+        self.assertTrue((headways > 0).all())
+        self.assertAlmostEqual(headways.mean(), 10.0, delta=0.5)
+        self.assertAlmostEqual(headways.std(), 10.0, delta=1.0)
+
+    def test_stream_exit_shares(self):
+        """Test that every exit keeps its share of the flows, even one too small to get a vehicle in a rounded chunk"""
+        import numpy as np
+        from collections import Counter
+        from itertools import islice
+        from .arrivals import arrival_stream
+
+        config = {**self.junction_config, "north": {"inbound": 360, "east": 357, "south": 2, "west": 1}}
+        vehicles = [vehicle for _, vehicle in islice(arrival_stream(config, "north", np.random.default_rng(3), chunk=16), 36000)]
+        counts = Counter(vehicle.exit_direction for vehicle in vehicles)
+        self.assertAlmostEqual(counts["south"], 200, delta=60)
+        self.assertAlmostEqual(counts["west"], 100, delta=40)
+        self.assertEqual(counts["east"] + counts["south"] + counts["west"], 36000)
+
+    def test_stream_memory(self):
+        """Test that consuming a long stream doesn't grow memory"""
+        import tracemalloc
+        from .arrivals import arrival_stream
+
+        stream = arrival_stream(self.junction_config, "north", process="poisson")
+        tracemalloc.start()
+        try:
+            for _ in range(20000):
+                next(stream)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertLess(peak, 200 * 1024)
+
+    def test_horizon_run(self):
+        """Test that a time-horizon run measures every approach over the whole duration"""
+        engine = self.make_engine(arrivals="poisson", duration=7200)
+        result = engine.start()
+
+        self.assertEqual(engine.junction.clock, 7200)
+        self.assertEqual(set(result["metrics"]), {"north", "east", "south", "west"})
+        # About 720 arrivals per approach, far more than the 50 vehicles of a warehouse
+        for metrics in result["metrics"].values():
+            self.assertGreater(metrics["vehicles_crossed"], 500)
+        self.assertEqual(self.make_engine(arrivals="poisson", duration=7200).start()["metrics"], result["metrics"])
+        self.assertNotEqual(self.make_engine(arrivals="deterministic", duration=7200).start()["metrics"], result["metrics"])
+
+    def test_horizon_settings(self):
+        """Test that arrivals and duration are canonicalized together and only when given"""
+        from .config import canonicalize_junction_config, config_hash
+
+        plain = canonicalize_junction_config(self.junction_config)
+        self.assertNotIn("arrivals", plain)
+        self.assertNotIn("duration", plain)
+        canonical = canonicalize_junction_config({**self.junction_config, "arrivals": "poisson"})
+        self.assertEqual((canonical["arrivals"], canonical["duration"]), ("poisson", 3600))
+        self.assertNotEqual(config_hash(canonical), config_hash(plain))
+
+        for settings in ({"arrivals": "bursty"}, {"duration": 0}, {"duration": "long"}):
+            with self.assertRaises(ValueError):
+                canonicalize_junction_config({**self.junction_config, **settings})
+        simulation = Simulation(simulation_status="running", junction_config={**self.junction_config, "duration": 60})
+        with self.assertRaises(ValueError):
+            SimulationEngine(simulation, mode=SimulationEngine.EVENT_DRIVEN, persist_vehicles=True)
+
+
+class TestNetwork(TestCase):
+    """Tests for the multi-junction road network"""
+
+    def setUp(self):
+        config = {
+            "north": {"inbound": 600, "east": 200, "south": 200, "west": 200},
+            "east": {"inbound": 600, "north": 200, "south": 200, "west": 200},
+            "south": {"inbound": 600, "north": 200, "east": 200, "west": 200},
+            "west": {"inbound": 600, "north": 200, "east": 200, "south": 200},
+            "leftTurn": False,
+            "numLanes": 2
+        }
+        # A corridor of three junctions linked both ways
+        names = ["A", "B", "C"]
+        links = []
+        for upstream, downstream in zip(names, names[1:]):
+            links.append({"from": upstream, "exit": "east", "to": downstream, "approach": "west", "delay": 30})
+            links.append({"from": downstream, "exit": "west", "to": upstream, "approach": "east", "delay": 30})
+        self.network = {"junctions": {name: config for name in names}, "links": links, "duration": 1800, "seed": 5}
+
+    def test_corridor(self):
+        """Test that vehicles travel along the links and that every vehicle is accounted for"""
+        from .network import run_network
+
+        result = run_network(self.network, max_workers=1)
+        network = result["network"]
+        self.assertEqual(list(result["junctions"]), ["A", "B", "C"])
+        self.assertEqual(network["vehicles_entered"], network["vehicles_exited"] + network["vehicles_in_network"])
+        for link in network["links"]:
+            self.assertGreater(link["vehicles"], 0)
+        # The approaches fed by links only carry vehicles that crossed upstream
+        self.assertGreater(result["junctions"]["B"]["metrics"]["west"]["vehicles_crossed"], 0)
+        # A vehicle that went through two junctions spent at least one link delay in the network
+        self.assertGreaterEqual(network["max_travel_time"], 30)
+        self.assertEqual(result["run_stats"]["windows"], 1800 / 30)
+
+    def test_partitioning_gives_the_same_results(self):
+        """Test that the results do not depend on how the junctions are split across processes"""
+        from .network import run_network
+
+        single = run_network(self.network, max_workers=1)
+        partitioned = run_network(self.network, max_workers=3)
+        self.assertEqual(partitioned["run_stats"]["workers"], 3)
+        self.assertGreater(partitioned["run_stats"]["vehicles_transferred"], 0)
+        self.assertEqual(single["junctions"], partitioned["junctions"])
+        for key in ("vehicles_entered", "vehicles_exited", "links", "max_travel_time"):
+            self.assertEqual(single["network"][key], partitioned["network"][key])
+        self.assertAlmostEqual(single["network"]["average_travel_time"], partitioned["network"]["average_travel_time"])
+
+    def test_partitions_follow_links(self):
+        """Test that neighbouring junctions of a grid are kept in the same partition"""
+        from .network import partition_junctions
+
+        names = [f"{row}{column}" for row in "ab" for column in "123"]
+        links = [{"from": f"{row}{column}", "to": f"{row}{column + 1}"} for row in "ab" for column in (1, 2)]
+        self.assertEqual(partition_junctions(names, links, 2), [["a1", "a2", "a3"], ["b1", "b2", "b3"]])
+        self.assertEqual(len(partition_junctions(names, links, 10)), len(names))
+
+    def test_invalid_network(self):
+        """Test that invalid links are rejected and that a valid network starts a study"""
+        from django.test import Client
+        import copy
+        import json
+
+        for change in (
+            lambda network: network["links"].append({**network["links"][0], "to": "Z"}),
+            lambda network: network["links"].append(dict(network["links"][0])),
+            lambda network: network["links"][0].update(delay=0),
+            lambda network: network["links"][0].update(exit="up"),
+            lambda network: network.update(duration=-1),
+            lambda network: network.update(max_workers=10 ** 6),
+        ):
+            network = copy.deepcopy(self.network)
+            change(network)
+            response = Client().post('/simulation/start-network/', data=json.dumps(network), content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+        response = Client().post('/simulation/start-network/', data=json.dumps(self.network), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        study = SimulationStudy.objects.get(study_id=json.loads(response.content)["study_id"])
+        self.assertEqual(study.kind, SimulationStudy.NETWORK)
+        self.assertEqual(len(study.parameters["links"]), 4)
+
+
+class TestSignalTiming(TestCase):
+    """Tests for the green split and the signal timing search"""
+
+    def setUp(self):
+        self.junction_config = {
+            "north": {"inbound": 900, "east": 200, "south": 700},
+            "east": {"inbound": 200, "south": 50, "west": 150},
+            "south": {"inbound": 900, "north": 700, "west": 200},
+            "west": {"inbound": 200, "north": 50, "east": 150},
+            "leftTurn": False,
+            "numLanes": 2
+        }
+
+    def test_green_split(self):
+        """Test that the green split shares each cycle between the phases and that an even split changes nothing"""
+        from .event_engine import DiscreteEventJunction
+
+        junction = DiscreteEventJunction(self.junction_config, None, phase_duration=30, green_split=0.75)
+        self.assertEqual(junction.phase_length(), 45)
+        junction.NS_traffic = False
+        self.assertEqual(junction.phase_length(), 15)
+
+        results = []
+        for settings in ({}, {"green_split": 0.5}, {"green_split": 0.8}):
+            simulation = Simulation(simulation_status="running", junction_config=self.junction_config)
+            results.append(SimulationEngine(simulation, mode=SimulationEngine.EVENT_DRIVEN, seed=4, **settings).start()["metrics"])
+        self.assertEqual(results[0], results[1])
+        self.assertNotEqual(results[0], results[2])
+
+        with self.assertRaises(ValueError):
+            SimulationEngine(Simulation(junction_config=self.junction_config), mode=SimulationEngine.EVENT_DRIVEN, green_split=1)
+
+    def test_optimize_signal_timing(self):
+        """Test that the search stays within its bounds and budget and is reproducible in parallel"""
+        from .signal_timing import optimize_signal_timing
+
+        first = optimize_signal_timing(self.junction_config, (40, 200), (0.3, 0.7), replications=2, max_evaluations=12, seed=3, max_workers=2)
+        second = optimize_signal_timing(self.junction_config, (40, 200), (0.3, 0.7), replications=2, max_evaluations=12, seed=3, max_workers=1)
+
+        self.assertEqual(first["frontier"], second["frontier"])
+        self.assertEqual(len(first["frontier"]), 12)
+        self.assertEqual(first["run_stats"]["runs"], 24)
+        self.assertEqual(first["best"], first["frontier"][0])
+        means = [plan["efficiency_score"]["mean"] for plan in first["frontier"]]
+        self.assertEqual(means, sorted(means, reverse=True))
+        for plan in first["frontier"]:
+            self.assertTrue(40 <= plan["cycle_length"] <= 200)
+            self.assertTrue(0.3 <= plan["green_split"] <= 0.7)
+            self.assertEqual(plan["efficiency_score"]["samples"], 2)
+
+    def test_signal_optimization_endpoint(self):
+        """Test starting a signal timing search and rejecting invalid requests"""
+        from django.test import Client
+        import json
+
+        client = Client()
+        response = client.post(
+            '/simulation/start-signal-optimization/',
+            data=json.dumps({"junction_config": self.junction_config, "maxEvaluations": 10, "seed": 1}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        study = SimulationStudy.objects.get(study_id=json.loads(response.content)["study_id"])
+        self.assertEqual(study.kind, SimulationStudy.SIGNAL_TIMING)
+        self.assertEqual(study.parameters["cycleRange"], [40, 240])
+
+        for body in [{"junction_config": self.junction_config, "cycleRange": [200, 100]},
+                     {"junction_config": self.junction_config, "splitRange": [0, 0.5]},
+                     {"junction_config": self.junction_config, "replications": 0},
+                     {"junction_config": self.junction_config, "max_workers": -1},
+                     {"maxEvaluations": 5}]:
+            response = client.post('/simulation/start-signal-optimization/', data=json.dumps(body), content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+
+class TestSimVehicle(TestCase):
+    """Tests for the lightweight engine vehicle"""
+
+    def test_turn_is_precomputed(self):
+        """Test that the turn type matches the Vehicle model's relative direction"""
+        for (incoming, exit), relative_dir in Vehicle.relative_dir_map.items():
+            vehicle = SimVehicle(1, DIRECTION_CODES[incoming], DIRECTION_CODES[exit], 0, 0)
+            self.assertEqual(vehicle.turn, relative_dir)
+            self.assertEqual(vehicle.incoming_direction, incoming)
+            self.assertEqual(vehicle.exit_direction, exit)
+
+    def test_to_model(self):
+        """Test that timestamps are converted back to wall-clock times when persisted"""
+        vehicle = SimVehicle(1, DIRECTION_CODES["north"], DIRECTION_CODES["south"], 1, 0)
+        vehicle.arrival_time = 100.0
+        vehicle.departure_time = 140.0
+        self.assertEqual(vehicle.waiting_time, 40.0)
+
+        wall_origin = timezone.now()
+        row = vehicle.to_model(None, wall_origin, clock_origin=0.0, time_scale=1 / 20)
+        self.assertEqual(row.arrival_time, wall_origin + timedelta(seconds=5))
+        self.assertEqual(row.departure_time, wall_origin + timedelta(seconds=7))
+        self.assertAlmostEqual(row.waiting_time, 2.0)
+        self.assertEqual(row.incoming_direction, "north")
+        self.assertEqual(row.exit_direction, "south")
+
+
+class TestStreamingMetrics(TestCase):
+    """Tests for the online metric accumulators"""
+
+    def test_running_stats(self):
+        """Test that Welford's update and merging match the batch mean, variance and maximum"""
+        from statistics import mean, variance
+        from .statistics import RunningStats
+
+        values = [3.0, 7.5, 1.25, 9.0, 4.0, 4.0, 12.5]
+        left, right = RunningStats(), RunningStats()
+        for value in values[:3]:
+            left.add(value)
+        for value in values[3:]:
+            right.add(value)
+        left.merge(right)
+
+        self.assertEqual(left.count, len(values))
+        self.assertAlmostEqual(left.mean, mean(values))
+        self.assertAlmostEqual(left.variance, variance(values))
+        self.assertEqual(left.max, max(values))
+
+    def test_time_weighted_queue(self):
+        """Test that queue lengths are averaged over time"""
+        from .statistics import TimeWeightedValue
+
+        queue = TimeWeightedValue(start=0.0)
+        queue.update(2, now=10.0) # Empty for 10s
+        queue.update(1, now=20.0) # Two vehicles for 10s
+        # Then one vehicle for the last 20s: (0*10 + 2*10 + 1*20) / 40
+        self.assertAlmostEqual(queue.average(40.0), 1.0)
+        self.assertEqual(queue.max, 2)
+
+    def test_accumulator_metrics(self):
+        """Test the per-direction and per-lane metrics built from engine events"""
+        from .statistics import MetricsAccumulator
+
+        accumulator = MetricsAccumulator(["north", "south"], lane_count=2, time_scale=20)
+        accumulator.arrived("north", 0, 0.0)
+        accumulator.arrived("north", 1, 1.0)
+        accumulator.left_queue("north", 0, 2.0)
+        accumulator.crossed("north", 0, 2.0)
+        accumulator.left_queue("north", 1, 3.0)
+        accumulator.crossed("north", 1, 2.0)
+
+        metrics = accumulator.metrics(["north", "south"], 4.0)
+        north = metrics["north"]
+        # Waiting times are scaled to simulated seconds
+        self.assertAlmostEqual(north["average_waiting_time"], 40.0)
+        self.assertAlmostEqual(north["max_waiting_time"], 40.0)
+        self.assertEqual(north["max_queue_length"], 1)
+        self.assertEqual(north["vehicles_crossed"], 2)
+        self.assertAlmostEqual(north["throughput"], 2 * 3600 / 80)
+        self.assertEqual(north["lanes"]["1"]["vehicles_crossed"], 1)
+        self.assertAlmostEqual(north["waiting_time_percentiles"]["p99"], 40.0)
+        self.assertEqual(set(north["lanes"]["0"]["waiting_time_percentiles"]), {"p50", "p90", "p95", "p99"})
+        self.assertIsNone(metrics["south"]["average_waiting_time"])
+
+    def test_histogram_percentiles(self):
+        """Test that percentiles stay within the histogram's relative error"""
+        from .statistics import Histogram
+
+        histogram = Histogram()
+        for value in range(1, 1001):
+            histogram.add(value / 10)
+
+        for q, expected in [(50, 50.0), (90, 90.0), (95, 95.0), (99, 99.0)]:
+            self.assertAlmostEqual(histogram.percentile(q), expected, delta=expected * 0.02)
+        self.assertIsNone(Histogram().percentile(50))
+        # Memory depends on the range of the values, not on how many were added
+        self.assertLess(len(histogram.buckets), 1000)
+
+    def test_histogram_merge(self):
+        """Test that merging histograms is the same as feeding one histogram every value"""
+        from .statistics import Histogram
+
+        values = [0.5, 3.0, 7.25, 12.0, 12.0, 40.0, 95.5, 180.0]
+        combined, left, right = Histogram(), Histogram(), Histogram()
+        for index, value in enumerate(values):
+            combined.add(value)
+            (left if index % 2 else right).add(value)
+
+        merged = Histogram.from_dict(left.to_dict()).merge(right)
+        self.assertEqual(merged.percentiles(), combined.percentiles())
+        self.assertEqual((merged.count, merged.min, merged.max), (combined.count, combined.min, combined.max))
+        with self.assertRaises(ValueError):
+            merged.merge(Histogram(resolution=1))
+
+    def test_matches_sql_metrics(self):
+        """Test that the streamed metrics agree with the SQL query over the persisted vehicles"""
+        config = {
+            "north": {"inbound": 300, "east": 100, "south": 100, "west": 100},
+            "east": {"inbound": 300, "north": 100, "south": 100, "west": 100},
+            "south": {"inbound": 300, "north": 100, "east": 100, "west": 100},
+            "west": {"inbound": 300, "north": 100, "east": 100, "south": 100},
+            "leftTurn": True,
+            "numLanes": 2
+        }
+        simulation = Simulation.objects.create(simulation_status="running", junction_config=config)
+        engine = SimulationEngine(simulation, mode=SimulationEngine.EVENT_DRIVEN, persist_vehicles=True)
+        streamed = engine.start()["metrics"]
+
+        queried = SimulationEngine.compute_AWT_MWT(simulation.simulation_id)
+        for direction, values in queried.items():
+            self.assertAlmostEqual(streamed[direction]["average_waiting_time"], values["average_waiting_time"], places=1)
+            self.assertAlmostEqual(streamed[direction]["max_waiting_time"], values["max_waiting_time"], places=1)
+
+
+class TestParameterSweep(TestCase):
+    """Tests for parameter sweeps"""
+
+    def setUp(self):
+        self.junction_config = {
+            "north": {"inbound": 300, "east": 100, "south": 100, "west": 100},
+            "east": {"inbound": 300, "north": 100, "south": 100, "west": 100},
+            "south": {"inbound": 300, "north": 100, "east": 100, "west": 100},
+            "west": {"inbound": 300, "north": 100, "east": 100, "south": 100},
+            "leftTurn": True,
+            "numLanes": 2
+        }
+
+    def test_expand_grid(self):
+        """Test that ranges expand to every combination without touching the base configuration"""
+        from .sweep import expand_grid
+
+        points = expand_grid(self.junction_config, {
+            "numLanes": {"start": 1, "stop": 3},
+            "leftTurn": [True, False],
+            "cycleTime": [2, 4],
+        })
+
+        self.assertEqual(len(points), 12)
+        self.assertEqual({p["junction_config"]["numLanes"] for p in points}, {1, 2, 3})
+        self.assertEqual({p["cycle_time"] for p in points}, {2, 4})
+        self.assertEqual(self.junction_config["numLanes"], 2)
+
+    def test_invalid_sweeps(self):
+        """Test that unknown parameters, empty ranges and huge grids are rejected"""
+        from .sweep import expand_grid, MAX_SWEEP_POINTS
+
+        for ranges in [{}, {"north.upward": [1]}, {"north": [1]}, {"numLanes": []}, {"numLanes": [0]},
+                       {"north.inbound": [300, -1]}, {"leftTurn": ["yes"]},
+                       {"north.inbound": {"start": 1, "stop": MAX_SWEEP_POINTS + 1}}]:
+            with self.assertRaises(ValueError):
+                expand_grid(self.junction_config, ranges)
+        with self.assertRaises(ValueError):
+            expand_grid({**self.junction_config, "lanes": 2}, {"numLanes": [1]})
+        with self.assertRaises(ValueError):
+            expand_grid(self.junction_config, {"numLanes": [1]}, seed=-1)
+
+    def test_run_sweep(self):
+        """Test that a sweep runs on a process pool and ranks the points by efficiency score"""
+        from .sweep import run_sweep
+
+        results = run_sweep(self.junction_config, {"numLanes": [1, 2], "cycleTime": [1, 3]}, max_workers=2)
+
+        table = results["table"]
+        self.assertEqual(len(table), 4)
+        self.assertEqual([row["rank"] for row in table], [1, 2, 3, 4])
+        scores = [row["efficiency_score"] for row in table]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertIn("north", table[0]["metrics"])
+        self.assertEqual(results["run_stats"]["workers"], 2)
+        # Every point is seeded, so the same sweep gives the same table
+        self.assertEqual(run_sweep(self.junction_config, {"numLanes": [1, 2], "cycleTime": [1, 3]}, max_workers=1)["table"], table)
+
+    def test_sweep_endpoints(self):
+        """Test starting a sweep and reading its study"""
+        from django.test import Client
+        import json
+
+        client = Client()
+        response = client.post(
+            '/simulation/start-sweep/',
+            data=json.dumps({"junction_config": self.junction_config, "ranges": {"numLanes": [1, 2, 3]}}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(data["points"], 3)
+
+        response = client.get(f'/simulation/study/?study_id={data["study_id"]}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)["kind"], SimulationStudy.SWEEP)
+
+        response = client.post(
+            '/simulation/start-sweep/',
+            data=json.dumps({"junction_config": self.junction_config, "ranges": {"lanes": [1]}}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+        response = client.post(
+            '/simulation/start-sweep/',
+            data=json.dumps({"junction_config": {**self.junction_config, "north": {"inbound": -5}}, "ranges": {"numLanes": [1]}}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+        response = client.post(
+            '/simulation/start-sweep/',
+            data=json.dumps({"junction_config": self.junction_config, "ranges": {"numLanes": [1]}, "max_workers": 0}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class TestReplications(TestCase):
+    """Tests for seeded Monte Carlo replications"""
+
+    def setUp(self):
+        self.junction_config = {
+            "north": {"inbound": 300, "east": 100, "south": 100, "west": 100},
+            "east": {"inbound": 300, "north": 100, "south": 100, "west": 100},
+            "south": {"inbound": 300, "north": 100, "east": 100, "west": 100},
+            "west": {"inbound": 300, "north": 100, "east": 100, "south": 100},
+            "leftTurn": True,
+            "numLanes": 2
+        }
+
+    def test_seeded_runs_are_reproducible(self):
+        """Test that the same seed stocks the same vehicles and gives the same event-driven result"""
+        results = []
+        for seed in (7, 7, 8):
+            simulation = Simulation(simulation_status="running", junction_config=self.junction_config)
+            results.append(SimulationEngine(simulation, mode=SimulationEngine.EVENT_DRIVEN, seed=seed).start())
+
+        self.assertEqual(results[0]["metrics"], results[1]["metrics"])
+        self.assertNotEqual(results[0]["metrics"], results[2]["metrics"])
+
+    def test_confidence_interval(self):
+        """Test the 95% confidence interval against the t distribution"""
+        from .statistics import RunningStats, t_critical_95
+
+        stats = RunningStats()
+        for value in [10.0, 12.0, 14.0, 16.0]:
+            stats.add(value)
+        interval = stats.confidence_interval()
+
+        # std = 2.582, t(3) = 3.182
+        self.assertAlmostEqual(interval["mean"], 13.0)
+        self.assertAlmostEqual(interval["ci_high"] - 13.0, 3.182 * 2.5820 / 2, places=3)
+        self.assertAlmostEqual(t_critical_95(60), 2.000, places=3)
+        self.assertIsNone(RunningStats().confidence_interval()["mean"])
+
+    def test_run_replications(self):
+        """Test that replications are seeded, reproducible and summarized with confidence intervals"""
+        from .replications import run_replications
+
+        first = run_replications(self.junction_config, 6, seed=42, max_workers=2)
+        second = run_replications(self.junction_config, 6, seed=42, max_workers=1)
+
+        self.assertEqual(first["replications"], second["replications"])
+        self.assertEqual(len({r["seed"] for r in first["replications"]}), 6)
+
+        score = first["summary"]["efficiency_score"]
+        self.assertEqual(score["samples"], 6)
+        self.assertLessEqual(score["ci_low"], score["mean"])
+        self.assertGreaterEqual(score["ci_high"], score["mean"])
+
+        north = first["summary"]["metrics"]["north"]
+        self.assertIn("ci_low", north["average_waiting_time"])
+        self.assertEqual(set(north["waiting_time_percentiles"]), {"p50", "p90", "p95", "p99"})
+
+    def test_replications_endpoint(self):
+        """Test starting replications and rejecting invalid requests"""
+        from django.test import Client
+        import json
+
+        client = Client()
+        response = client.post(
+            '/simulation/start-replications/',
+            data=json.dumps({"junction_config": self.junction_config, "replications": 20, "seed": 1}),
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        study = SimulationStudy.objects.get(study_id=json.loads(response.content)["study_id"])
+        self.assertEqual(study.kind, SimulationStudy.REPLICATIONS)
+
+        for body in [{"junction_config": self.junction_config, "replications": 1},
+                     {"junction_config": self.junction_config, "seed": -1},
+                     {"junction_config": {**self.junction_config, "lanes": 2}},
+                     {"junction_config": {**self.junction_config, "north": {"inbound": 300, "up": 1}}},
+                     {"junction_config": self.junction_config, "max_workers": 10 ** 6},
+                     {"junction_config": self.junction_config, "max_workers": "all"},
+                     {"replications": 5}]:
+            response = client.post('/simulation/start-replications/', data=json.dumps(body), content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+
+class TestResultCache(TestCase):
+    """Tests for canonical configurations and the result cache"""
+
+    def setUp(self):
+        self.junction_config = {
+            "north": {"inbound": 300, "east": 100, "south": 100, "west": 100},
+            "east": {"inbound": 300, "north": 100, "south": 100, "west": 100},
+            "south": {"inbound": 300, "north": 100, "east": 100, "west": 100},
+            "west": {"inbound": 300, "north": 100, "east": 100, "south": 100},
+            "leftTurn": True,
+            "numLanes": 2
+        }
+
+    def test_canonical_config(self):
+        """Test that equivalent configurations share a canonical form and a hash"""
+        from .config import canonicalize_junction_config, config_hash
+
+        spelled_differently = {
+            "numLanes": "2",
+            "leftTurn": True,
+            "west": {"south": 100.0, "east": "100", "north": 100, "inbound": 300},
+            "south": {"inbound": 300, "north": 100, "east": 100, "west": 100},
+            "east": {"inbound": 300, "north": 100, "south": 100, "west": 100},
+            "north": {"inbound": 300, "east": 100, "south": 100, "west": 100},
+        }
+        self.assertEqual(canonicalize_junction_config(spelled_differently), self.junction_config)
+        self.assertEqual(config_hash(spelled_differently), config_hash(self.junction_config))
+        self.assertEqual(list(canonicalize_junction_config(spelled_differently)["west"]), ["inbound", "north", "east", "south"])
+
+        # Missing flows and settings get their defaults
+        canonical = canonicalize_junction_config({"north": {"inbound": 60, "south": 60}})
+        self.assertEqual(canonical["east"], {"inbound": 0, "north": 0, "south": 0, "west": 0})
+        self.assertEqual((canonical["leftTurn"], canonical["numLanes"]), (False, 2))
+
+        for invalid in [{"north": {"north": 5}}, {"up": {}}, {"numLanes": 0}, {"north": {"inbound": -1}}, {"leftTurn": "yes"}]:
+            with self.assertRaises(ValueError):
+                canonicalize_junction_config(invalid)
+
+    def test_store_and_evict(self):
+        """Test that results are found by config and seed, and least recently used entries are evicted"""
+        from .cache import store_result, get_cached_result
+        from django.test import override_settings
+
+        result = {"metrics": {"north": {}}, "efficiency_score": 50.0, "run_stats": {}}
+        with override_settings(SIMULATION_RESULT_CACHE_SIZE=2):
+            store_result(self.junction_config, 1, result)
+            store_result(self.junction_config, 2, result)
+            self.assertIsNotNone(get_cached_result(self.junction_config, 1)) # Seed 2 is now the least recently used
+            store_result(self.junction_config, 3, result)
+
+        self.assertEqual(CachedSimulationResult.objects.count(), 2)
+        self.assertIsNone(get_cached_result(self.junction_config, 2))
+        self.assertEqual(get_cached_result(self.junction_config, 1).hits, 2)
+
+    def test_start_from_cache(self):
+        """Test that starting an already computed configuration completes without running the engine"""
+        from django.test import Client
+        from .tasks import run_simulation
+        import json
+
+        client = Client()
+        first = Simulation.objects.create(simulation_status="Not started", junction_config=self.junction_config, seed=5)
+        run_simulation(first.simulation_id)
+        first.refresh_from_db()
+
+        response = client.post('/simulation/create-simulation/?seed=5', data=json.dumps(self.junction_config), content_type='application/json')
+        simulation_id = json.loads(response.content)["simulation_id"]
+        response = client.post(f'/simulation/start-simulation/?simulation_id={simulation_id}')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(json.loads(response.content)["cached"])
+        second = Simulation.objects.get(simulation_id=simulation_id)
+        self.assertEqual(second.simulation_status, "completed")
+        self.assertEqual(second.metrics, first.metrics)
+        self.assertEqual(second.efficiency_score, first.efficiency_score)
+        self.assertTrue(second.run_stats["cache_hit"])
+
+        response = client.post('/simulation/create-simulation/?seed=abc', data=json.dumps(self.junction_config), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class TestVehicleWriter(TransactionTestCase):
+    """Tests for write-behind vehicle persistence, the writer thread needs to see committed rows"""
+
+    def setUp(self):
+        self.simulation = Simulation.objects.create(simulation_status="running", junction_config={})
+
+    def make_vehicles(self, count):
+        vehicles = []
+        for index in range(count):
+            vehicle = SimVehicle(index, DIRECTION_CODES["north"], DIRECTION_CODES["south"], 0, 0)
+            vehicle.arrival_time = float(index)
+            vehicle.departure_time = float(index) + 2
+            vehicles.append(vehicle)
+        return vehicles
+
+    def test_batched_flushes(self):
+        """Test that submitted vehicles are written in batches and the flushes are reported"""
+        from .persistence import VehicleWriter
+
+        writer = VehicleWriter(self.simulation, timezone.now(), batch_size=10, flush_interval=5).start()
+        writer.submit_many(self.make_vehicles(25))
+        stats = writer.close(timeout=5)
+
+        self.assertEqual(Vehicle.objects.filter(simulation=self.simulation).count(), 25)
+        self.assertEqual(stats["rows"], 25)
+        self.assertEqual(stats["flushes"], 3)
+        self.assertEqual(stats["max_rows_per_flush"], 10)
+
+    def test_submit_never_blocks(self):
+        """Test that vehicles spill into the overflow list when the queue is full and are still written"""
+        from .persistence import VehicleWriter
+
+        # The writer is not started yet, so nothing drains the queue
+        writer = VehicleWriter(self.simulation, timezone.now(), batch_size=100, queue_size=5)
+        started = time.perf_counter()
+        writer.submit_many(self.make_vehicles(20))
+        self.assertLess(time.perf_counter() - started, 1)
+        self.assertEqual(writer.overflowed, 15)
+
+        stats = writer.start().close(timeout=5)
+        self.assertEqual(stats["rows"], 20)
+        self.assertEqual(Vehicle.objects.filter(simulation=self.simulation).count(), 20)
+
+
+class TestEventLog(TestCase):
+    """Tests for the engine event log"""
+
+    def test_levels_and_lazy_formatting(self):
+        """Test that events below the level are dropped and messages are only formatted when read"""
+        from .event_log import EventLog, DEBUG, ENGINE, DEPARTURE
+
+        class Counted:
+            formatted = 0
+            def __str__(self):
+                Counted.formatted += 1
+                return "vehicle"
+
+        log = EventLog(1, level="INFO", path="")
+        log.debug(DEPARTURE, "%s crossed", Counted())
+        log.info(ENGINE, "%s started", Counted())
+        self.assertEqual(len(log.buffer), 1)
+        self.assertEqual(Counted.formatted, 0)
+
+        events = log.records()
+        self.assertEqual(Counted.formatted, 1)
+        self.assertEqual(events[0]["message"], "vehicle started")
+        self.assertEqual((events[0]["level"], events[0]["category"]), ("INFO", ENGINE))
+        self.assertFalse(log.is_enabled_for(DEBUG))
+
+    def test_ring_buffer(self):
+        """Test that only the most recent events are kept and can be filtered"""
+        from .event_log import EventLog, ENGINE, QUEUE
+
+        log = EventLog(1, level="DEBUG", capacity=5, path="")
+        for index in range(10):
+            log.debug(QUEUE, "event %d", index)
+        log.warning(ENGINE, "last")
+
+        self.assertEqual([e["message"] for e in log.records()], ["event 6", "event 7", "event 8", "event 9", "last"])
+        self.assertEqual([e["message"] for e in log.records(level="WARNING")], ["last"])
+        self.assertEqual(len(log.records(category=QUEUE, limit=2)), 2)
+
+    def test_file_sink(self):
+        """Test that the optional sink writes events to a file in the background"""
+        from .event_log import EventLog, ENGINE
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "events.log")
+            log = EventLog(42, path=path)
+            log.info(ENGINE, "Simulation %s started", 42)
+
+            deadline = time.time() + 5
+            content = ""
+            while "started" not in content and time.time() < deadline:
+                time.sleep(0.01)
+                with open(path) as f:
+                    content = f.read()
+            self.assertIn("simulation 42 INFO engine] Simulation 42 started", content)
+
+    def test_events_are_stored_per_simulation(self):
+        """Test that a run's events are stored with its simulation and served by the endpoint"""
+        from django.test import Client
+        from .tasks import run_simulation
+        import json
+
+        config = {
+            "north": {"inbound": 300, "east": 100, "south": 100, "west": 100},
+            "east": {"inbound": 300, "north": 100, "south": 100, "west": 100},
+            "south": {"inbound": 300, "north": 100, "east": 100, "west": 100},
+            "west": {"inbound": 300, "north": 100, "east": 100, "south": 100},
+            "leftTurn": True,
+            "numLanes": 2
+        }
+        simulation = Simulation.objects.create(simulation_status="Not started", junction_config=config)
+        run_simulation(simulation.simulation_id)
+
+        response = Client().get(f'/simulation/simulation-events/?simulation_id={simulation.simulation_id}&category=engine')
+        self.assertEqual(response.status_code, 200)
+        messages = [e["message"] for e in json.loads(response.content)["events"]]
+        self.assertTrue(any(m.startswith("Simulation started") for m in messages))
+        self.assertTrue(any(m.startswith("Efficiency score") for m in messages))
+
+        response = Client().get(f'/simulation/simulation-events/?simulation_id={simulation.simulation_id}&level=LOUD')
+        self.assertEqual(response.status_code, 400)
+
+
+class TestBenchmark(TestCase):
+    def test_report_and_baseline_comparison(self):
+        """Test that a benchmark case reports its timings and that a slower run is flagged against the baseline"""
+        from .benchmark import build_matrix, run_benchmark, compare
+
+        report = run_benchmark(build_matrix([2], [True], [300], [50]), repeat=1)
+        self.assertEqual(len(report["cases"]), 1)
+        case = report["cases"][0]
+        self.assertNotIn("error", case)
+        self.assertEqual(case["id"], "lanes=2,leftTurn=1,inbound=300,vehicles=50")
+        self.assertGreater(case["vehicles_crossed"], 0)
+        self.assertGreater(case["vehicles_per_sec"], 0)
+        for key in ("generation_time", "wall_time", "cpu_time", "metrics_time", "peak_rss_kb"):
+            self.assertIn(key, case)
+        self.assertIn("environment", report)
+
+        faster = {"cases": [{**case, "vehicles_per_sec": case["vehicles_per_sec"] * 2}]}
+        comparison = compare(report, faster, tolerance=0.2)
+        self.assertEqual(comparison["regressions"], [case["id"]])
+        self.assertAlmostEqual(comparison["geometric_mean_ratio"], 0.5)
+
+        comparison = compare(report, {"cases": []})
+        self.assertEqual(comparison["missing"], [case["id"]])
+        self.assertIsNone(comparison["geometric_mean_ratio"])
+
+        with self.assertRaisesRegex(ValueError, "threaded mode"):
+            compare(report, {**faster, "mode": "threaded"})
+
+    def test_command_skips_a_baseline_of_another_mode(self):
+        """Test that the command doesn't compare with a baseline of another mode, and fails --check on one"""
+        from io import StringIO
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        from .benchmark import save_report
+
+        with tempfile.TemporaryDirectory() as directory:
+            # Threaded runs are far slower than event-driven ones, every case would look like a regression
+            baseline = os.path.join(directory, "baseline.json")
+            save_report({"mode": "threaded", "cases": [{"id": "lanes=2,leftTurn=0,inbound=300,vehicles=20", "vehicles_per_sec": 1e9}]}, baseline)
+            arguments = ["--lanes", "2", "--left-turn", "0", "--inbound", "300", "--vehicles", "20", "--repeat", "1",
+                         "--baseline", baseline, "--output", os.path.join(directory, "report.json")]
+
+            stderr = StringIO()
+            call_command("benchmark", *arguments, stderr=stderr)
+            self.assertIn("recorded in threaded mode", stderr.getvalue())
+            self.assertNotIn("Regression", stderr.getvalue())
+            with self.assertRaisesRegex(CommandError, "threaded mode"):
+                call_command("benchmark", *arguments, "--check", stderr=StringIO())
+
+
+class TestPhaseTimings(TestCase):
+    def setUp(self):
+        from .http_cache import payload_cache
+        payload_cache().clear() # Ids are reused once a test rolls back
+
+    def test_phase_timer(self):
+        """Test that phases entered twice add up and that the total covers them"""
+        from .timing import PhaseTimer
+
+        timer = PhaseTimer()
+        with timer.phase("run"):
+            time.sleep(0.01)
+        with timer.phase("run"):
+            time.sleep(0.01)
+        timer.record("queue_wait", 1.5)
+
+        timings = timer.as_dict()
+        self.assertEqual(list(timings["phases"]), ["run", "queue_wait"])
+        self.assertGreaterEqual(timings["phases"]["run"], 0.02)
+        self.assertGreaterEqual(timings["total"], timings["phases"]["run"])
+
+    def test_timings_are_stored_and_served(self):
+        """Test that a run records its queue wait and engine phases and that completed-simulation returns them"""
+        from django.test import Client
+        from .tasks import run_simulation
+        import json
+
+        config = {
+            "north": {"inbound": 300, "east": 100, "south": 100, "west": 100},
+            "east": {"inbound": 300, "north": 100, "south": 100, "west": 100},
+            "south": {"inbound": 300, "north": 100, "east": 100, "west": 100},
+            "west": {"inbound": 300, "north": 100, "east": 100, "south": 100},
+            "leftTurn": False,
+            "numLanes": 2
+        }
+        simulation = Simulation.objects.create(simulation_status="running", junction_config=config)
+        run_simulation(simulation.simulation_id, enqueued_at=time.time() - 2)
+
+        response = Client().get(f'/simulation/completed-simulation/?simulation_id={simulation.simulation_id}')
+        self.assertEqual(response.status_code, 200)
+        timings = json.loads(response.content)["timings"]
+        for phase in ("queue_wait", "load", "stocking", "junction_setup", "run", "scoring", "cache_store"):
+            self.assertIn(phase, timings["phases"])
+        self.assertGreaterEqual(timings["phases"]["queue_wait"], 2)
+        self.assertGreaterEqual(timings["total"], timings["phases"]["run"])
+
+
+def increment_in_child(directory):
+    from . import monitoring
+    monitoring.SIMULATIONS.labels("completed").inc()
+    monitoring.REGISTRY.flush(directory)
+
+
+def start_registry_in_worker(_):
+    from . import monitoring
+    monitoring.REGISTRY.start()
+    return monitoring.REGISTRY.thread is None
+
+
+class TestMonitoring(TestCase):
+    def test_aggregation_across_processes(self):
+        """Test that counters and histograms of every process add up and that stale gauges are dropped"""
+        from .monitoring import Registry, aggregate, exposition, read_snapshots
+        import json
+
+        first, second = Registry(), Registry()
+        for registry, crossed in ((first, 3), (second, 4)):
+            registry.counter("crossed_total", "Crossed.", ("mode",)).labels("event").inc(crossed)
+            registry.histogram("duration_seconds", "Duration.", (1, 10)).observe(crossed)
+            registry.gauge("depth", "Depth.").set(crossed)
+
+        with tempfile.TemporaryDirectory() as directory:
+            snapshots = [(first.snapshot(), time.time()), (second.snapshot(), time.time() - 3600)]
+            families = aggregate(snapshots, stale_after=5)
+            self.assertEqual(families["crossed_total"]["samples"][("event",)], 7)
+            self.assertEqual(families["duration_seconds"]["samples"][()]["counts"], [0, 2, 0])
+            self.assertEqual(families["depth"]["samples"][()], 3)
+
+            text = exposition(families)
+            self.assertIn('# TYPE crossed_total counter', text)
+            self.assertIn('crossed_total{mode="event"} 7', text)
+            self.assertIn('duration_seconds_bucket{le="10"} 2', text)
+            self.assertIn('duration_seconds_bucket{le="+Inf"} 2', text)
+            self.assertIn('duration_seconds_count 2', text)
+
+            first.flush(directory)
+            self.assertEqual(len(read_snapshots(directory)), 1)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "Forked workers need fork")
+    def test_forked_worker_is_counted_once(self):
+        """Test that a forked worker starts from zero and that its counters are added to the parent's"""
+        import multiprocessing
+        from . import monitoring
+
+        with tempfile.TemporaryDirectory() as directory:
+            monitoring.SIMULATIONS.labels("completed").inc()
+            before = monitoring.collect(directory)[monitoring.SIMULATIONS.name]["samples"][("completed",)]
+
+            process = multiprocessing.get_context("fork").Process(target=increment_in_child, args=(directory,))
+            process.start()
+            process.join(10)
+
+            after = monitoring.collect(directory)[monitoring.SIMULATIONS.name]["samples"][("completed",)]
+            self.assertEqual(after, before + 1)
+
+    def test_exited_processes_are_folded(self):
+        """Test that the files of exited processes are folded into one and that a reused PID keeps their counters"""
+        from .monitoring import Registry, aggregate, collect, read_snapshots, EXITED_FILE
+        import json
+
+        def write(directory, pid, token, crossed, age):
+            registry = Registry()
+            registry.counter("crossed_total", "Crossed.").inc(crossed)
+            registry.gauge("depth", "Depth.").set(crossed)
+            snapshot = {**registry.snapshot(), "pid": pid, "token": token}
+            path = os.path.join(directory, f"metrics-{pid}.json")
+            with open(path, "w") as f:
+                json.dump(snapshot, f)
+            os.utime(path, (time.time() - age, time.time() - age))
+            return path
+
+        with tempfile.TemporaryDirectory() as directory:
+            # Nothing runs with a PID above the kernel's limit
+            dead = [write(directory, 4194304 + i, f"dead-{i}", 2, 3600) for i in range(3)]
+            families = collect(directory)
+            self.assertEqual(families["crossed_total"]["samples"][()], 6)
+            self.assertNotIn((), families.get("depth", {"samples": {}})["samples"])
+            self.assertFalse(any(os.path.exists(path) for path in dead))
+            self.assertTrue(os.path.exists(os.path.join(directory, EXITED_FILE)))
+
+            # A new process with the PID of an exited one folds its file before replacing it
+            write(directory, os.getpid(), "exited", 5, 0)
+            registry = Registry()
+            registry.counter("crossed_total", "Crossed.").inc(1)
+            registry.flush(directory)
+            self.assertEqual(aggregate(read_snapshots(directory))["crossed_total"]["samples"][()], 12)
+            self.assertEqual(sorted(name for name in os.listdir(directory) if name != f"metrics-{os.getpid()}.json"), [EXITED_FILE])
+
+    @unittest.skipUnless(hasattr(os, "fork"), "Forked workers need fork")
+    def test_counts_reach_the_directory_without_a_scrape(self):
+        """Test that a process that only counts simulations, like Django, writes them to the directory on its own"""
+        from django.test import override_settings
+        from . import monitoring
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(SIMULATION_METRICS={"directory": directory, "flush_interval": 0.05}):
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    monitoring.count_simulations("queued", 2)
+                    time.sleep(0.5)
+                finally:
+                    os._exit(0)
+            os.waitpid(pid, 0)
+
+            snapshot = monitoring.read_snapshot(os.path.join(directory, f"metrics-{pid}.json"))
+            self.assertIsNotNone(snapshot)
+            samples = dict((tuple(labels), value) for labels, value in snapshot["metrics"][monitoring.SIMULATIONS.name]["samples"])
+            self.assertEqual(samples[("queued",)], 2)
+
+    def test_pool_workers_write_no_snapshots(self):
+        """Test that the process pool workers of a study don't start a flusher"""
+        from .sweep import map_in_pool
+
+        results, workers = map_in_pool(start_registry_in_worker, [0, 1], max_workers=2)
+        self.assertEqual(workers, 2)
+        self.assertEqual(results, [True, True])
+
+    def test_metrics_endpoint(self):
+        """Test that the endpoint serves the run counters, durations and stored statuses"""
+        from django.test import Client, override_settings
+        from .tasks import run_simulation
+
+        config = {
+            "north": {"inbound": 300, "east": 100, "south": 100, "west": 100},
+            "east": {"inbound": 300, "north": 100, "south": 100, "west": 100},
+            "south": {"inbound": 300, "north": 100, "east": 100, "west": 100},
+            "west": {"inbound": 300, "north": 100, "east": 100, "south": 100},
+            "leftTurn": False,
+            "numLanes": 2
+        }
+        with tempfile.TemporaryDirectory() as directory, override_settings(SIMULATION_METRICS={"directory": directory}):
+            simulation = Simulation.objects.create(simulation_status="running", junction_config=config)
+            run_simulation(simulation.simulation_id, enqueued_at=time.time())
+
+            response = Client().get('/simulation/metrics/')
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response["Content-Type"].startswith("text/plain"))
+            text = response.content.decode()
+            self.assertIn('traffic_sim_simulations{status="completed"} 1', text)
+            self.assertIn('traffic_sim_simulations_total{state="completed"}', text)
+            self.assertIn('traffic_sim_simulation_duration_seconds_count', text)
+            self.assertIn('traffic_sim_run_vehicles_per_second_bucket{mode="event",le="+Inf"}', text)
+            self.assertIn('traffic_sim_vehicles_crossed_total{mode="event"}', text)
+            self.assertIn('traffic_sim_simulations_queued', text)
+
+    def test_live_engine_gauges(self):
+        """Test that the lane depths and warehouse stock of a running engine are collected"""
+        from . import monitoring
+
+        config = {
+            "north": {"inbound": 300, "east": 100, "south": 100, "west": 100},
+            "east": {"inbound": 300, "north": 100, "south": 100, "west": 100},
+            "south": {"inbound": 300, "north": 100, "east": 100, "west": 100},
+            "west": {"inbound": 300, "north": 100, "east": 100, "south": 100},
+            "leftTurn": False,
+            "numLanes": 2
+        }
+        simulation = Simulation.objects.create(simulation_status="running", junction_config=config)
+        engine = SimulationEngine(simulation)
+        engine.vehicle_warehouse.get_vehicle("north")
+        monitoring.REGISTRY.engines.add(engine)
+        try:
+            metrics = monitoring.REGISTRY.snapshot()["metrics"]
+        finally:
+            monitoring.untrack(engine)
+
+        remaining = dict((tuple(labels), value) for labels, value in metrics["traffic_sim_warehouse_remaining"]["samples"])
+        sid = str(simulation.simulation_id)
+        self.assertEqual(remaining[(sid, "north")], remaining[(sid, "south")] - 1)
+        depths = [labels for labels, _ in metrics["traffic_sim_lane_queue_depth"]["samples"]]
+        self.assertIn([sid, "east", "1"], depths)
+        self.assertIn([["threaded"], 1], metrics["traffic_sim_engines_running"]["samples"])
+
+
+class TestProgressStream(TestCase):
+    config = {
+        "north": {"inbound": 300, "east": 100, "south": 100, "west": 100},
+        "east": {"inbound": 300, "north": 100, "south": 100, "west": 100},
+        "south": {"inbound": 300, "north": 100, "east": 100, "west": 100},
+        "west": {"inbound": 300, "north": 100, "east": 100, "south": 100},
+        "leftTurn": False,
+        "numLanes": 2
+    }
+
+    def setUp(self):
+        from django.test import override_settings
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(SIMULATION_PROGRESS={"directory": self.directory.name, "interval": 0.01, "heartbeat": 1, "timeout": 10})
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.directory.cleanup()
+
+    def test_reporter_and_hub(self):
+        """Test that an engine's progress reaches every subscriber, ending with its final status"""
+        from .progress import HUB, ProgressReporter, COMPLETED
+
+        simulation = Simulation.objects.create(simulation_status="running", junction_config=self.config)
+        engine = SimulationEngine(simulation, mode=SimulationEngine.EVENT_DRIVEN, seed=1)
+        first, second = HUB.subscribe(simulation.simulation_id), HUB.subscribe(simulation.simulation_id)
+        try:
+            reporter = ProgressReporter(engine, simulation.simulation_id).start()
+            for subscription in (first, second):
+                update = subscription.get(timeout=5)
+                self.assertEqual(update["status"], "running")
+                self.assertEqual(update["fraction"], 0)
+                self.assertEqual(update["light_phase"], "north-south")
+
+            engine.start()
+            reporter.close(COMPLETED, efficiency_score=50.0)
+            for subscription in (first, second):
+                update = subscription.get(timeout=5)
+                while update is not None and update["status"] == "running":
+                    update = subscription.get(timeout=5)
+                self.assertEqual(update["status"], COMPLETED)
+                self.assertEqual(update["efficiency_score"], 50.0)
+                self.assertGreater(update["fraction"], 0)
+                self.assertGreater(update["vehicles_departed"], 0)
+                self.assertEqual(set(update["queue_lengths"]), {"north", "south", "east", "west"})
+        finally:
+            HUB.unsubscribe(first)
+            HUB.unsubscribe(second)
+
+    def test_stream_endpoint(self):
+        """Test that the stream sends progress events, then a done event, and that a finished simulation is answered at once"""
+        from django.test import Client
+        from .progress import write_progress
+        import json
+
+        simulation = Simulation.objects.create(simulation_status="running", junction_config=self.config)
+
+        def publish():
+            time.sleep(0.05)
+            write_progress(simulation.simulation_id, {"status": "running", "fraction": 0.5})
+            time.sleep(0.05)
+            write_progress(simulation.simulation_id, {"status": "completed", "fraction": 1.0})
+
+        publisher = threading.Thread(target=publish)
+        publisher.start()
+        response = Client().get(f'/simulation/simulation-progress/?simulation_id={simulation.simulation_id}')
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        events = []
+        for chunk in response.streaming_content:
+            chunk = chunk.decode()
+            if chunk.startswith("event:"):
+                name, data = chunk.strip().split("\n")
+                events.append((name[len("event: "):], json.loads(data[len("data: "):])))
+        publisher.join()
+
+        self.assertEqual(events[-1][0], "done")
+        self.assertEqual(events[-1][1]["fraction"], 1.0)
+        self.assertTrue(all(name == "progress" for name, _ in events[:-1]))
+
+        simulation.simulation_status = "completed"
+        simulation.save()
+        response = Client().get(f'/simulation/simulation-progress/?simulation_id={simulation.simulation_id}')
+        content = b"".join(response.streaming_content).decode()
+        self.assertTrue(content.startswith("event: done"))
+
+        response = Client().get('/simulation/simulation-progress/?simulation_id=0')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_async_stream_endpoint(self):
+        """Test that a stream served over ASGI sends progress events, then a done event"""
+        from asgiref.sync import sync_to_async
+        from django.test import AsyncClient
+        from .progress import write_progress
+        import json
+
+        simulation = await sync_to_async(Simulation.objects.create)(simulation_status="running", junction_config=self.config)
+
+        def publish():
+            time.sleep(0.05)
+            write_progress(simulation.simulation_id, {"status": "running", "fraction": 0.5})
+            time.sleep(0.05)
+            write_progress(simulation.simulation_id, {"status": "completed", "fraction": 1.0})
+
+        publisher = threading.Thread(target=publish)
+        publisher.start()
+        response = await AsyncClient().get(f'/simulation/simulation-progress/?simulation_id={simulation.simulation_id}')
+        self.assertTrue(response.is_async)
+        events = []
+        async for chunk in response.streaming_content:
+            chunk = chunk.decode()
+            if chunk.startswith("event:"):
+                name, data = chunk.strip().split("\n")
+                events.append((name[len("event: "):], json.loads(data[len("data: "):])))
+        publisher.join()
+
+        self.assertEqual(events[-1][0], "done")
+        self.assertEqual(events[-1][1]["fraction"], 1.0)
+        self.assertTrue(all(name == "progress" for name, _ in events[:-1]))
+
+    def test_blocking_streams_are_limited(self):
+        """Test that WSGI streams beyond max_streams are refused, and that closing a stream gives its slot back"""
+        from django.test import Client, override_settings
+        from .progress import progress_settings
+
+        simulation = Simulation.objects.create(simulation_status="running", junction_config=self.config)
+        url = f'/simulation/simulation-progress/?simulation_id={simulation.simulation_id}'
+        with override_settings(SIMULATION_PROGRESS={**progress_settings(), "max_streams": 1}):
+            first = Client().get(url)
+            self.assertEqual(first["Content-Type"], "text/event-stream")
+            self.assertEqual(Client().get(url).status_code, 503)
+            first.close() # Never iterated
+            second = Client().get(url)
+            self.assertEqual(second["Content-Type"], "text/event-stream")
+            second.close()
+
+            simulation.simulation_status = "completed"
+            simulation.save()
+            self.assertEqual(Client().get(url)["Content-Type"], "text/event-stream") # Answered at once, no slot needed
+
+    def test_subscribing_prunes_final_updates(self):
+        """Test that final updates past their retention are removed when a stream subscribes"""
+        from .progress import HUB, write_progress, progress_path
+        import os
+
+        write_progress(1, {"status": "completed"})
+        write_progress(2, {"status": "running"})
+        past = time.time() - 3600
+        for simulation_id in (1, 2):
+            os.utime(progress_path(simulation_id), (past, past))
+
+        subscription = HUB.subscribe(3)
+        HUB.unsubscribe(subscription)
+        self.assertFalse(os.path.exists(progress_path(1)))
+        self.assertTrue(os.path.exists(progress_path(2)))
+
+
+class TestCompletedSimulationsPagination(TestCase):
+    def setUp(self):
+        config = {"leftTurn": False, "numLanes": 2}
+        created_at = timezone.now()
+        self.completed = []
+        for i in range(7):
+            simulation = Simulation.objects.create(simulation_status="completed", junction_config=config, metrics={"north": {}}, efficiency_score=i)
+            self.completed.append(simulation.simulation_id)
+        Simulation.objects.create(simulation_status="completed", junction_config=config, is_deleted=True)
+        Simulation.objects.create(simulation_status="running", junction_config=config)
+        # Rows created within the same instant must neither be skipped nor repeated across pages
+        Simulation.objects.filter(simulation_id__in=self.completed[2:5]).update(created_at=created_at)
+        Simulation.objects.filter(simulation_id__in=self.completed[5:]).update(created_at=created_at + timedelta(seconds=1))
+
+    def fetch_all(self, query=""):
+        from django.test import Client
+        import json
+
+        ids, cursor, pages = [], None, 0
+        while True:
+            url = f'/simulation/completed-simulations/?limit=3{query}' + (f'&cursor={cursor}' if cursor else '')
+            response = Client().get(url)
+            self.assertEqual(response.status_code, 200)
+            data = json.loads(response.content)
+            ids += [row["simulation_id"] for row in data["results"]]
+            pages += 1
+            cursor = data["next_cursor"]
+            if cursor is None:
+                return ids, pages, data
+
+    def test_pages_cover_every_simulation_once(self):
+        """Test that cursor pages return every completed, non-deleted simulation once, in creation order"""
+        expected = [s.simulation_id for s in Simulation.objects.filter(simulation_status="completed", is_deleted=False).order_by("-created_at", "-simulation_id")]
+        ids, pages, _ = self.fetch_all()
+        self.assertEqual(ids, expected)
+        self.assertEqual(sorted(ids), sorted(self.completed))
+        self.assertEqual(pages, 3)
+
+        ids, _, _ = self.fetch_all("&order=oldest")
+        self.assertEqual(ids, expected[::-1])
+
+    def test_summary_projection(self):
+        """Test that pages are summaries by default and whole simulations with fields=full"""
+        from django.test import Client
+        import json
+
+        row = json.loads(Client().get('/simulation/completed-simulations/').content)["results"][0]
+        self.assertEqual(set(row), {"simulation_id", "simulation_status", "efficiency_score", "seed", "created_at"})
+        row = json.loads(Client().get('/simulation/completed-simulations/?fields=full').content)["results"][0]
+        self.assertIn("metrics", row)
+        self.assertIn("junction_config", row)
+
+    def test_invalid_page_requests(self):
+        """Test that malformed cursors, cursors of another order and bad limits are rejected"""
+        from django.test import Client
+        import json
+
+        data = json.loads(Client().get('/simulation/completed-simulations/?limit=2').content)
+        for query in ("cursor=garbage", f"cursor={data['next_cursor']}&order=oldest", "limit=0", "limit=x", "order=random"):
+            response = Client().get(f'/simulation/completed-simulations/?{query}')
+            self.assertEqual(response.status_code, 400, query)
+
+    def test_pages_are_index_range_scans(self):
+        """Test that SQLite walks the history index instead of scanning and sorting the table"""
+        from django.db import connection
+        from .pagination import cursor_page, encode_cursor
+        from .views import SIMULATION_SUMMARY_FIELDS
+
+        if connection.vendor != "sqlite":
+            self.skipTest("Query plans are SQLite specific")
+        queryset = Simulation.objects.filter(simulation_status="completed", is_deleted=False).values(*SIMULATION_SUMMARY_FIELDS)
+        with self.assertNumQueries(1), connection.execute_wrapper(self.capture):
+            self.statements = []
+            cursor_page(queryset, encode_cursor(timezone.now(), 5, "newest"), 3, pk_field="simulation_id")
+        sql, params = self.statements[0]
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plan = " ".join(row[-1] for row in cursor.fetchall())
+        self.assertIn("simulation_history_idx", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def capture(self, execute, sql, params, many, context):
+        self.statements.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+class TestHttpCaching(TestCase):
+    def setUp(self):
+        from .http_cache import payload_cache
+        payload_cache().clear() # Ids are reused once a test rolls back
+        self.simulation = Simulation.objects.create(
+            simulation_status="completed",
+            junction_config={"leftTurn": False, "numLanes": 2},
+            efficiency_score=0.5,
+        )
+        self.url = f'/simulation/completed-simulation/?simulation_id={self.simulation.simulation_id}'
+
+    def test_conditional_requests(self):
+        """Test that a completed simulation carries validators and that a revalidation is a 304 served from the cache"""
+        from django.test import Client
+        from django.utils.http import http_date
+
+        client = Client()
+        response = client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertEqual(response["Last-Modified"], http_date(int(self.simulation.updated_at.timestamp())))
+        self.assertIn("no-cache", response["Cache-Control"])
+
+        with self.assertNumQueries(0):
+            response = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b"")
+            response = client.get(self.url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+            self.assertEqual(response.status_code, 304)
+            response = client.get(self.url, HTTP_IF_NONE_MATCH='"stale"')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["ETag"], etag)
+
+    def test_deletion_invalidates_the_cache(self):
+        """Test that a soft-deleted simulation is no longer served, from the cache or the database, nor cached again"""
+        from django.test import Client
+        from .http_cache import get_payload
+
+        client = Client()
+        etag = client.get(self.url)["ETag"]
+        self.assertIsNotNone(get_payload(self.simulation.simulation_id))
+        response = client.delete(f'/simulation/delete-simulation/?simulation_id={self.simulation.simulation_id}')
+        self.assertEqual(response.status_code, 200)
+
+        for _ in range(2):
+            response = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 404)
+            self.assertIsNone(get_payload(self.simulation.simulation_id))
+
+    def test_unknown_simulation(self):
+        """Test that a missing or malformed id is a 404"""
+        from django.test import Client
+
+        for simulation_id in (self.simulation.simulation_id + 1, "abc"):
+            response = Client().get(f'/simulation/completed-simulation/?simulation_id={simulation_id}')
+            self.assertEqual(response.status_code, 404)
+
+    def test_unchanged_history_page(self):
+        """Test that an unchanged page of the history is a 304 and that a new completion changes it"""
+        from django.test import Client
+
+        client = Client()
+        etag = client.get('/simulation/completed-simulations/')["ETag"]
+        self.assertEqual(client.get('/simulation/completed-simulations/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Simulation.objects.create(simulation_status="completed", junction_config={}, efficiency_score=0.7)
+        self.assertEqual(client.get('/simulation/completed-simulations/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class TestBatch(TestCase):
+    def setUp(self):
+        self.configs = [
+            {"north": {"inbound": 100 * i, "south": 100 * i}, "south": {"inbound": 100, "north": 100}, "numLanes": 2}
+            for i in range(1, 4)
+        ]
+
+    def test_parse_batch(self):
+        """Test that arrays and NDJSON give the same entries and that an invalid entry is named"""
+        from .batch import parse_batch, MAX_BATCH_SIZE
+        from .config import canonicalize_junction_config
+        import io
+        import json
+
+        body = json.dumps([self.configs[0], {"junction_config": self.configs[1], "seed": 7}]).encode()
+        entries = parse_batch(io.BytesIO(body), default_seed="3")
+        self.assertEqual(entries, [(canonicalize_junction_config(self.configs[0]), 3), (canonicalize_junction_config(self.configs[1]), 7)])
+        lines = b"\n".join(json.dumps(entry).encode() for entry in json.loads(body)) + b"\n\n"
+        self.assertEqual(parse_batch(io.BytesIO(lines), ndjson=True, default_seed="3"), entries)
+
+        for body, ndjson, message in (
+            (b'{"north": {}}', False, "array"),
+            (b"[]", False, "empty"),
+            (json.dumps([self.configs[0], {"up": {}}]).encode(), False, "Entry 1"),
+            (json.dumps(self.configs[0]).encode() + b"\n{oops", True, "Entry 1"),
+            (json.dumps([self.configs[0]] * (MAX_BATCH_SIZE + 1)).encode(), False, "at most"),
+        ):
+            with self.assertRaisesRegex(ValueError, message):
+                parse_batch(io.BytesIO(body), ndjson=ndjson)
+
+    def test_start_batch(self):
+        """Test that a batch is inserted in bulk, completes cached entries at once and reports its progress"""
+        from django.db import connection
+        from django.test import Client
+        from django.test.utils import CaptureQueriesContext
+        from .cache import store_result
+        from .config import DEFAULT_SEED
+        import json
+
+        store_result(self.configs[0], DEFAULT_SEED, {"metrics": {"north": {}}, "efficiency_score": 0.9})
+        client = Client()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post('/simulation/start-batch/', data=json.dumps(self.configs), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual((data["queued"], data["cached"]), (2, 1))
+        inserts = [query for query in queries.captured_queries if query["sql"].startswith('INSERT INTO "simulation_simulation"')]
+        self.assertEqual(len(inserts), 1)
+
+        simulations = Simulation.objects.in_bulk(data["simulation_ids"])
+        self.assertEqual([simulations[i].simulation_status for i in data["simulation_ids"]], ["completed", "running", "running"])
+        self.assertTrue(simulations[data["simulation_ids"][0]].run_stats["cache_hit"])
+        self.assertEqual({simulation.batch_id for simulation in simulations.values()}, {data["batch_id"]})
+
+        response = client.get(f'/simulation/batch-status/?batch_id={data["batch_id"]}')
+        self.assertEqual(response.status_code, 200)
+        status = json.loads(response.content)
+        self.assertEqual(status["batch_status"], "running")
+        self.assertEqual(status["counts"], {"completed": 1, "running": 2})
+        self.assertAlmostEqual(status["fraction_done"], 1 / 3)
+        self.assertEqual([simulation["simulation_id"] for simulation in status["simulations"]], data["simulation_ids"])
+
+        Simulation.objects.filter(simulation_id__in=data["simulation_ids"][1:]).update(simulation_status="failed")
+        status = json.loads(client.get(f'/simulation/batch-status/?batch_id={data["batch_id"]}').content)
+        self.assertEqual(status["batch_status"], "completed")
+        self.assertEqual(client.get('/simulation/batch-status/?batch_id=0').status_code, 404)
+
+    def test_invalid_batch_creates_nothing(self):
+        """Test that a batch with an invalid NDJSON line is rejected whole"""
+        from django.test import Client
+        from .models import SimulationBatch
+        import json
+
+        body = json.dumps(self.configs[0]) + "\n" + json.dumps({"north": {"inbound": -1}})
+        response = Client().post('/simulation/start-batch/', data=body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Entry 1", json.loads(response.content)["error_message"])
+        self.assertFalse(SimulationBatch.objects.exists())
+        self.assertFalse(Simulation.objects.exists())
+
+
+class TestRescoring(TestCase):
+    """Tests for vectorized rescoring of stored simulations"""
+
+    def setUp(self):
+        self.junction_config = {
+            "north": {"inbound": 600, "east": 200, "south": 300, "west": 100},
+            "east": {"inbound": 300, "north": 100, "south": 100, "west": 100},
+            "south": {"inbound": 600, "north": 300, "east": 100, "west": 200},
+            "west": {"inbound": 300, "north": 100, "east": 100, "south": 100},
+            "leftTurn": False,
+            "numLanes": 2
+        }
+
+    @staticmethod
+    def uniform_metrics(wait, queue):
+        return {d: {"average_waiting_time": wait, "max_waiting_time": 2 * wait, "max_queue_length": queue} for d in ("north", "east", "south", "west")}
+
+    def test_default_weights_give_the_stored_scores(self):
+        """Test that within-run scoring with the default weights matches calculate_efficiency_score"""
+        from .scoring import score_runs
+
+        metrics = []
+        for seed in range(5):
+            simulation = Simulation(simulation_status="running", junction_config=self.junction_config)
+            metrics.append(SimulationEngine(simulation, mode=SimulationEngine.EVENT_DRIVEN, seed=seed).start()["metrics"])
+        metrics.append({
+            "north": {"average_waiting_time": None, "max_waiting_time": None, "max_queue_length": 0},
+            "east": {"average_waiting_time": 12.5, "max_waiting_time": 40.0, "max_queue_length": 3},
+        })
+
+        scores = score_runs(metrics)
+        self.assertEqual([round(float(score), 1) for score in scores], [SimulationEngine.calculate_efficiency_score(m) for m in metrics])
+        self.assertTrue(all(0 <= score <= 100 for score in scores))
+
+    def test_weights_and_scope(self):
+        """Test that weights are normalized and that history scope compares runs that within-run scope can't tell apart"""
+        from .scoring import score_runs, parse_weights, ACROSS_HISTORY
+
+        self.assertEqual(parse_weights({"average_waiting_time": 2, "max_queue_length": 2}), {"average_waiting_time": 0.5, "max_waiting_time": 0.0, "max_queue_length": 0.5})
+        for weights in ({"throughput": 1}, {"average_waiting_time": -1}, {"max_queue_length": 0}, [0.5, 0.5]):
+            with self.assertRaises(ValueError):
+                parse_weights(weights)
+
+        metrics = [self.uniform_metrics(10.0, 2), self.uniform_metrics(50.0, 2), self.uniform_metrics(30.0, 6)]
+        self.assertEqual(score_runs(metrics).tolist(), [100.0, 100.0, 100.0])
+        self.assertEqual(score_runs(metrics, scope=ACROSS_HISTORY).tolist(), [100.0, 25.0, 37.5])
+        self.assertEqual(score_runs(metrics, {"max_queue_length": 1}, ACROSS_HISTORY).tolist(), [100.0, 100.0, 0.0])
+
+    def test_rescore_endpoint(self):
+        """Test re-ranking stored simulations in one request without changing their stored scores"""
+        from django.test import Client
+        import json
+
+        ids = []
+        for wait, queue in ((50.0, 2), (10.0, 2), (30.0, 6)):
+            simulation = Simulation.objects.create(simulation_status="completed", junction_config=self.junction_config, metrics=self.uniform_metrics(wait, queue), efficiency_score=100.0)
+            ids.append(simulation.simulation_id)
+        Simulation.objects.create(simulation_status="running", junction_config=self.junction_config)
+
+        client = Client()
+        response = client.post('/simulation/rescore-simulations/', data=json.dumps({"scope": "history"}), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(data["count"], 3)
+        self.assertEqual([row["simulation_id"] for row in data["ranking"]], [ids[1], ids[2], ids[0]])
+        self.assertEqual([row["score"] for row in data["ranking"]], [100.0, 37.5, 25.0])
+        self.assertEqual([row["rank"] for row in data["ranking"]], [1, 2, 3])
+        self.assertTrue(all(simulation.efficiency_score == 100.0 for simulation in Simulation.objects.filter(simulation_id__in=ids)))
+
+        body = {"weights": {"max_queue_length": 1}, "scope": "history", "simulation_ids": ids[1:]}
+        data = json.loads(client.post('/simulation/rescore-simulations/', data=json.dumps(body), content_type='application/json').content)
+        self.assertEqual([(row["simulation_id"], row["score"]) for row in data["ranking"]], [(ids[1], 100.0), (ids[2], 0.0)])
+
+        for body in ({"scope": "everything"}, {"weights": {"speed": 1}}, {"simulation_ids": "all"}):
+            response = client.post('/simulation/rescore-simulations/', data=json.dumps(body), content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(client.get('/simulation/rescore-simulations/').status_code, 405)
@@ -0,0 +1,33 @@
+import contextlib
+import time
+
+
+class PhaseTimer:
+    """
+    Wall time spent in the named phases of a run, measured on the monotonic clock.
+    A phase entered more than once adds up, and the phases keep the order in which they first ran.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.phases = {}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started_at)
+
+    def record(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.started_at
+
+    def as_dict(self):
+        """
+        The phases and the time since the timer was created, which also covers the time between phases.
+        """
+        return {"phases": dict(self.phases), "total": self.elapsed()}
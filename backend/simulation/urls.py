@@ -6,9 +6,20 @@ urlpatterns = [
     path('get-csrf-token/', get_csrf_token),
     path('create-simulation/', create_simulation),
     path('start-simulation/', start_simulation),
+    path('start-batch/', start_batch),
+    path('batch-status/', get_batch_status),
     path('check-simulation-status/', check_simulation_status),
     path('completed-simulations/', get_completed_simulations),
     path('completed-simulation/', get_completed_simulation),
+    path('rescore-simulations/', rescore_simulations),
     path('delete-simulation/', delete_simulation),
+    path('simulation-events/', get_simulation_events),
+    path('simulation-progress/', stream_simulation_progress),
     path('test-background-task/', test_background_task),
+    path('start-sweep/', start_sweep),
+    path('start-replications/', start_replications),
+    path('start-network/', start_network),
+    path('start-signal-optimization/', start_signal_optimization),
+    path('study/', get_study),
+    path('metrics/', get_metrics),
 ]
@@ -0,0 +1,213 @@
+from datetime import timedelta
+
+import numpy as np
+
+from .models import Vehicle
+
+# Integer encoding of the four approaches, in the order the warehouse stocks them
+DIRECTIONS = ("north", "east", "south", "west")
+DIRECTION_CODES = {direction: code for code, direction in enumerate(DIRECTIONS)}
+
+# TURNS[incoming][exit] holds Vehicle.TURNING_LEFT, GOING_STRAIGHT or TURNING_RIGHT (0 for a U-turn)
+TURNS = [
+    [Vehicle.relative_dir_map.get((incoming, exit), 0) for exit in DIRECTIONS]
+    for incoming in DIRECTIONS
+]
+TURNS_ARRAY = np.array(TURNS, dtype=np.int8)
+
+
+class SimVehicle:
+    """
+    Lightweight vehicle used inside the engine instead of the Vehicle model.
+
+    Directions are stored as integer codes, the turn type is computed once on creation and
+    arrival/departure are plain float timestamps on a monotonic clock (time.monotonic() for the
+    threaded engine, simulated seconds for the discrete-event engine). Nothing touches the
+    database until to_model() is called when the run is persisted.
+    """
+    __slots__ = ("id", "incoming_dir", "exit_dir", "turn", "incoming_lane", "exit_lane", "arrival_time", "departure_time")
+
+    def __init__(self, id, incoming_dir, exit_dir, incoming_lane, exit_lane):
+        self.id = id
+        self.incoming_dir = incoming_dir
+        self.exit_dir = exit_dir
+        self.turn = TURNS[incoming_dir][exit_dir]
+        self.incoming_lane = incoming_lane
+        self.exit_lane = exit_lane
+        self.arrival_time = None
+        self.departure_time = None
+
+    @property
+    def incoming_direction(self):
+        return DIRECTIONS[self.incoming_dir]
+
+    @property
+    def exit_direction(self):
+        return DIRECTIONS[self.exit_dir]
+
+    @property
+    def waiting_time(self):
+        if self.arrival_time is None or self.departure_time is None:
+            return None
+        return self.departure_time - self.arrival_time
+
+    def to_model(self, simulation, wall_origin, clock_origin=0.0, time_scale=1.0):
+        """
+        Build an unsaved Vehicle row for this vehicle.
+        Args:
+            simulation (Simulation): The simulation the vehicle belongs to.
+            wall_origin (datetime): Wall-clock time corresponding to clock_origin.
+            clock_origin (float): Monotonic timestamp at which the run started.
+            time_scale (float): Real seconds per unit of the monotonic clock, e.g. 1 / SPEED_FACTOR
+                for simulated seconds, so that stored times match what the threaded engine records.
+        """
+        def to_datetime(timestamp):
+            if timestamp is None:
+                return None
+            return wall_origin + timedelta(seconds=(timestamp - clock_origin) * time_scale)
+
+        waiting_time = self.waiting_time
+        return Vehicle(
+            simulation=simulation,
+            incoming_direction=self.incoming_direction,
+            exit_direction=self.exit_direction,
+            incoming_lane=self.incoming_lane,
+            exit_lane=self.exit_lane,
+            arrival_time=to_datetime(self.arrival_time),
+            departure_time=to_datetime(self.departure_time),
+            waiting_time=waiting_time * time_scale if waiting_time is not None else None,
+        )
+
+    def __repr__(self):
+        return f"SimVehicle {self.id} - {self.incoming_direction} lane {self.incoming_lane} to {self.exit_direction} lane {self.exit_lane}"
+
+
+class Fleet:
+    """
+    Struct-of-arrays stock of vehicles for one approach.
+
+    Each vehicle is one index into int8 arrays of direction codes, turn types and lanes, so a fleet
+    costs a handful of bytes per vehicle. SimVehicle objects are only materialized when a vehicle
+    leaves the warehouse with pop(), which walks a cursor instead of shifting a list.
+    """
+
+    def __init__(self, incoming_dir, exit_dir, incoming_lane, exit_lane, first_id=1):
+        self.incoming_dir = incoming_dir
+        self.exit_dir = exit_dir
+        self.turn = TURNS_ARRAY[incoming_dir, exit_dir]
+        self.incoming_lane = incoming_lane
+        self.exit_lane = exit_lane
+        self.first_id = first_id
+        self.size = len(exit_dir)
+        self.cursor = 0
+        self.issued = [] # Vehicles handed out by pop(), in order
+
+    def vehicle(self, index):
+        return SimVehicle(
+            id=self.first_id + index,
+            incoming_dir=int(self.incoming_dir[index]),
+            exit_dir=int(self.exit_dir[index]),
+            incoming_lane=int(self.incoming_lane[index]),
+            exit_lane=int(self.exit_lane[index]),
+        )
+
+    def pop(self):
+        """
+        Remove and return the next vehicle of the fleet.
+        """
+        if self.cursor >= self.size:
+            raise IndexError("pop from an empty fleet")
+        vehicle = self.vehicle(self.cursor)
+        self.cursor += 1
+        self.issued.append(vehicle)
+        return vehicle
+
+    def all_vehicles(self):
+        """
+        Every vehicle of the fleet: the ones already handed out, then the ones still in stock.
+        """
+        return self.issued + [self.vehicle(index) for index in range(self.cursor, self.size)]
+
+    def __len__(self):
+        return self.size - self.cursor
+
+    def __getitem__(self, key):
+        # Indexes are relative to the vehicles still in stock, like the list the warehouse used to hold
+        if isinstance(key, slice):
+            return [self.vehicle(self.cursor + index) for index in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("fleet index out of range")
+        return self.vehicle(self.cursor + key)
+
+    def __iter__(self):
+        for index in range(self.cursor, self.size):
+            yield self.vehicle(index)
+
+
+def generate_fleet(junction_config, incoming_direction, num_vehicle, rng=None, first_id=1):
+    """
+    Generate the shuffled fleet of one approach with vectorized NumPy operations.
+    Args:
+        junction_config (dict): Junction configuration with flow rates, "numLanes" and "leftTurn".
+        incoming_direction (str): The direction from which vehicles are entering the junction.
+        num_vehicle (int): Number of vehicles for an exit flow equal to the inbound flow.
+        rng (np.random.Generator): Source of randomness, a fresh unseeded generator by default.
+        first_id (int): Id given to the first vehicle of the fleet.
+    Returns:
+        Fleet: Vehicles split across exit directions according to the flow rates relative to the inbound flow.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    incoming_flow_rate = junction_config[incoming_direction]["inbound"]
+
+    exit_codes, counts = [], []
+    if incoming_flow_rate != 0:
+        for d, v in junction_config[incoming_direction].items():
+            if d == "inbound": continue # Skip the inbound direction
+            exit_codes.append(DIRECTION_CODES[d])
+            counts.append(round(num_vehicle * (v / incoming_flow_rate))) # Number of vehicles exiting at this direction
+
+    exit_dir = rng.permutation(np.repeat(np.array(exit_codes, dtype=np.int8), counts))
+    return build_fleet(junction_config, incoming_direction, exit_dir, rng, first_id)
+
+
+def draw_fleet(junction_config, incoming_direction, num_vehicle, rng=None, first_id=1):
+    """
+    Generate num_vehicle vehicles of one approach, drawing the exit of each vehicle independently with the
+    probability of its share of the exit flows. Unlike generate_fleet nothing is rounded, so every exit keeps
+    its exact share in expectation however small its flow or the fleet.
+    Returns:
+        Fleet: The vehicles, empty if the approach has no exit flow.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    exits = {d: v for d, v in junction_config[incoming_direction].items() if d != "inbound" and v > 0}
+    total = sum(exits.values())
+    if total <= 0:
+        exit_dir = np.empty(0, dtype=np.int8)
+    else:
+        exit_codes = np.array([DIRECTION_CODES[d] for d in exits], dtype=np.int8)
+        exit_dir = rng.choice(exit_codes, size=num_vehicle, p=np.array(list(exits.values())) / total)
+    return build_fleet(junction_config, incoming_direction, exit_dir, rng, first_id)
+
+
+def build_fleet(junction_config, incoming_direction, exit_dir, rng, first_id=1):
+    """
+    Fleet of one approach given the exit of each vehicle, with lanes assigned by turn type.
+    """
+    lane_count = junction_config["numLanes"]
+    incoming_code = DIRECTION_CODES[incoming_direction]
+    incoming_dir = np.full(len(exit_dir), incoming_code, dtype=np.int8)
+    turn = TURNS_ARRAY[incoming_code, exit_dir]
+
+    # Left turns use the leftmost lane and right turns the rightmost one. Straight traffic keeps
+    # off the left-turn lane when there is one, other vehicles pick any lane.
+    incoming_lane = rng.integers(0, lane_count, size=len(exit_dir), dtype=np.int8)
+    if junction_config["leftTurn"] and lane_count > 1:
+        straight = turn == Vehicle.GOING_STRAIGHT
+        incoming_lane[straight] = rng.integers(1, lane_count, size=int(straight.sum()), dtype=np.int8)
+    incoming_lane[turn == Vehicle.TURNING_LEFT] = 0
+    incoming_lane[turn == Vehicle.TURNING_RIGHT] = lane_count - 1
+    exit_lane = (lane_count - 1 - incoming_lane).astype(np.int8)
+
+    return Fleet(incoming_dir, exit_dir, incoming_lane, exit_lane, first_id)
@@ -1,11 +1,29 @@
 from django.shortcuts import render
-from django.http import HttpResponse, JsonResponse
-from .models import Simulation
-from .serializers import SimulationSerializer
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from .models import Simulation, SimulationStudy, SimulationBatch, Vehicle
+from .serializers import SimulationSerializer, SimulationStudySerializer
 from django.middleware.csrf import get_token
-from .tasks import my_background_task, run_simulation
-from .simulation_engine import SimulationEngine
+from .tasks import my_background_task, run_simulation, run_sweep_study, run_replications_study, run_network_study, run_signal_timing_study
+from .simulation_engine import SimulationEngine, TRAFFIC_LIGHT_CYCLE_TIME
+from .sweep import expand_grid, parse_max_workers
+from .replications import MAX_REPLICATIONS
+from .network import parse_network
+from .signal_timing import parse_optimization
+from .scoring import parse_weights, rank_simulations, WITHIN_RUN, SCOPES
+from .config import canonicalize_junction_config, parse_seed, DEFAULT_SEED
+from .cache import get_cached_result
+from .event_log import filter_events
+from .timing import PhaseTimer
+from . import monitoring
+from . import progress
+from .pagination import cursor_page, parse_page_size, NEWEST
+from . import http_cache
+from .batch import parse_batch, create_batch, dispatch_batch, batch_status, NDJSON_CONTENT_TYPES
+from django.db.models import Count
+from django.core.handlers.asgi import ASGIRequest
+import asyncio
 import json
+import time
 
 def get_csrf_token(request):
     csrf_token = get_token(request)
@@ -23,6 +41,7 @@ def create_simulation(request):
     '''
     This function is called when a POST request is made to the /start-simulation/ endpoint. 
     It creates a new Simulation object in the database with the provided traffic flow parameters and returns a JSON response with the simulation ID and status.
+    The configuration is stored in its canonical form, and the optional seed query parameter fixes the generated vehicles.
     '''
     if request.method == 'POST':
         try:
@@ -35,7 +54,18 @@ def create_simulation(request):
             return JsonResponse(error_message,status=400)
         
         try:
-            simulation = Simulation(simulation_status="Not started", junction_config=data)
+            data = canonicalize_junction_config(data)
+            seed = parse_seed(request.GET.get('seed'))
+        except ValueError as e:
+            error_message = {
+                "Error": "Invalid junction configuration",
+                "simulation_status": "Not started",
+                "error_message": str(e)
+            }
+            return JsonResponse(error_message,status=400)
+
+        try:
+            simulation = Simulation(simulation_status="Not started", junction_config=data, seed=seed)
             simulation.save()
         except Exception as e:
             error_message = {
@@ -49,7 +79,8 @@ def create_simulation(request):
             "message": "Simulation created and saved in the database successfully",
             "simulation_id": simulation.simulation_id,
             "simulation_status": simulation.simulation_status,
-            "junction_config": data
+            "junction_config": data,
+            "seed": seed
         }
 
         return JsonResponse(success_message,status=200)
@@ -60,6 +91,7 @@ def start_simulation(request):
     '''
     This function is called when a POST request is made to the /start-simulation/ endpoint.
     It starts the simulation with the provided simulation_id and returns a JSON response with the simulation status and parameters used.
+    If the same configuration was already simulated with the same seed, the simulation completes at once from the result cache.
     '''
     if request.method != 'POST': 
         return JsonResponse({"Error": "Invalid request method"},status=405)
@@ -77,10 +109,33 @@ def start_simulation(request):
     if simulation.simulation_status == "running" or simulation.simulation_status == "completed":
         return JsonResponse({"Error": "Simulation already running or completed"},status=400)
 
+    seed = simulation.seed if simulation.seed is not None else DEFAULT_SEED
+    timer = PhaseTimer()
+    with timer.phase("cache_lookup"):
+        cached = get_cached_result(simulation.junction_config, seed)
+    if cached is not None:
+        simulation.metrics = cached.metrics
+        simulation.efficiency_score = cached.efficiency_score
+        simulation.run_stats = {**(cached.run_stats or {}), "cache_hit": True}
+        simulation.timings = timer.as_dict()
+        simulation.simulation_status = "completed"
+        simulation.save()
+        monitoring.count_simulations("cached")
+        progress.write_progress(simulation.simulation_id, {"status": progress.COMPLETED, "fraction": 1.0, "efficiency_score": simulation.efficiency_score})
+        success_message = {
+            "message": "Simulation completed from the result cache",
+            "simulation_id": simulation.simulation_id,
+            "simulation_status": "completed",
+            "junction_config": simulation.junction_config,
+            "cached": True
+        }
+        return JsonResponse(success_message,status=200)
+
     try:
-        task = run_simulation.delay(simulation_id)
+        task = run_simulation.delay(simulation_id, enqueued_at=time.time())
         simulation.simulation_status = "running"
         simulation.save()
+        monitoring.count_simulations("queued")
         success_message = {
             "message": "Simulation started and updated successfully",
             "simulation_id": simulation.simulation_id,
@@ -97,6 +152,73 @@ def start_simulation(request):
         
     
 
+def start_batch(request):
+    '''
+    This function is called when a POST request is made to the /start-batch/ endpoint.
+    It creates and starts many simulations at once. The body is a JSON array of junction configurations or, with the
+    application/x-ndjson content type, one configuration per line. An entry may also be {"junction_config": {...}, "seed": 7},
+    entries without a seed use the optional seed query parameter.
+    The simulations are inserted with batched inserts, those already in the result cache complete at once and the others
+    are queued as one Celery group. It returns the batch ID and the simulation IDs in the order of the entries,
+    batch-status/ reports the progress of the whole batch.
+    '''
+    if request.method != 'POST':
+        return JsonResponse({"Error": "Invalid request method"},status=405)
+
+    try:
+        entries = parse_batch(request, request.content_type in NDJSON_CONTENT_TYPES, request.GET.get('seed'))
+    except ValueError as e:
+        error_message = {
+            "Error": "Invalid batch",
+            "simulation_status": "Not started",
+            "error_message": str(e)
+        }
+        return JsonResponse(error_message,status=400)
+
+    batch, simulations = create_batch(entries)
+    pending = [simulation.simulation_id for simulation in simulations if simulation.simulation_status == "running"]
+    try:
+        dispatch_batch(pending)
+    except Exception as e:
+        Simulation.objects.filter(simulation_id__in=pending).update(simulation_status="failed")
+        error_message = {
+            "Error": "Failed to start batch",
+            "batch_id": batch.batch_id,
+            "simulation_status": "failed",
+            "error_message": str(e)
+        }
+        return JsonResponse(error_message,status=500)
+
+    success_message = {
+        "message": "Batch created and started successfully",
+        "batch_id": batch.batch_id,
+        "simulation_ids": [simulation.simulation_id for simulation in simulations],
+        "queued": len(pending),
+        "cached": len(simulations) - len(pending)
+    }
+    return JsonResponse(success_message,status=200)
+
+def get_batch_status(request):
+    '''
+    This function is called when a GET request is made to the /batch-status/ endpoint.
+    It returns the progress of the batch with the provided batch_id: the number of its simulations in each status,
+    the fraction that finished and the status and efficiency score of each simulation.
+    '''
+    if request.method != 'GET':
+        return JsonResponse({"Error": "Invalid request method"},status=405)
+
+    batch_id = request.GET.get('batch_id')
+    try:
+        batch = SimulationBatch.objects.get(batch_id=batch_id)
+    except (SimulationBatch.DoesNotExist, ValueError):
+        error_message = {
+            "Error": f"Batch id {batch_id} not found",
+            "batch_status": "Not found"
+        }
+        return JsonResponse(error_message,status=404)
+
+    return JsonResponse(batch_status(batch),status=200)
+
 def check_simulation_status(request):
     '''
     This function is called when a GET request is made to the /check-simulation-status/ endpoint.
@@ -130,31 +252,196 @@ def check_simulation_status(request):
             return JsonResponse(error_message,status=400)
     return JsonResponse({"Error": "Invalid request method"},status=405)
 
+def stream_simulation_progress(request):
+    '''
+    This function is called when a GET request is made to the /simulation-progress/ endpoint.
+    It streams the progress of the simulation with the provided simulation_id as server-sent events:
+        - "progress" events with the fraction of the warehouse released, the vehicles departed, the queue length of
+          each direction and the light phase, at most once per SIMULATION_PROGRESS["interval"] seconds, or per the
+          slower interval query parameter,
+        - a final "done" event with the simulation status, after which the stream ends.
+    Updates are published by the worker and fanned out to every stream of this process by a single thread,
+    so watching a simulation costs no database query beyond the status read when the stream opens.
+    Served over ASGI, streams wait on the event loop and hold no thread. Served over WSGI, every stream holds a
+    worker thread, so at most SIMULATION_PROGRESS["max_streams"] are open at once and further clients get a 503,
+    upon which the frontend falls back to polling the status.
+    '''
+    if request.method != 'GET':
+        return JsonResponse({"Error": "Invalid request method"},status=405)
+
+    simulation_id = request.GET.get('simulation_id')
+    try:
+        simulation = Simulation.objects.only("simulation_id", "simulation_status", "efficiency_score").get(simulation_id=simulation_id)
+    except (Simulation.DoesNotExist, ValueError):
+        error_message = {
+            "Error": f"Simulation id {simulation_id} not found",
+            "simulation_status": "Not found"
+        }
+        return JsonResponse(error_message,status=404)
+
+    options = progress.progress_settings()
+    try:
+        interval = max(float(request.GET.get('interval', options["interval"])), options["interval"])
+    except ValueError:
+        return JsonResponse({"Error": "The interval must be a number of seconds"},status=400)
+
+    finished = simulation.simulation_status in progress.FINAL_STATUSES
+    done = {"simulation_id": simulation.simulation_id, "status": simulation.simulation_status, "efficiency_score": simulation.efficiency_score}
+
+    async def async_events():
+        if finished:
+            yield progress.format_event("done", done)
+            return
+
+        loop = asyncio.get_running_loop()
+        subscription = progress.HUB.subscribe(simulation.simulation_id, loop)
+        try:
+            deadline = loop.time() + options["timeout"]
+            while loop.time() < deadline:
+                update = await subscription.next(timeout=options["heartbeat"])
+                if update is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                final = update["status"] in progress.FINAL_STATUSES
+                yield progress.format_event("done" if final else "progress", update)
+                if final:
+                    return
+                await asyncio.sleep(interval) # Updates published meanwhile are skipped, only the latest is sent
+        finally:
+            progress.HUB.unsubscribe(subscription)
+
+    def events():
+        if finished:
+            yield progress.format_event("done", done)
+            return
+
+        subscription = progress.HUB.subscribe(simulation.simulation_id)
+        try:
+            deadline = time.monotonic() + options["timeout"]
+            while time.monotonic() < deadline:
+                update = subscription.get(timeout=options["heartbeat"])
+                if update is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                final = update["status"] in progress.FINAL_STATUSES
+                yield progress.format_event("done" if final else "progress", update)
+                if final:
+                    return
+                time.sleep(interval) # Updates published meanwhile are skipped, only the latest is sent
+        finally:
+            progress.HUB.unsubscribe(subscription)
+
+    if isinstance(request, ASGIRequest):
+        stream = async_events()
+    elif finished:
+        stream = events()
+    elif progress.HUB.reserve_stream():
+        stream = progress.ReservedStream(events())
+    else:
+        return JsonResponse({"Error": "Too many progress streams are open, poll the simulation status instead"},status=503)
+
+    response = StreamingHttpResponse(stream, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no" # Don't let a proxy hold the events back
+    return response
+
+SIMULATION_SUMMARY_FIELDS = ("simulation_id", "simulation_status", "efficiency_score", "seed", "created_at")
+
 def get_completed_simulations(request):
     '''
     This function is called when a GET request is made to the /completed-simulations/ endpoint.
-    It retrieves all Simulation objects from the database and returns a JSON response with all simulations.
+    It returns one page of the completed, non-deleted simulations, newest first (or oldest first with order=oldest):
+        {"results": [...], "next_cursor": "..."}
+    Pass next_cursor back as the cursor parameter to get the next page, it is null on the last page.
+    limit sets the page size. Results are summaries without the JSON fields, fields=full returns whole simulations,
+    and completed-simulation/ returns the details of one simulation.
     '''
-    if request.method == 'GET':
-        simulations = Simulation.objects.filter(simulation_status = "completed", is_deleted=False)
-        serializer = SimulationSerializer(simulations, many=True)
-        return JsonResponse(serializer.data,status=200, safe=False)
-    return JsonResponse({"Error": "Invalid request method"},status=405)
+    if request.method != 'GET':
+        return JsonResponse({"Error": "Invalid request method"},status=405)
+
+    full = request.GET.get('fields') == "full"
+    simulations = Simulation.objects.filter(simulation_status="completed", is_deleted=False)
+    if not full:
+        simulations = simulations.values(*SIMULATION_SUMMARY_FIELDS)
+    try:
+        limit = parse_page_size(request.GET.get('limit'))
+        rows, next_cursor = cursor_page(simulations, request.GET.get('cursor'), limit, request.GET.get('order', NEWEST), pk_field="simulation_id")
+    except ValueError as e:
+        return JsonResponse({"Error": "Invalid page request", "error_message": str(e)},status=400)
+
+    results = SimulationSerializer(rows, many=True).data if full else rows
+    # Pages change as simulations complete, so they are not cached, but an unchanged page is answered with a 304
+    return http_cache.conditional_json_response(request, http_cache.render_payload({"results": results, "next_cursor": next_cursor}))
+
+def rescore_simulations(request):
+    '''
+    This function is called when a POST request is made to the /rescore-simulations/ endpoint.
+    It scores the completed, non-deleted simulations again from their stored metrics, without re-running any of them,
+    and ranks them best first. The body optionally holds the "weights" of the scored metrics, the normalization "scope"
+    ("run" to normalize within each simulation like the stored scores, "history" to normalize across every simulation
+    scored) and the "simulation_ids" to score, all completed simulations by default, e.g.
+        {"weights": {"average_waiting_time": 0.2, "max_waiting_time": 0.2, "max_queue_length": 0.6}, "scope": "history"}
+    Stored scores are left as they are.
+    '''
+    if request.method != 'POST':
+        return JsonResponse({"Error": "Invalid request method"},status=405)
+
+    try:
+        data = json.loads(request.body) if request.body else {}
+        weights = parse_weights(data.get("weights"))
+        scope = data.get("scope", WITHIN_RUN)
+        simulation_ids = data.get("simulation_ids")
+        if scope not in SCOPES:
+            raise ValueError(f"The scope must be one of {', '.join(SCOPES)}")
+        if simulation_ids is not None and (not isinstance(simulation_ids, list) or not all(isinstance(i, int) for i in simulation_ids)):
+            raise ValueError("simulation_ids must be a list of integers")
+    except (ValueError, AttributeError) as e:
+        error_message = {
+            "Error": "Invalid rescoring request",
+            "error_message": str(e)
+        }
+        return JsonResponse(error_message,status=400)
+
+    timer = PhaseTimer()
+    simulations = Simulation.objects.filter(simulation_status="completed", is_deleted=False, metrics__isnull=False)
+    if simulation_ids is not None:
+        simulations = simulations.filter(simulation_id__in=simulation_ids)
+    with timer.phase("query"):
+        rows = list(simulations.order_by("simulation_id").values_list("simulation_id", "efficiency_score", "metrics"))
+    with timer.phase("scoring"):
+        ranking = rank_simulations(rows, weights, scope)
+
+    return JsonResponse({"weights": weights, "scope": scope, "count": len(ranking), "ranking": ranking, "timings": timer.as_dict()},status=200)
 
 def get_completed_simulation(request):
+    '''
+    This function is called when a GET request is made to the /completed-simulation/ endpoint.
+    It returns the simulation with the provided simulation_id once it is completed. The results of a completed simulation
+    never change, so the rendered payload is cached until the simulation is deleted, and requests carrying its ETag
+    (If-None-Match) or a later If-Modified-Since are answered with a 304 without touching the database.
+    A deleted simulation is not found, and its payload is never cached again.
+    '''
     if request.method == 'GET':
         simulation_id = request.GET.get('simulation_id')
         try:
-            simulation = Simulation.objects.get(simulation_id=simulation_id)
-        except Simulation.DoesNotExist:
+            # Every spelling of an id must share one cache entry, or deleting would leave the others behind
+            simulation_id = int(simulation_id)
+            payload = http_cache.get_payload(simulation_id)
+            if payload is not None:
+                return http_cache.conditional_json_response(request, payload)
+            simulation = Simulation.objects.get(simulation_id=simulation_id, is_deleted=False)
+        except (Simulation.DoesNotExist, ValueError, TypeError):
             error_message = {
                 "Error": f"Simulation id {simulation_id} not found",
                 "simulation_status": "Not found"
             }
+            return JsonResponse(error_message,status=404)
 
         if simulation.simulation_status == "completed":
             serializer = SimulationSerializer(simulation)
-            return JsonResponse(serializer.data,status=200)
+            payload = http_cache.render_payload(serializer.data, simulation.updated_at or simulation.created_at)
+            http_cache.store_payload(simulation.simulation_id, payload)
+            return http_cache.conditional_json_response(request, payload)
         else:
             error_message = {
                 "Error": f"Simulation id {simulation_id} is not completed",
@@ -164,10 +451,60 @@ def get_completed_simulation(request):
     else:
         return JsonResponse({"Error": "Invalid request method"},status=405)
 
+def get_simulation_events(request):
+    '''
+    This function is called when a GET request is made to the /simulation-events/ endpoint.
+    It returns the most recent entries of the engine's event log for the simulation with the provided simulation_id,
+    optionally filtered by minimum level (e.g. level=WARNING), category (e.g. category=engine) and limited in number.
+    '''
+    if request.method != 'GET':
+        return JsonResponse({"Error": "Invalid request method"},status=405)
+
+    simulation_id = request.GET.get('simulation_id')
+    try:
+        simulation = Simulation.objects.only("simulation_id", "events").get(simulation_id=simulation_id)
+    except (Simulation.DoesNotExist, ValueError):
+        error_message = {
+            "Error": f"Simulation id {simulation_id} not found",
+            "simulation_status": "Not found"
+        }
+        return JsonResponse(error_message,status=404)
+
+    try:
+        events = filter_events(simulation.events or [], request.GET.get('level'), request.GET.get('category'))
+        limit = int(request.GET.get('limit', 0))
+    except ValueError as e:
+        return JsonResponse({"Error": "Invalid filter", "error_message": str(e)},status=400)
+    if limit > 0:
+        events = events[-limit:]
+
+    return JsonResponse({"simulation_id": simulation.simulation_id, "events": events},status=200)
+
+def get_metrics(request):
+    '''
+    This function is called when a GET request is made to the /metrics/ endpoint.
+    It returns the metrics of the Django process and of every Celery worker of the host in the Prometheus text format,
+    together with the number of simulations in each status, read from the database.
+    '''
+    if request.method != 'GET':
+        return JsonResponse({"Error": "Invalid request method"},status=405)
+
+    families = monitoring.collect()
+    statuses = Simulation.objects.filter(is_deleted=False).values("simulation_status").annotate(count=Count("pk"))
+    families["traffic_sim_simulations"] = monitoring.gauge_family(
+        "Stored simulations in each status.", ["status"],
+        {(row["simulation_status"],): row["count"] for row in statuses},
+    )
+    families["traffic_sim_simulations_queued"] = monitoring.gauge_family(
+        "Simulations waiting in the Celery queue for a worker.", [], {(): monitoring.queued_simulations(families)},
+    )
+    return HttpResponse(monitoring.exposition(families), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 def delete_simulation(request):
     '''
     This function is called when a DELETE request is made to the /delete-simulation/ endpoint.
     It deletes the Simulation object with the provided simulation_id from the database and returns a JSON response with the status.
+    The Simulation row is only flagged as deleted, but the vehicles a run persisted for inspection are removed.
     '''
     if request.method == 'DELETE':
         simulation_id = request.GET.get('simulation_id')
@@ -176,6 +513,8 @@ def delete_simulation(request):
                 simulation = Simulation.objects.get(simulation_id=simulation_id)
                 simulation.is_deleted = True
                 simulation.save()
+                Vehicle.objects.filter(simulation_id=simulation.simulation_id).delete()
+                http_cache.invalidate_payload(simulation.simulation_id)
                 success_message = {
                     "message": f"Simulation id {simulation_id} deleted successfully",
                     "simulation_status": "Deleted"
@@ -194,3 +533,200 @@ def delete_simulation(request):
             }
             return JsonResponse(error_message,status=400)
     return JsonResponse({"Error": "Invalid request method"},status=405)
+
+
+def launch_study(kind, parameters, task, **details):
+    '''
+    Create a study of the given kind and hand it to its background task.
+    Extra details are added to the success message.
+    '''
+    study = SimulationStudy.objects.create(kind=kind, study_status="running", parameters=parameters)
+    try:
+        task.delay(study.study_id)
+    except Exception as e:
+        study.study_status = "failed"
+        study.save()
+        error_message = {
+            "Error": f"Failed to start {kind} study",
+            "study_status": "failed",
+            "error_message": str(e)
+        }
+        return JsonResponse(error_message,status=500)
+
+    success_message = {
+        "message": f"{kind.capitalize()} study started successfully",
+        "study_id": study.study_id,
+        "study_status": study.study_status,
+        **details
+    }
+    return JsonResponse(success_message,status=200)
+
+def start_sweep(request):
+    '''
+    This function is called when a POST request is made to the /start-sweep/ endpoint.
+    The body holds a base "junction_config", the swept "ranges" and optionally the "seed" of every point, e.g.
+        {"junction_config": {...}, "ranges": {"north.inbound": [300, 600], "numLanes": {"start": 1, "stop": 5}, "cycleTime": [2, 3]}}
+    The grid is validated, a study is created and its points are simulated in the background on a process pool.
+    '''
+    if request.method != 'POST':
+        return JsonResponse({"Error": "Invalid request method"},status=405)
+
+    try:
+        data = json.loads(request.body)
+        junction_config = data["junction_config"]
+        ranges = data["ranges"]
+    except (ValueError, KeyError, TypeError):
+        error_message = {
+            "Error": "Invalid JSON format, expected a junction_config and ranges",
+            "study_status": "Not started"
+        }
+        return JsonResponse(error_message,status=400)
+
+    try:
+        points = expand_grid(junction_config, ranges, data.get("seed"))
+        parse_max_workers(data.get("max_workers"))
+    except (ValueError, TypeError) as e:
+        error_message = {
+            "Error": "Invalid sweep",
+            "study_status": "Not started",
+            "error_message": str(e)
+        }
+        return JsonResponse(error_message,status=400)
+
+    return launch_study(SimulationStudy.SWEEP, data, run_sweep_study, points=len(points))
+
+def start_replications(request):
+    '''
+    This function is called when a POST request is made to the /start-replications/ endpoint.
+    The body holds the "junction_config" to replicate, the number of "replications" and optionally a "seed"
+    and a "cycleTime". The replications run in the background on a process pool and the study reports the mean
+    and 95% confidence interval of every metric and of the efficiency score.
+    '''
+    if request.method != 'POST':
+        return JsonResponse({"Error": "Invalid request method"},status=405)
+
+    try:
+        data = json.loads(request.body)
+        junction_config = data["junction_config"]
+        replications = data.get("replications", 10)
+        seed = data.get("seed")
+        cycle_time = data.get("cycleTime", TRAFFIC_LIGHT_CYCLE_TIME)
+    except (ValueError, KeyError, TypeError, AttributeError):
+        error_message = {
+            "Error": "Invalid JSON format, expected a junction_config",
+            "study_status": "Not started"
+        }
+        return JsonResponse(error_message,status=400)
+
+    if not isinstance(junction_config, dict) or not isinstance(replications, int) or not 2 <= replications <= MAX_REPLICATIONS:
+        error_message = {
+            "Error": f"Expected a junction_config and between 2 and {MAX_REPLICATIONS} replications",
+            "study_status": "Not started"
+        }
+        return JsonResponse(error_message,status=400)
+    if (seed is not None and (not isinstance(seed, int) or seed < 0)) or not isinstance(cycle_time, (int, float)) or cycle_time <= 0:
+        error_message = {
+            "Error": "The seed must be a non-negative integer and the cycleTime a positive number",
+            "study_status": "Not started"
+        }
+        return JsonResponse(error_message,status=400)
+    try:
+        data["junction_config"] = canonicalize_junction_config(junction_config)
+        parse_max_workers(data.get("max_workers"))
+    except ValueError as e:
+        error_message = {
+            "Error": "Invalid replications",
+            "study_status": "Not started",
+            "error_message": str(e)
+        }
+        return JsonResponse(error_message,status=400)
+
+    data["replications"] = replications
+    return launch_study(SimulationStudy.REPLICATIONS, data, run_replications_study, replications=replications)
+
+def start_network(request):
+    '''
+    This function is called when a POST request is made to the /start-network/ endpoint.
+    The body holds the "junctions" of a road network by name, the "links" that carry the vehicles leaving one junction
+    to an approach of another after a travel delay, and optionally the simulated "duration", the "cycleTime" and a "seed", e.g.
+        {"junctions": {"A": {...}, "B": {...}}, "links": [{"from": "A", "exit": "east", "to": "B", "approach": "west", "delay": 30}]}
+    The network is validated, a study is created and its junctions are simulated in the background, partitioned across
+    processes. The study reports the metrics of every junction and network-wide metrics such as the time spent in the network.
+    '''
+    if request.method != 'POST':
+        return JsonResponse({"Error": "Invalid request method"},status=405)
+
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        error_message = {
+            "Error": "Invalid JSON format",
+            "study_status": "Not started"
+        }
+        return JsonResponse(error_message,status=400)
+
+    try:
+        network = parse_network(data)
+    except ValueError as e:
+        error_message = {
+            "Error": "Invalid network",
+            "study_status": "Not started",
+            "error_message": str(e)
+        }
+        return JsonResponse(error_message,status=400)
+
+    return launch_study(SimulationStudy.NETWORK, network, run_network_study, junctions=len(network["junctions"]), links=len(network["links"]))
+
+def start_signal_optimization(request):
+    '''
+    This function is called when a POST request is made to the /start-signal-optimization/ endpoint.
+    The body holds the "junction_config" to time the lights for and optionally the "cycleRange" in simulated seconds,
+    the "splitRange" of the share of the cycle for which north-south is green, the "replications" per plan,
+    the "maxEvaluations" and a "seed", e.g.
+        {"junction_config": {...}, "cycleRange": [40, 240], "splitRange": [0.2, 0.8], "replications": 3, "maxEvaluations": 30}
+    The search runs in the background on a process pool and the study reports the best plan and every plan evaluated.
+    '''
+    if request.method != 'POST':
+        return JsonResponse({"Error": "Invalid request method"},status=405)
+
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        error_message = {
+            "Error": "Invalid JSON format",
+            "study_status": "Not started"
+        }
+        return JsonResponse(error_message,status=400)
+
+    try:
+        parameters = parse_optimization(data)
+    except ValueError as e:
+        error_message = {
+            "Error": "Invalid signal timing search",
+            "study_status": "Not started",
+            "error_message": str(e)
+        }
+        return JsonResponse(error_message,status=400)
+
+    return launch_study(SimulationStudy.SIGNAL_TIMING, parameters, run_signal_timing_study, max_evaluations=parameters["maxEvaluations"])
+
+def get_study(request):
+    '''
+    This function is called when a GET request is made to the /study/ endpoint.
+    It returns the status of the study with the provided study_id and, once completed, its results.
+    '''
+    if request.method != 'GET':
+        return JsonResponse({"Error": "Invalid request method"},status=405)
+
+    study_id = request.GET.get('study_id')
+    try:
+        study = SimulationStudy.objects.get(study_id=study_id)
+    except (SimulationStudy.DoesNotExist, ValueError):
+        error_message = {
+            "Error": f"Study id {study_id} not found",
+            "study_status": "Not found"
+        }
+        return JsonResponse(error_message,status=404)
+
+    serializer = SimulationStudySerializer(study)
+    return JsonResponse(serializer.data,status=200)
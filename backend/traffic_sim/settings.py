@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from pathlib import Path
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -32,6 +33,41 @@ ALLOWED_HOSTS = [NGROK_URL, '127.0.0.1', 'localhost', 'localhost:5173']
 # Celery settings
 CELERY_BROKER_URL = "sqla+sqlite:///celerydb.sqlite"
 
+# Simulation settings
+SIMULATION_RESULT_CACHE_SIZE = 1000 # Cached results kept, the least recently used ones are evicted first
+SIMULATION_EVENT_LOG = {
+    "level": "INFO", # DEBUG also records every vehicle, light change and red-light queue
+    "capacity": 1000, # Most recent events kept per simulation
+    "file": None, # Also write events to this file ("-" for stdout), nothing is printed by default
+}
+SIMULATION_METRICS = {
+    "directory": Path(tempfile.gettempdir()) / "traffic_sim_metrics", # Django and the Celery workers of this host write their metrics here
+    "flush_interval": 1.0, # Seconds between two snapshots of each process's metrics
+}
+SIMULATION_PROGRESS = {
+    "directory": Path(tempfile.gettempdir()) / "traffic_sim_progress", # Workers publish progress here for the progress streams
+    "interval": 0.5, # Shortest time in seconds between two progress updates of a simulation
+    "heartbeat": 15, # Seconds between keep-alive comments of an idle stream
+    "timeout": 600, # Longest time in seconds a progress stream stays open
+    "max_streams": 32, # Most progress streams a WSGI process serves at once, streams served over ASGI are not limited
+}
+
+# Caches
+# Completed simulations are rendered once and kept in simulation_payloads until they are deleted.
+# When several Django processes serve requests, point it at a shared backend (e.g. Redis or Memcached)
+# so that a deletion invalidates the payload in every process.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "simulation_payloads": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "simulation-payloads",
+        "TIMEOUT": None,
+        "OPTIONS": {"MAX_ENTRIES": 1000},
+    },
+}
+
 # Application definition
 
 INSTALLED_APPS = [
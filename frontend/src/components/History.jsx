@@ -13,17 +13,29 @@ const Historynew = () => {
     const navigate = useNavigate();
     const [simulations, setSimulations] = useState([]);
     const [current, setCurrent] = useState(null);
+    const [nextCursor, setNextCursor] = useState(null);
     const [isSortMenuOpen, setIsSortMenuOpen] = useState(false);
 
-    // removes all simulation data from database
-    const clearHistory = () => {
+    // removes all simulation data from database, including the pages that were not loaded yet
+    const clearHistory = async () => {
         try {
+            console.log(`Fetching every page of completed simulations to clear the history...`);
+            const ids = [];
+            let cursor = null;
+            do {
+                const response = await axios.get(`http://127.0.0.1:8000/simulation/completed-simulations/`, {
+                    params: cursor ? { cursor, limit: 200 } : { limit: 200 }
+                })
+                ids.push(...response.data.results.map((simulation) => simulation.simulation_id));
+                cursor = response.data.next_cursor;
+            } while (cursor);
+
             console.log(`Sending multiple DELETE requests to clear history of all simulations...`);
-            simulations.forEach(async (simulation) => {
-                const response = await axios.delete(`http://127.0.0.1:8000/simulation/delete-simulation/?simulation_id=${simulation.simulation_id}`)
-                // console.log("Clear History Response:",response);
-            })
+            await Promise.all(ids.map((id) =>
+                axios.delete(`http://127.0.0.1:8000/simulation/delete-simulation/?simulation_id=${id}`)
+            ));
             setSimulations([]);
+            setNextCursor(null);
             setCurrent(null);
         } catch (error) {
             console.error(error);
@@ -59,15 +71,29 @@ const Historynew = () => {
         setIsSortMenuOpen(false);
     }
 
-    useEffect(() => {
-        const getData = async () => {
-            console.log("Sending a GET request to fetch all completed simulations from the database...")
-            const response = await axios.get(`http://127.0.0.1:8000/simulation/completed-simulations/`)
-            console.log("All completed simulations:", response);
-            setSimulations(response.data);
+    // fetches the next page of completed simulations, the list only holds their summaries
+    const loadSimulations = async (cursor = null) => {
+        console.log("Sending a GET request to fetch a page of completed simulations from the database...")
+        const response = await axios.get(`http://127.0.0.1:8000/simulation/completed-simulations/`, {
+            params: cursor ? { cursor } : {}
+        })
+        console.log("Completed simulations page:", response);
+        setSimulations((loaded) => cursor ? [...loaded, ...response.data.results] : response.data.results);
+        setNextCursor(response.data.next_cursor);
+    }
+
+    // fetches the metrics and configuration of the selected simulation
+    const selectSimulation = async (id) => {
+        try {
+            const response = await axios.get(`http://127.0.0.1:8000/simulation/completed-simulation/?simulation_id=${id}`)
+            setCurrent(response.data);
+        } catch (error) {
+            console.error(error);
         }
+    }
 
-        getData();
+    useEffect(() => {
+        loadSimulations();
     }, [])
 
   return (
@@ -106,11 +132,16 @@ const Historynew = () => {
                 {simulations.length > 0 ? (
                     <ul className="max-h-[calc(70vh-40px)]">
                         {simulations.map((sim, index) => (
-                            <li key={index} className="flex justify-between items-center p-3 my-2 hover:bg-gray-100 rounded-lg cursor-pointer" onClick={() => setCurrent(sim)}>
+                            <li key={index} className="flex justify-between items-center p-3 my-2 hover:bg-gray-100 rounded-lg cursor-pointer" onClick={() => selectSimulation(sim.simulation_id)}>
                                 <p className="text-lg">Simulation {sim.simulation_id}</p>
-                                <FaDeleteLeft onClick={() => deleteSimulation(sim.simulation_id)} className="w-6 h-6 cursor-pointer"/>
+                                <FaDeleteLeft onClick={(e) => { e.stopPropagation(); deleteSimulation(sim.simulation_id); }} className="w-6 h-6 cursor-pointer"/>
                             </li>
                         ))}
+                        {nextCursor && (
+                            <li className="p-3 my-2 text-center hover:bg-gray-100 rounded-lg cursor-pointer" onClick={() => loadSimulations(nextCursor)}>
+                                <p className="text-lg">Load more</p>
+                            </li>
+                        )}
                     </ul>
                 ) : (
                     <p>No simulations found.</p>
@@ -162,6 +193,7 @@ const Historynew = () => {
                                     <li key={direction}>
                                         <p className="text-lg font-bold capitalize">{direction}</p>
                                         {Object.entries(values).map(([metric, value]) => {
+                                            if(value && typeof value === "object") return null // Per-lane breakdown
                                             let word = ""
                                             let val = String(Math.round(value * 100) / 100)
                                             if(metric === "average_waiting_time"){
@@ -170,6 +202,15 @@ const Historynew = () => {
                                             } else if(metric === "max_waiting_time"){
                                                 word = "Maximum Waiting Time"
                                                 val += " s"
+                                            } else if(metric === "average_queue_length"){
+                                                word = "Average Queue Length"
+                                                val += " cars"
+                                            } else if(metric === "vehicles_crossed"){
+                                                word = "Vehicles Crossed"
+                                                val += " cars"
+                                            } else if(metric === "throughput"){
+                                                word = "Throughput"
+                                                val += " vph"
                                             } else{
                                                 word = "Maximum Queue Length"
                                                 val += " cars"
@@ -16,6 +16,7 @@ const Home = ({ handleSimId }) => {
   const [globalLeftTurn, setGlobalLeftTurn] = useState(false);
   const [globalLanes, setGlobalLanes] = useState(2);
   const [status, setStatus] = useState("Not started");
+  const [progress, setProgress] = useState(null);
 
   // Callback triggered when simulation starts/completes
   const handleResults = (data) => {
@@ -25,48 +26,84 @@ const Home = ({ handleSimId }) => {
 
   useEffect(() => {
     let interval;
+    let source;
     if (simulationId) {
-      console.log("Starting polling for simulationId:", simulationId);
-      // Start polling the simulation status every 2 seconds
-      interval = setInterval(() => {
+      // When completed, fetch the results
+      const fetchResults = () => {
+        console.log("Sending a GET request to retrieve simulation results...")
         axios
           .get(
-            `http://127.0.0.1:8000/simulation/check-simulation-status/?simulation_id=${simulationId}`
+            `http://127.0.0.1:8000/simulation/completed-simulation/?simulation_id=${simulationId}`
           )
-          .then((response) => {
-            console.log("Status check response:", response.data);
-            if (response.data.simulation_status === "completed") {
-              clearInterval(interval);
-              // When completed, fetch the results
-              console.log("Sending a GET request to retrieve simulation results...")
-              axios
-                .get(
-                  `http://127.0.0.1:8000/simulation/completed-simulation/?simulation_id=${simulationId}`
-                )
-                .then((completedResponse) => {
-                  console.log("Simulation data received:", completedResponse.data);
-                  setSimulationData(completedResponse.data);
-                  setShowResults(true);
-                })
-                .catch((error) => {
-                  console.error("Error fetching completed simulation data:", error);
-                  setError(
-                    `Failed to get simulation results: ${error.response?.status || error.message}`
-                  );
-                  // Even if this call fails, we should show something to the user
-                  setShowResults(true);
-                  setStartAnimation(false);
-                });
-            }
+          .then((completedResponse) => {
+            console.log("Simulation data received:", completedResponse.data);
+            setSimulationData(completedResponse.data);
+            setShowResults(true);
           })
           .catch((error) => {
-            console.error("Error checking simulation status:", error);
-            setError("Error checking simulation status");
+            console.error("Error fetching completed simulation data:", error);
+            setError(
+              `Failed to get simulation results: ${error.response?.status || error.message}`
+            );
+            // Even if this call fails, we should show something to the user
+            setShowResults(true);
+            setStartAnimation(false);
           });
-      }, 2000);
+      };
+
+      const startPolling = () => {
+        console.log("Starting polling for simulationId:", simulationId);
+        // Poll the simulation status every 2 seconds
+        interval = setInterval(() => {
+          axios
+            .get(
+              `http://127.0.0.1:8000/simulation/check-simulation-status/?simulation_id=${simulationId}`
+            )
+            .then((response) => {
+              console.log("Status check response:", response.data);
+              if (response.data.simulation_status === "completed") {
+                clearInterval(interval);
+                fetchResults();
+              }
+            })
+            .catch((error) => {
+              console.error("Error checking simulation status:", error);
+              setError("Error checking simulation status");
+            });
+        }, 2000);
+      };
+
+      if (window.EventSource) {
+        // The server pushes progress while the simulation runs, polling is only a fallback
+        source = new EventSource(
+          `http://127.0.0.1:8000/simulation/simulation-progress/?simulation_id=${simulationId}`
+        );
+        source.addEventListener("progress", (event) => {
+          setProgress(JSON.parse(event.data));
+        });
+        source.addEventListener("done", (event) => {
+          source.close();
+          const update = JSON.parse(event.data);
+          setProgress(update);
+          if (update.status === "completed") {
+            fetchResults();
+          } else {
+            setError(`Simulation ${update.status}`);
+            setShowResults(true);
+            setStartAnimation(false);
+          }
+        });
+        source.onerror = () => {
+          source.close();
+          startPolling();
+        };
+      } else {
+        startPolling();
+      }
     }
     return () => {
       if (interval) clearInterval(interval);
+      if (source) source.close();
     };
   }, [simulationId]);
 
@@ -94,6 +131,7 @@ const Home = ({ handleSimId }) => {
     setShowResults(false);
     setSimulationData(null);
     setSimulationId(null);
+    setProgress(null);
     setError(null);
   };
 
@@ -101,6 +139,11 @@ const Home = ({ handleSimId }) => {
     <div className="bg-gray-100 h-screen grid grid-cols-3 overflow-y-hidden">
       <Sidebar setStartAnimation={setStartAnimation} handleSimId={handleSimId} handleResults={handleResults} setJunctionConfig={setJunctionConfig} setGlobalLeftTurn={setGlobalLeftTurn} setGlobalLanes={setGlobalLanes} setStatus={setStatus}/>
       <Simulation startAnimation={startAnimation} junctionConfig={junctionConfig} globalLeftTurn={globalLeftTurn} globalLanes={globalLanes} status={status}/>
+    {progress && progress.status === "running" && (
+      <div className="fixed bottom-4 right-4 bg-white px-4 py-2 rounded shadow text-sm">
+        Simulating... {Math.round(progress.fraction * 100)}% ({progress.vehicles_departed} vehicles crossed, {progress.light_phase} green)
+      </div>
+    )}
     {showResults && (
     <dialog
         open
@@ -157,6 +200,7 @@ const Home = ({ handleSimId }) => {
                       <li key={direction}>
                           <p className="text-lg font-bold capitalize">{direction}</p>
                           {Object.entries(values).map(([metric, value]) => {
+                              if(value && typeof value === "object") return null // Per-lane breakdown
                               let word = ""
                               let val = String(Math.round(value * 100) / 100)
                               if(metric === "average_waiting_time"){
@@ -165,6 +209,15 @@ const Home = ({ handleSimId }) => {
                               } else if(metric === "max_waiting_time"){
                                   word = "Maximum Waiting Time"
                                   val += " s"
+                              } else if(metric === "average_queue_length"){
+                                  word = "Average Queue Length"
+                                  val += " cars"
+                              } else if(metric === "vehicles_crossed"){
+                                  word = "Vehicles Crossed"
+                                  val += " cars"
+                              } else if(metric === "throughput"){
+                                  word = "Throughput"
+                                  val += " vph"
                               } else{
                                   word = "Maximum Queue Length"
                                   val += " cars"